@@ -99,6 +99,7 @@ _project_list_query()
 
 # can import this file once we've loaded relevant global variables.
 import app_callbacks
+import cache_warming
 
 # CREATE APP OBJECT
 load_figure_template(["sandstone", "minty", "slate"])
@@ -3,12 +3,13 @@ from dash.dependencies import Input, Output, State
 from app import repo_dict, org_dict, all_entries, augur_db
 import dash
 import logging
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
 from queries.issues_query import issues_query as iq
 from queries.commits_query import commits_query as cq
 from queries.contributors_query import contributors_query as cnq
 from queries.prs_query import prs_query as prq
 import time
+import uuid
 from celery.result import AsyncResult
 
 # list of queries to be run
@@ -115,6 +116,9 @@ def update_output(n_clicks, value):
 
         selections = str(value)
 
+        # count the search towards the selections kept warm, see cache_warming.py
+        cm().record_usage(value)
+
         # return the string that we want and return the list of the id's that we need for the other callback.
         logging.debug("SEARCHBAR_ORG_REPO_PARSING - END")
         logging.debug("=========================================================")
@@ -161,8 +165,9 @@ def wait_queries(job_ids):
     # default 'result_expires' for celery config is 86400 seconds.
     # so we don't have to check if the jobs exist. if this tasks
     # is enqueued 24 hours after the query-worker tasks finish
-    # then we have a big problem. However, we should 'forget' all
-    # results before we exit.
+    # then we have a big problem. Results aren't 'forgotten' here
+    # because other sessions may be attached to the same jobs,
+    # see 'run_queries'; they expire on their own.
 
     while True:
         logging.info([j.status for j in jobs])
@@ -170,28 +175,10 @@ def wait_queries(job_ids):
         # jobs are either all ready
         if all(j.successful() for j in jobs):
             logging.info([j.status for j in jobs])
-            jobs = [j.forget() for j in jobs]
             return "Data Ready", "success"
 
         # or one of them has failed
         if any(j.failed() for j in jobs):
-
-            # if a job fails, we need to wait for the others to finish before
-            # we can 'forget' them. otherwise to-be-successful jobs will always
-            # be forgotten if one fails.
-
-            # tasks need to have either failed or succeeded before being forgotten.
-            while True:
-                num_succeeded = [j.successful() for j in jobs].count(True)
-                num_failed = [j.failed() for j in jobs].count(True)
-                num_total = num_failed + num_succeeded
-
-                if num_total == len(jobs):
-                    break
-
-                time.sleep(4.0)
-
-            jobs = [j.forget() for j in jobs]
             return "Data Incomplete- Retry", "danger"
 
         # pause to let something change
@@ -208,8 +195,14 @@ def run_queries(repos):
     instance for input Repos; caches results in redis per
     (query_function,repo) pair.
 
+    Repos that another session has already enqueued a job for
+    aren't queried again- this session attaches to that job instead.
+
     Args:
         repos ([int]): repositories we collect data for.
+
+    Returns:
+        [str]: ids of the jobs the data is waited on from.
     """
 
     # cache manager object
@@ -223,13 +216,40 @@ def run_queries(repos):
 
     for f in funcs:
 
-        # only download repos that aren't currently in cache
-        not_ready = [r for r in repos if cache.exists(f, r) != 1]
-
-        # add job to queue
-        j = f.apply_async(args=(augur_db.package_config(), not_ready), queue="data")
-
-        # add job promise to local promise list
-        jobs.append(j)
-
-    return [j.id for j in jobs]
+        # only download repos that aren't currently in cache,
+        # checked in a single round trip
+        not_ready = cache.missing(f, repos)
+
+        # repos spilled to disk are restored rather than re-queried
+        promoted = cache.promote(f, not_ready)
+        not_ready = [r for r in not_ready if r not in promoted]
+
+        # mark the work as in flight under a new job id, learning which
+        # repos are already being downloaded by other sessions' jobs.
+        job_id = str(uuid.uuid4())
+        claimed, pending = cache.claim(f, not_ready, job_id)
+
+        # jobs that failed leave their markers behind until the lease
+        # expires; reclaim their repos now instead.
+        for p_id in set(pending.values()):
+            if AsyncResult(p_id).failed():
+                failed = [r for r, o in pending.items() if o == p_id]
+                cache.release(f, failed, job_id=p_id)
+                reclaimed, _ = cache.claim(f, failed, job_id)
+                claimed += reclaimed
+                pending = {r: o for r, o in pending.items() if o != p_id}
+
+        # add job to queue if there's work for it
+        if claimed:
+            try:
+                f.apply_async(args=(augur_db.package_config(), claimed), queue="data", task_id=job_id)
+            except Exception:
+                # no job will remove the markers; free the repos for the next session.
+                cache.release(f, claimed, job_id=job_id)
+                raise
+            jobs.append(job_id)
+
+        # attach to in-flight jobs
+        jobs += [p_id for p_id in set(pending.values()) if p_id not in jobs]
+
+    return jobs
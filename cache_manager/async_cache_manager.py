@@ -0,0 +1,436 @@
+"""
+    asyncio counterpart of CacheManager.
+
+    AsyncCacheManager reads the same cache as CacheManager, on redis.asyncio,
+    so async request handlers and background jobs can fetch many datasets
+    concurrently on one event loop rather than blocking a thread per request:
+
+        cache = AsyncCacheManager()
+        commits, issues = await asyncio.gather(
+            cache.grabm(commits_query, repos),
+            cache.grabm(issues_query, repos),
+        )
+
+    Keys, versions, serialization, metrics and the in-process cache of frames
+    are CacheManager's: a CacheManager derives them, and is only used for I/O
+    to promote datasets from the disk tier, on a thread. Decoding runs off the
+    event loop too. Writes stay with the query workers' CacheManager.
+"""
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import weakref
+from redis.asyncio import StrictRedis
+from redis.asyncio.cluster import RedisCluster
+from redis.exceptions import NoScriptError
+from cache_manager import compression
+from cache_manager import partitions
+from cache_manager import retention
+from cache_manager import cache_manager as cm_sync
+from cache_manager.cache_manager import CacheManager, _metrics, _disk_tier
+
+# clients shared by all AsyncCacheManager objects of an event loop.
+# connections can't be shared between loops.
+_clients = weakref.WeakKeyDictionary()
+
+_CHECK_AND_FETCH_SHA = hashlib.sha1(cm_sync._CHECK_AND_FETCH.encode("utf-8")).hexdigest()
+
+
+async def _load_scripts(client):
+    await client.script_load(cm_sync._CHECK_AND_FETCH)
+    await client.script_load(cm_sync._GDS_PRIORITIZE)
+    await client.script_load(cm_sync._RELEASE_HELD)
+    await client.script_load(cm_sync._RESIZE)
+    await client.script_load(cm_sync._EVICT)
+
+
+async def _get_client():
+    """
+    Redis client of the running event loop: a cluster client if
+    CACHE_REDIS_CLUSTER is set. Scripts are loaded when it's created, so
+    CacheManager's helpers can queue them by hash on its pipelines.
+
+    Returns:
+    --------
+        redis.asyncio.StrictRedis | redis.asyncio.cluster.RedisCluster: client.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        if cm_sync.REDIS_CLUSTER:
+            client = RedisCluster(**cm_sync._connection_kwargs())
+        else:
+            client = StrictRedis(**cm_sync._connection_kwargs())
+        await _load_scripts(client)
+        _clients[loop] = client
+    return client
+
+
+class AsyncCacheManager:
+    """
+    Reads the Redis cache from asyncio code, see CacheManager.
+
+    Attributes:
+    -----------
+        _keys : (private) CacheManager
+            Derives keys and deserializes values, sharing the process' frames.
+
+    Methods:
+    --------
+        getm(func, [repo]):
+            Returns values at keys [hash(func, repo)], None if Nil.
+
+        existsm(func, [repo]):
+            Returns number of repos cached.
+
+        grabm(func, [repo], start, end):
+            Returns deserialized DataFrame of all repos, None if any missing.
+
+        grabm_partial(func, [repo], start, end):
+            Returns DataFrame of the repos available and the list of repos missing.
+
+        wait_for(func, [repo], timeout):
+            Waits until all repos are available, then returns grabm result.
+    """
+
+    def __init__(self, codec="default", compression_threshold=None):
+        """
+        Args:
+        -----
+            codec (str | None): see CacheManager.
+            compression_threshold (int | None): see CacheManager.
+        """
+        self._keys = CacheManager(codec=codec, compression_threshold=compression_threshold)
+
+    async def _execute(self, build):
+        """
+        (private)
+        Runs the commands queued by 'build' on a pipeline, reloading the
+        scripts and running them again if Redis lost them, e.g. on a restart.
+
+        Args:
+        -----
+            build (function): Pipeline -> None, queues commands.
+
+        Returns:
+        --------
+            list: replies.
+        """
+        client = await _get_client()
+        for attempt in range(2):
+            pipe = client.pipeline(transaction=False)
+            build(pipe)
+            try:
+                return await pipe.execute()
+            except NoScriptError:
+                if attempt:
+                    raise
+                await _load_scripts(client)
+
+    async def _mget(self, keys):
+        """
+        (private)
+        MGET of keys, one MGET per slot, all in one round trip.
+        """
+        groups = self._keys._slot_groups(keys)
+
+        def build(pipe):
+            for g in groups:
+                pipe.mget([keys[i] for i in g])
+
+        values = [None] * len(keys)
+        for g, vs in zip(groups, await self._execute(build)):
+            for i, v in zip(g, vs):
+                values[i] = v
+        return values
+
+    async def _resolve(self, h, value):
+        """
+        (private)
+        Full value of data key 'h', like CacheManager._resolve: chunks
+        reassembled and decompressed as they arrive, partitions combined
+        into one Arrow IPC stream.
+
+        Returns:
+        --------
+            bytes | bytearray | None: full value, None if value or any chunk
+                or partition is missing.
+        """
+        client = await _get_client()
+
+        manifest = partitions.parse(value)
+        if manifest is not None:
+            ls = partitions.labels(manifest)
+            rs = await client.hmget(self._keys._parts_key(h), ls) if ls else []
+            if any(r is None for r in rs):
+                logging.warning(f"CACHE_PARTITIONS - {h} - MISSING PARTITION")
+                return None
+            return await asyncio.get_running_loop().run_in_executor(None, cm_sync._join_parts, rs)
+
+        if value is None or not value.startswith(cm_sync._MANIFEST_MAGIC):
+            return value
+
+        manifest = json.loads(value[len(cm_sync._MANIFEST_MAGIC) :])
+        token, n = manifest["token"], manifest["chunks"]
+        ck = self._keys._chunks_key(h)
+
+        # compressed values are decompressed chunk by chunk as they arrive,
+        # others are copied into one preallocated buffer.
+        out, feed = None, None
+        offset = 0
+        for start in range(0, n, cm_sync.CHUNKS_PER_READ):
+            fields = [f"{token}:{i}" for i in range(start, min(start + cm_sync.CHUNKS_PER_READ, n))]
+            for chunk in await client.hmget(ck, fields):
+                if chunk is None:
+                    logging.warning(f"CACHE_CHUNKS - {h} - MISSING CHUNK")
+                    return None
+                if out is None:
+                    feed = compression.decompressor(chunk)
+                    out = bytearray() if feed is not None else bytearray(manifest["size"])
+                if feed is not None:
+                    out += feed(chunk)
+                else:
+                    out[offset : offset + len(chunk)] = chunk
+                offset += len(chunk)
+
+        return out
+
+    async def _missing(self, keys):
+        """
+        (private)
+        Checks which keys don't exist in Redis, all in a single round trip.
+        """
+        keys = list(keys)
+
+        def build(pipe):
+            for k in keys:
+                pipe.exists(k)
+
+        return {k for k, f in zip(keys, await self._execute(build)) if not f}
+
+    async def _wait_keys(self, channel, keys, deadline, recheck=10.0):
+        """
+        (private)
+        Waits until all keys exist, like CacheManager._wait_keys. Clients
+        without pub/sub check presence every half second instead.
+
+        Returns:
+        --------
+            bool: True if all keys exist, False if timed out.
+        """
+        client = await _get_client()
+        pubsub = client.pubsub(ignore_subscribe_messages=True) if hasattr(client, "pubsub") else None
+        if pubsub is None:
+            recheck = min(recheck, 0.5)
+        else:
+            await pubsub.subscribe(channel)
+
+        try:
+            missing = await self._missing(keys)
+            last_check = time.monotonic()
+
+            while missing:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    return False
+
+                if now - last_check >= recheck:
+                    missing = await self._missing(missing)
+                    last_check = now
+                    continue
+
+                wait = recheck - (now - last_check)
+                if deadline is not None:
+                    wait = min(wait, deadline - now)
+
+                if pubsub is None:
+                    await asyncio.sleep(wait)
+                    continue
+
+                msg = await pubsub.get_message(timeout=wait)
+                if msg is not None and msg["type"] == "message":
+                    missing -= set(msg["data"].decode("utf-8").split("\n"))
+
+            return True
+        finally:
+            if pubsub is not None:
+                await pubsub.reset()
+
+    async def getm(self, func, repos):
+        """Gets many values at hash(func, repo), see CacheManager.getm.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            list[bytes | None]: list of decompressed values, None if Nil.
+        """
+        hs = [self._keys._get_hash(func, r) for r in repos]
+        groups = self._keys._slot_groups(hs)
+
+        def build(pipe):
+            for g in groups:
+                pipe.mget([hs[i] for i in g])
+            self._keys._touch(pipe, func, hs, retention.policy_for(func))
+
+        values = [None] * len(hs)
+        for g, vs in zip(groups, await self._execute(build)):
+            for i, v in zip(g, vs):
+                values[i] = v
+
+        rs = await asyncio.gather(*[self._resolve(h, r) for h, r in zip(hs, values)])
+        return [compression.decompress(r) for r in rs]
+
+    async def existsm(self, func, repos):
+        """Checks whether keys are in Redis for hash(func, repo)
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            int: number of names that exist
+        """
+        hs = [self._keys._get_hash(func, r) for r in repos]
+
+        def build(pipe):
+            for g in self._keys._slot_groups(hs):
+                pipe.exists(*[hs[i] for i in g])
+
+        return sum(await self._execute(build))
+
+    async def grabm(self, func, repos, promote=True, start=None, end=None):
+        """Builds aggregate DataFrame of repos' datasets, see CacheManager.grabm.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            promote (bool): restore missing repos from the disk tier and retry once.
+            start (str | pd.Timestamp | None): earliest time of rows wanted, None for no bound.
+            end (str | pd.Timestamp | None): time after the latest rows wanted, None for no bound.
+
+        Returns:
+            pd.DataFrame | None: Data if all available, with column types preserved.
+        """
+        df, missing = await self._grab(func, repos, False, promote, start, end)
+        return None if missing else df
+
+    async def grabm_partial(self, func, repos, promote=True, start=None, end=None):
+        """Builds aggregate DataFrame of whichever repos are available,
+        see CacheManager.grabm_partial.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            promote (bool): restore missing repos from the disk tier and retry once.
+            start (str | pd.Timestamp | None): earliest time of rows wanted, None for no bound.
+            end (str | pd.Timestamp | None): time after the latest rows wanted, None for no bound.
+
+        Returns:
+            (pd.DataFrame, list[int]): Data of available repos, and repos missing.
+        """
+        return await self._grab(func, repos, True, promote, start, end)
+
+    async def _grab(self, func, repos, partial, promote, start=None, end=None):
+        """
+        (private)
+        CacheManager._grab on the event loop. Concurrent reads of a key in
+        this process may both load it, as waiting for another thread's
+        load would block the loop.
+        """
+        keys = self._keys
+        loop = asyncio.get_running_loop()
+        column, ranged = keys._range_column(func, start, end)
+
+        hs = [keys._get_hash(func, r) for r in repos]
+        groups, calls = keys._fetch_calls(func, hs, partial)
+
+        def build(pipe):
+            for ks, args in calls:
+                pipe.evalsha(_CHECK_AND_FETCH_SHA, len(ks), *ks, *args)
+            keys._touch(pipe, func, hs, retention.policy_for(func))
+            _metrics.flush(pipe)
+
+        replies = (await self._execute(build))[: len(groups)]
+        versions, values, missing = keys._fetched(func, hs, groups, replies)
+
+        # missing repos may have been spilled to disk
+        if missing and promote and _disk_tier.enabled:
+            promoting = repos if versions is None else [repos[i] for i in missing]
+            if await loop.run_in_executor(None, keys.promote, func, promoting):
+                return await self._grab(func, repos, partial, False, start, end)
+        if versions is None:
+            return None, list(repos)
+
+        frames, present, to_load = keys._held_frames(func, hs, versions, values, missing)
+
+        if to_load:
+            # held frames evicted since the round trip are re-read
+            refetch = [i for i in to_load if values[i] is None]
+            if refetch:
+                for i, r in zip(refetch, await self._mget([hs[i] for i in refetch])):
+                    values[i] = r
+
+            payloads, layout, parts, fetch = keys._plan_load(hs, to_load, values, start, end)
+
+            # whole values, reassembled if chunked
+            gone = []
+            whole = list(payloads)
+            for i, r in zip(whole, await asyncio.gather(*[self._resolve(hs[i], payloads[i]) for i in whole])):
+                if r is None:
+                    del payloads[i]
+                    gone.append(i)
+                else:
+                    payloads[i] = r
+
+            # partitions not held locally, one HMGET per key
+            if fetch:
+
+                def build_parts(pipe):
+                    for i, ls in fetch.items():
+                        pipe.hmget(keys._parts_key(hs[i]), ls)
+
+                gone += keys._fetched_parts(fetch, await self._execute(build_parts), payloads, layout)
+
+            if gone:
+                # value, its chunks or partitions removed since presence check
+                if not partial:
+                    return None, list(repos)
+                missing += gone
+
+            _metrics.incr(func.__name__, "bytes_read", sum(len(r) for r in payloads.values()))
+            decoded = await loop.run_in_executor(None, keys._decode, func, payloads)
+            keys._assemble(hs, to_load, versions, values, layout, parts, fetch, decoded, frames, ranged)
+
+        _metrics.incr(func.__name__, "local_hits", len(present) - len(to_load))
+        return keys._combine(repos, frames, missing, column, start, end)
+
+    async def wait_for(self, func, repos, timeout=None, recheck=10.0):
+        """Waits until data for all repos is available and returns it
+        as an aggregate DataFrame, like 'grabm'. Woken by the
+        notifications CacheManager publishes when it stores results.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            timeout (float | None): seconds to wait before giving up, None waits indefinitely.
+            recheck (float): seconds without a notification before presence is checked directly.
+
+        Returns:
+            pd.DataFrame | None: Data if all available, None if timed out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        hs = {self._keys._get_hash(func, r) for r in repos}
+
+        while True:
+            if not await self._wait_keys(self._keys._ready_channel(func), hs, deadline, recheck):
+                return None
+
+            # keys could be removed between the check and the read,
+            # in which case we go back to waiting.
+            df = await self.grabm(func=func, repos=repos)
+            if df is not None:
+                return df
@@ -0,0 +1,295 @@
+"""
+    Cache backends.
+
+    Query workers, callbacks and visualizations use the cache through the
+    CacheBackend interface, and get their backend from 'get_cache', chosen
+    by the CACHE_BACKEND environment variable:
+
+        redis (default): CacheManager, Redis or Redis Cluster shared by every host.
+        embedded: EmbeddedCacheManager, Arrow files on local disk fronted by an
+            in-process LRU, for single-node installs and benchmarks.
+
+    Backends implement the core data methods. The coordination features-
+    pending markers, figure caching, usage tracking, disk promotion- have
+    defaults here that do without them, so a backend can leave them out.
+"""
+import os
+import time
+import inspect
+import hashlib
+import logging
+import pandas as pd
+from abc import ABC, abstractmethod
+
+# query function name -> fingerprint of its output's version, computed once per process.
+_fingerprints = {}
+
+
+class CacheBackend(ABC):
+    """
+    Interface of a cache of query results per (query function, repo).
+
+    Methods:
+    --------
+        set(func, repo, data), setm(func, [repo], [data], cost) :
+            Stores data of repos, with the seconds their query took.
+
+        get(func, repo), getm(func, [repo]) :
+            Returns stored values as bytes, None if missing.
+
+        exists(func, repo), existsm(func, [repo]) :
+            Returns number of repos stored.
+
+        missing(func, [repo]) :
+            Returns the repos not stored.
+
+        grabm(func, [repo], start, end) :
+            Returns aggregate DataFrame of all repos, None if any missing.
+            Time-partitioned datasets can be read over a time range, see partitions.py.
+
+        grabm_partial(func, [repo]) :
+            Returns aggregate DataFrame of the repos available, and the repos missing.
+
+        headers(func, [repo]) :
+            Returns sort column, row count, time bounds and schema version per repo.
+
+        wait_for(func, [repo], timeout) :
+            Blocks until all repos are available, then returns grabm result.
+
+        grab_figure(viz_id, func, [repo], params, compute, timeout) :
+            Returns figure computed from the repos' data.
+
+        upsert(func, [repo], [data]), watermarks(func, [repo]), cached_repos(func) :
+            Incremental refresh, see refresh.py.
+
+        claim(func, [repo], job_id, lease), release(func, [repo], job_id) :
+            Pending markers of in-flight query jobs.
+
+        promote(func, [repo]) :
+            Restores repos from a slower tier.
+
+        record_usage([selection]), popular(n) :
+            Usage tracking for cache warming.
+    """
+
+    def _fingerprint(self, func):
+        """
+        (private)
+        Fingerprint of the version of a query function's output- the
+        SCHEMA_VERSION constant of its module, bumped whenever a change to
+        its SQL or post-processing changes the data's shape. Keys are
+        namespaced by it, so a deploy that changes a query never serves
+        data written by the old one, while edits that don't change the
+        data, e.g. to comments or logging, keep the cache.
+
+        Args:
+        -----
+            func (function): Query function used
+
+        Returns:
+        --------
+            str: short hex fingerprint.
+        """
+        fp = _fingerprints.get(func.__name__)
+        if fp is not None:
+            return fp
+
+        # celery tasks keep the decorated function as __wrapped__
+        target = getattr(func, "__wrapped__", func)
+        version = getattr(inspect.getmodule(target), "SCHEMA_VERSION", None)
+        if version is None:
+            logging.warning(f"CACHE_KEYS - no SCHEMA_VERSION for {func.__name__}, fingerprinting by name only")
+            version = 0
+
+        fp = hashlib.md5(bytes(f"{func.__name__}:{version}", "utf-8")).hexdigest()[:12]
+        _fingerprints[func.__name__] = fp
+        return fp
+
+    def set(self, func, repo, data):
+        return self.setm(func, [repo], [data])
+
+    @abstractmethod
+    def setm(self, func, repos, datas, cost=None):
+        ...
+
+    def get(self, func, repo):
+        return self.getm(func, [repo])[0]
+
+    @abstractmethod
+    def getm(self, func, repos):
+        ...
+
+    def exists(self, func, repo):
+        return self.existsm(func, [repo])
+
+    @abstractmethod
+    def existsm(self, func, repos):
+        ...
+
+    def missing(self, func, repos):
+        """Repos whose data isn't stored. Backends whose presence checks
+        are round trips check all repos at once.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            list[int]: repos not stored, in the order of repos.
+        """
+        return [r for r in repos if self.exists(func, r) != 1]
+
+    @abstractmethod
+    def grabm(self, func, repos, start=None, end=None):
+        ...
+
+    def grabm_partial(self, func, repos, start=None, end=None):
+        """Builds the aggregate DataFrame of whichever repos are
+        available, so large selections can be shown before their
+        slowest repos are queried.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            start (str | pd.Timestamp | None): earliest time of rows wanted, None for no bound.
+            end (str | pd.Timestamp | None): time after the latest rows wanted, None for no bound.
+
+        Returns:
+            (pd.DataFrame, list[int]): Data of available repos, and repos missing.
+        """
+        present = [r for r in repos if self.exists(func, r)]
+        df = self.grabm(func=func, repos=present, start=start, end=end) if present else None
+        if df is None:
+            # nothing present, or removed since the check
+            return pd.DataFrame(), list(repos)
+
+        present = set(present)
+        return df, [r for r in repos if r not in present]
+
+    def headers(self, func, repos):
+        """Headers of stored datasets: the column they're sorted by,
+        row count, earliest and latest time, and schema version, see
+        partitions.header. Backends that store headers read them without
+        reading rows; this reads each repo's data.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            dict[int, dict | None]: repo -> header, None if not stored.
+        """
+        headers = {}
+        for r in repos:
+            df = self.grabm(func=func, repos=[r])
+            headers[r] = None if df is None else df.attrs.get("header")
+        return headers
+
+    def wait_for(self, func, repos, timeout=None, recheck=0.5):
+        """Blocks until data for all repos is available and returns
+        it as an aggregate DataFrame, like 'grabm'. Polls every
+        'recheck' seconds; backends that can be notified of writes
+        override this.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            timeout (float | None): seconds to wait before giving up, None waits indefinitely.
+            recheck (float): seconds between polls.
+
+        Returns:
+            pd.DataFrame | None: Data if all available, None if timed out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            df = self.grabm(func=func, repos=repos)
+            if df is not None:
+                return df
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(recheck)
+
+    def grab_figure(self, viz_id, func, repos, params, compute, timeout=None):
+        """Returns the figure for a visualization of 'repos'.
+        Without figure caching, it's computed on every call.
+
+        Args:
+            viz_id (str): unique id of the visualization.
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            params (tuple): all other inputs that the figure depends on.
+            compute (function): pd.DataFrame -> plotly figure.
+            timeout (float | None): seconds to wait before giving up, None waits indefinitely.
+
+        Returns:
+            go.Figure | dict | None: figure, None if timed out.
+        """
+        df = self.wait_for(func=func, repos=repos, timeout=timeout)
+        return None if df is None else compute(df)
+
+    @abstractmethod
+    def upsert(self, func, repos, datas):
+        """Merges rows changed since each repo's watermark into its
+        stored dataset by primary key, see refresh.py.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            data (list[pd.DataFrame]): rows changed per repo.
+
+        Returns:
+            bool: confirmation of successful set operations.
+        """
+        ...
+
+    def watermarks(self, func, repos):
+        # no marks, refreshes re-query repos in full
+        return {r: None for r in repos}
+
+    def cached_repos(self, func):
+        return []
+
+    def claim(self, func, repos, job_id, lease=None):
+        # without markers every caller does its own work
+        return list(repos), {}
+
+    def release(self, func, repos, job_id=None):
+        return 0
+
+    def promote(self, func, repos):
+        return []
+
+    def record_usage(self, selections):
+        pass
+
+    def popular(self, n=20):
+        return []
+
+
+def get_cache(**kwargs):
+    """
+    Cache backend configured by the CACHE_BACKEND environment variable.
+
+    Args:
+    -----
+        kwargs: passed to the backend's constructor.
+
+    Returns:
+    --------
+        CacheBackend: backend.
+    """
+    name = os.getenv("CACHE_BACKEND", "redis")
+
+    if name == "redis":
+        from cache_manager.cache_manager import CacheManager
+
+        return CacheManager(**kwargs)
+
+    if name == "embedded":
+        from cache_manager.embedded import EmbeddedCacheManager
+
+        return EmbeddedCacheManager(**kwargs)
+
+    raise ValueError(f"CACHE_BACKEND - unknown backend '{name}'")
@@ -1,38 +1,536 @@
-from redis import StrictRedis
+from redis import StrictRedis, ConnectionPool
+from redis.cluster import RedisCluster
+from redis.crc import key_slot
+from redis.exceptions import NoScriptError
 import os
+import zlib
+import uuid
+import json
 import hashlib
 import pandas as pd
-import io
 import sys
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from cache_manager.serialization import serialize_df, deserialize_df, concat_frames, read_header
+from cache_manager import compression
+from cache_manager import retention
+from cache_manager.local_cache import LocalCache
+from cache_manager.backend import CacheBackend
+from cache_manager.disk_tier import DiskTier
+from cache_manager.metrics import Metrics, stats_key, reads_key, COUNTERS
+from cache_manager import usage
+from cache_manager import refresh
+from cache_manager import partitions
+from cache_manager.snapshot import SnapshotWriter, read_snapshot
 
+# connections shared by all CacheManager objects in this process,
+# created on first use. redis-py resets pools in forked children.
+_pool = None
+_cluster = None
 
-class CacheManager:
+# whether the cache is a Redis Cluster rather than a single instance.
+# Celery's broker can't be a cluster, so point CACHE_REDIS_HOST at the
+# cluster and keep REDIS_SERVICE_HOST for the broker.
+REDIS_CLUSTER = os.getenv("CACHE_REDIS_CLUSTER", "False") == "True"
+
+# data keys are spread over this many hash tags by repo. All of a repo's
+# keys- data, chunks, pending marker- and the version index of its bucket
+# share a tag, so a selection is read with one script call per bucket it
+# touches. Changing it re-keys the cache.
+SLOT_BUCKETS = int(os.getenv("CACHE_SLOT_BUCKETS", "64" if REDIS_CLUSTER else "1"))
+
+# KEYS: data keys..., version index. ARGV: "1" to read whichever keys are
+# present, "" to read only if all are, then the version of each data key
+# the caller already holds, "" if none. Replies {0, number present} if any
+# key is missing and not reading partially, otherwise {1, version1, value1,
+# version2, value2, ...} where a value is nil if the caller already holds
+# that version, and both are nil if the key is missing.
+_CHECK_AND_FETCH = """
+local n = #KEYS - 1
+local present = 0
+local exists = {}
+for i = 1, n do
+    exists[i] = redis.call('EXISTS', KEYS[i])
+    present = present + exists[i]
+end
+if present < n and ARGV[1] ~= '1' then
+    return {0, present}
+end
+local out = {1}
+for i = 1, n do
+    local v = false
+    local val = false
+    if exists[i] == 1 then
+        v = redis.call('HGET', KEYS[#KEYS], KEYS[i])
+        if v == false or v ~= ARGV[i + 1] then
+            val = redis.call('GET', KEYS[i])
+        end
+    end
+    out[#out + 1] = v
+    out[#out + 1] = val
+end
+return out
+"""
+
+# KEYS: priority index, credit index of a dataset. ARGV: "1" to only update
+# keys already in the priority index, "" otherwise, then per data key: the
+# key, its credit to record or "" to keep the recorded one, and its credit
+# if none is recorded or "". A key's priority is its credit plus the
+# dataset's inflation value, see _enforce_retention.
+_GDS_PRIORITIZE = """
+local floor = tonumber(redis.call('HGET', KEYS[2], '~floor') or '0')
+for i = 2, #ARGV, 3 do
+    local credit = ARGV[i + 1]
+    if credit ~= '' then
+        redis.call('HSET', KEYS[2], ARGV[i], credit)
+    else
+        credit = redis.call('HGET', KEYS[2], ARGV[i]) or ARGV[i + 2]
+    end
+    if credit ~= '' then
+        if ARGV[1] == '1' then
+            redis.call('ZADD', KEYS[1], 'XX', floor + tonumber(credit), ARGV[i])
+        else
+            redis.call('ZADD', KEYS[1], floor + tonumber(credit), ARGV[i])
+        end
+    end
+end
+return 0
+"""
+
+# Lua: makes sure a dataset's byte counter (KEYS[2]) exists, summing its
+# size index (KEYS[1]) once if it doesn't, e.g. for indexes written before
+# the counter was kept. Leaves the total in 'total'.
+_COUNT_BYTES = """
+local total = redis.call('GET', KEYS[2])
+if total == false then
+    total = 0
+    for _, v in ipairs(redis.call('HVALS', KEYS[1])) do
+        total = total + tonumber(v)
+    end
+    redis.call('SET', KEYS[2], total)
+end
+total = tonumber(total)
+"""
+
+# KEYS: size index, byte counter of a dataset. ARGV: per data key, the key
+# and its size to record, or "" to remove it. Keeps the counter at the sum
+# of the index. Replies the counter.
+_RESIZE = (
+    _COUNT_BYTES
+    + """
+for i = 1, #ARGV, 2 do
+    local old = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or '0')
+    if ARGV[i + 1] == '' then
+        redis.call('HDEL', KEYS[1], ARGV[i])
+        total = total - old
+    else
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+        total = total + tonumber(ARGV[i + 1]) - old
+    end
+end
+redis.call('SET', KEYS[2], total)
+return total
+"""
+)
+
+# KEYS: size index, byte counter, access time index, priority index,
+# credit index of a dataset. ARGV: byte budget, "1" to evict by priority
+# or "" by access time, then keys that mustn't be evicted. Picks keys to
+# evict until the dataset is within budget and removes them from the
+# indexes, so concurrent writers never pick the same keys, and raises the
+# inflation value to the priority of the last key picked. Replies the keys;
+# their values are left for the caller to spill and delete.
+_EVICT = (
+    _COUNT_BYTES
+    + """
+local budget = tonumber(ARGV[1])
+if total <= budget then
+    return {}
+end
+
+local keep = {}
+for i = 3, #ARGV do
+    keep[ARGV[i]] = true
+end
+
+-- keys written before priorities were kept have none, and go first,
+-- oldest access first
+local order = {}
+if ARGV[2] ~= '1' or redis.call('ZCARD', KEYS[3]) > redis.call('ZCARD', KEYS[4]) then
+    for _, k in ipairs(redis.call('ZRANGE', KEYS[3], 0, -1)) do
+        if ARGV[2] ~= '1' or redis.call('ZSCORE', KEYS[4], k) == false then
+            order[#order + 1] = {k, false}
+        end
+    end
+end
+if ARGV[2] == '1' then
+    local ranked = redis.call('ZRANGE', KEYS[4], 0, -1, 'WITHSCORES')
+    for i = 1, #ranked, 2 do
+        order[#order + 1] = {ranked[i], ranked[i + 1]}
+    end
+end
+
+local evicted = {}
+local floor = false
+for _, e in ipairs(order) do
+    if total <= budget then
+        break
+    end
+    local k = e[1]
+    if not keep[k] then
+        total = total - tonumber(redis.call('HGET', KEYS[1], k) or '0')
+        redis.call('HDEL', KEYS[1], k)
+        redis.call('ZREM', KEYS[3], k)
+        redis.call('ZREM', KEYS[4], k)
+        redis.call('HDEL', KEYS[5], k)
+        evicted[#evicted + 1] = k
+        if e[2] then
+            floor = e[2]
+        end
+    end
+end
+
+redis.call('SET', KEYS[2], total)
+if floor then
+    redis.call('HSET', KEYS[5], '~floor', floor)
+end
+return evicted
+"""
+)
+
+# KEYS: pending markers. ARGV: id of the job whose markers to remove.
+# Deletes the markers still held by that job, in one step so that a marker
+# another job claimed after this one's lease ran out is kept.
+_RELEASE_HELD = """
+local removed = 0
+for i = 1, #KEYS do
+    if redis.call('GET', KEYS[i]) == ARGV[1] then
+        removed = removed + redis.call('DEL', KEYS[i])
+    end
+end
+return removed
+"""
+
+# indexes read by _EVICT, kept in one hash slot per dataset.
+_RETENTION_INDEXES = ("atime", "size", "bytes", "priority", "credit")
+
+# field of the credit index holding the dataset's inflation value.
+_GDS_FLOOR = "~floor"
+
+# seconds a query is assumed to take per repo when it wasn't measured,
+# e.g. for data promoted from disk or restored from a snapshot.
+DEFAULT_QUERY_COST = float(os.getenv("CACHE_DEFAULT_QUERY_COST", "30"))
+
+# computed figures live this long; a new data version makes a new figure key anyway.
+FIGURE_TTL = int(os.getenv("CACHE_FIGURE_TTL", str(24 * 60 * 60)))
+
+# longest a worker may hold the computation of a figure before others take over.
+FIGURE_LOCK_TTL = int(os.getenv("CACHE_FIGURE_LOCK_TTL", "300"))
+
+# channel new figure keys are announced on.
+FIGURE_CHANNEL = "cache_ready:figures"
+
+# longest a query job may hold its (func, repo) pending markers before
+# another session may enqueue the same work again.
+PENDING_LEASE = int(os.getenv("CACHE_PENDING_LEASE", "3600"))
+
+# values larger than this are stored in chunks of this size, so that no
+# single command moves more than a chunk and Redis' 512 MB limit isn't hit.
+CHUNK_BYTES = int(os.getenv("CACHE_CHUNK_BYTES", str(32 * 1024 * 1024)))
+
+# seconds the chunks of a value that's no longer chunked are kept, so
+# readers that got its manifest just before the write can finish.
+CHUNK_GRACE = int(os.getenv("CACHE_CHUNK_GRACE", "60"))
+
+# field of a chunk hash naming the token of the latest write, see _drop_stale_chunks.
+_CHUNKS_LATEST = "~latest"
+
+# chunks read per round trip when reassembling a chunked value.
+CHUNKS_PER_READ = 4
+
+# chunked values store a manifest under their key, marked by this prefix.
+# leading NUL can't start an Arrow stream, CSV text or a compressed value.
+_MANIFEST_MAGIC = b"\x008KM"
+
+# metric increments waiting to ride along with the next pipeline.
+_metrics = Metrics()
+
+# spilled datasets, see disk_tier.py. Disabled unless CACHE_DISK_PATH is set.
+_disk_tier = DiskTier(
+    root=os.getenv("CACHE_DISK_PATH"),
+    max_bytes=int(os.getenv("CACHE_DISK_MAX_BYTES", str(10 * 1024 * 1024 * 1024))),
+)
+
+# keys this close to expiring from Redis are spilled to the disk tier, in seconds.
+DISK_SPILL_MARGIN = int(os.getenv("CACHE_DISK_SPILL_MARGIN", str(24 * 60 * 60)))
+
+# set once a Redis instance has been restored from a snapshot, or found
+# there was none. A restarted Redis doesn't have it.
+SNAPSHOT_SENTINEL = "cache_snapshot:restored"
+
+# held by the process restoring a snapshot, so that only one does.
+# Expires if that process dies, and the next caller resumes.
+SNAPSHOT_LOCK = "cache_snapshot:restoring"
+SNAPSHOT_LOCK_TTL = int(os.getenv("CACHE_SNAPSHOT_LOCK_TTL", "3600"))
+
+# threads decoding the values of a read concurrently. Decompression and
+# Arrow decoding release the GIL, so threads spread a large selection's
+# decoding over cores. 1 decodes serially.
+DECODE_THREADS = int(os.getenv("CACHE_DECODE_THREADS", "4"))
+
+# decoding threads shared by all CacheManager objects in this process,
+# created on first use. Threads don't survive a fork, so children make their own.
+_decoder = None
+
+
+def _reset_decoder():
+    global _decoder
+    _decoder = None
+
+
+os.register_at_fork(after_in_child=_reset_decoder)
+
+# deserialized datasets shared by all CacheManager objects in this process.
+_local_cache = LocalCache(max_bytes=int(os.getenv("CACHE_LOCAL_MAX_BYTES", str(256 * 1024 * 1024))))
+
+
+def _connection_kwargs():
+    """
+    Connection settings of the cache, shared by the sync and async clients.
+
+    Returns:
+    --------
+        dict: keyword arguments of a Redis or RedisCluster client.
+    """
+    max_connections = os.getenv("CACHE_REDIS_MAX_CONNECTIONS")
+    return dict(
+        # openshift will reconcile the 'redis' naming via the dns
+        host=os.getenv("CACHE_REDIS_HOST", os.getenv("REDIS_SERVICE_HOST", "localhost")),
+        port=int(os.getenv("CACHE_REDIS_PORT", os.getenv("REDIS_SERVICE_PORT", "6379"))),
+        password=os.getenv("REDIS_PASSWORD", ""),
+        # values are binary Arrow streams, not text.
+        decode_responses=False,
+        # per node on a cluster
+        **({"max_connections": int(max_connections)} if max_connections else {}),
+    )
+
+
+def _get_pool():
+    """
+    Process-wide Redis connection pool, so that creating a CacheManager
+    per callback doesn't create new connections.
+
+    Returns:
+    --------
+        ConnectionPool: shared pool.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(**_connection_kwargs())
+    return _pool
+
+
+def _get_client():
+    """
+    Process-wide Redis client: a cluster client if CACHE_REDIS_CLUSTER
+    is set, otherwise a client of the shared connection pool.
+
+    Returns:
+    --------
+        StrictRedis | RedisCluster: client.
+    """
+    global _cluster
+    if not REDIS_CLUSTER:
+        return StrictRedis(connection_pool=_get_pool())
+
+    if _cluster is None:
+        _cluster = RedisCluster(**_connection_kwargs())
+        # cluster pipelines can't load scripts themselves
+        _cluster.script_load(_CHECK_AND_FETCH)
+        _cluster.script_load(_GDS_PRIORITIZE)
+        _cluster.script_load(_RELEASE_HELD)
+        _cluster.script_load(_RESIZE)
+        _cluster.script_load(_EVICT)
+    return _cluster
+
+
+def _get_decoder():
+    """
+    Process-wide pool of threads decoding cached values.
+
+    Returns:
+    --------
+        ThreadPoolExecutor: shared pool.
+    """
+    global _decoder
+    if _decoder is None:
+        _decoder = ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix="cache-decode")
+    return _decoder
+
+
+def _join_parts(values):
+    """
+    Combines the stored partitions of a partitioned value into one Arrow IPC stream.
+
+    Args:
+    -----
+        values (list[bytes]): stored partitions, oldest first.
+
+    Returns:
+    --------
+        bytes: Arrow IPC stream of all rows, with their combined header.
+    """
+    return serialize_df(partitions.join([deserialize_df(compression.decompress(r)) for r in values]))
+
+
+class CacheManager(CacheBackend):
     """
-    Manages access to Redis cache.
+    Manages access to Redis cache. The default CacheBackend, see backend.py.
 
     Attributes
     ----------
-        _redis : (private) Redis object
+        _redis : (private) Redis or RedisCluster object, shared by the process
+
+        _check_and_fetch : (private) Lua script, presence check and read in one round trip
+
+        _gds_prioritize : (private) Lua script, updates keys' eviction priorities
+
+        _codec : (private) name of compression codec, None if disabled
+
+        _compression_threshold : (private) values smaller than this aren't compressed
 
     Methods
     -------
+        _fingerprint(func) (private) :
+            Fingerprint of the version of a query function's output.
+
+        _pipeline(transaction) (private) :
+            Pipeline, a transaction unless the cache is a cluster.
+
+        _slot_groups([key]) (private) :
+            Groups keys that can share a multi-key command.
+
+        _bucket_groups([hash]) (private) :
+            Groups data keys by hash tag, for the check-and-fetch script.
+
+        _mget([key]), _delete(pipe, [key]) (private) :
+            MGET / DEL split by hash slot.
+
+        _versions(func, [hash]) (private) :
+            Reads data keys' versions from their buckets' version indexes.
+
         _get_hash(func, repo) (private) :
-            Creates a unique hash for each job based on the job's calling
-            function and the list of repos that the function is being run with.
+            Creates a unique key for each job based on the job's calling
+            function, its fingerprint, and the repo it is being run with.
+
+        _tags(key) (private) :
+            Tag sets (repo, dataset, schema) a data key belongs to.
+
+        _forget([key]) (private) :
+            Removes keys from retention indexes and tag sets.
+
+        _ready_channel(func) (private) :
+            Name of pub/sub channel that set/setm announce new keys on.
+
+        _missing(keys) (private) :
+            Returns the subset of keys that don't exist in Redis.
+
+        _wait_keys(channel, keys, deadline) (private) :
+            Blocks until keys exist, woken by notifications on channel.
+
+        _remaining(deadline) (private) :
+            Seconds left until deadline.
+
+        _figure_key(viz_id, [hash], params, [version]) (private) :
+            Key of a computed figure.
+
+        _chunks_key(hash) (private) :
+            Name of hash holding the chunks of a chunked value.
+
+        _write_chunks(hash, data, policy) (private) :
+            Writes a large value in chunks, returns its manifest.
+
+        _resolve(hash, value) (private) :
+            Reassembles a chunked value from its manifest.
+
+        _drop_stale_chunks(hash, manifest) (private) :
+            Removes chunks left by writes before the one a key's latest write replaced.
+
+        _parts_key(hash), _part_cache_key(hash, label) (private) :
+            Name of hash holding the partitions of a partitioned value,
+            and the in-process cache key of one partition.
+
+        _combine_parts(hash, manifest) (private) :
+            Reads a partitioned value whole.
+
+        _pending_key(hash) (private) :
+            Name of marker holding id of job in flight for a data key.
+
+        _index_key(func, kind) (private) :
+            Name of the per-dataset index of key access times or sizes.
+
+        _touch(pipe, func, [hash], policy) (private) :
+            Queues ttl and access time refresh of keys if policy is sliding.
+
+        _record_sizes(pipe, func, {hash: size}) (private) :
+            Queues size index updates, keeping the dataset's byte counter.
+
+        _gds_keys(func), _prioritize(pipe, func, [hash], [credit]) (private) :
+            Indexes and update of GreedyDual-Size eviction priorities.
+
+        _enforce_retention(func, policy, [hash]) (private) :
+            Prunes expired keys from the dataset index and evicts least-recently
+            used keys while the dataset is over its byte budget.
+
+        _spill(func, [hash]) (private) :
+            Copies keys to the disk tier before they leave Redis.
+
+        _upsert_parts(func, spec, column, [(repo, data)], [manifest]) (private) :
+            Upserts into partitioned values, rewriting only the partitions touched.
+
+        _drop_gone(func, [repo]) (private) :
+            Releases and forgets repos whose cached frames went missing before an upsert.
+
+        _grab(func, [repo], partial, promote, start, end) (private) :
+            Reads and deserializes datasets for grabm and grabm_partial.
+
+        _range_column(func, start, end), _fetch_calls(func, [hash], partial),
+        _fetched(func, [hash], groups, replies), _held_frames(...), _plan_load(...),
+        _fetched_parts(...), _assemble(...), _combine(...) (private) :
+            Steps of _grab that don't touch Redis, shared with AsyncCacheManager.
+
+        _decode(func, {position: value}) (private) :
+            Deserializes values concurrently on the decoding threads.
+
+        _write(name, [hash], [value], [version], [watermark], {hash: parts}, [cost]) (private) :
+            Stores serialized values with their indexes, see setm.
+
+        _serialize(data) (private) :
+            Converts DataFrames to Arrow IPC bytes for storage, compressing
+            values larger than the compression threshold.
+
+        _with_header(data, column, schema) (private) :
+            Attaches a frame's header, stored with it, see partitions.header.
+
+        _partition(data, column, schema, version) (private) :
+            Splits a frame into serialized partitions under their manifest.
 
         set(func, repo, data) :
             Sets data at key hash(func, repo).
 
-        setm(func, [repo], [data]) :
+        setm(func, [repo], [data], cost) :
             Sets [data] at keys [hash(func, repo)] of [repo]
+            Records the query's cost per repo for cost-aware eviction.
+            Applies the dataset's retention policy in the same transaction.
+            Values larger than CHUNK_BYTES are stored in chunks.
 
         get(func, repo):
             Returns data at key hash(func, repo), None if Nil.
 
         getm(func, [repo]):
             Returns data at keys [hash(func, repo)], None if Nil.
-            Uses r.mget([keys])
+            Uses r.mget([keys]), extends ttl if retention policy is sliding.
 
         exists(func, repo):
             Returns number of names that exist.
@@ -40,27 +538,115 @@ class CacheManager:
         existsm(func, [repo]):
             Returns number of names that exist.
 
+        missing(func, [repo]):
+            Returns repos whose keys don't exist, checked in one round trip.
+
+        grabm(func, [repo], start, end):
+            Returns deserialized DataFrame of all repos, None if any missing.
+            Time-partitioned datasets come back in time order, merged from the
+            repos' sorted frames, and can be read over a time range.
+            Reuses frames from the in-process cache when their version is current.
+            Checks presence and fetches values in a single round trip.
+
+        grabm_partial(func, [repo]):
+            Returns DataFrame of the repos available and the list of repos missing,
+            for showing large selections before all their repos are queried.
+
+        headers(func, [repo]):
+            Returns sort column, row count, time bounds and schema version per repo, without decoding rows.
+
+        watermarks(func, [repo]):
+            Returns latest timestamp cached per repo, for incremental refresh.
+
+        upsert(func, [repo], [data]):
+            Merges rows changed since the watermark into cached frames by primary key,
+            rewriting only the partitions touched if the dataset is time-partitioned.
+
+        cached_repos(func):
+            Returns repos with data cached for a dataset type.
+
+        promote(func, [repo]):
+            Restores repos missing from Redis from the disk tier.
+
+        spill_expiring([func]):
+            Copies keys within DISK_SPILL_MARGIN of expiring to the disk tier.
+
+        wait_for(func, [repo], timeout):
+            Blocks until all repos are available, then returns grabm result.
+            Woken by notifications published from set/setm.
+
+        stats([func]):
+            Returns counters, key count and bytes stored per dataset type.
+
+        largest_keys(func, n), hottest_keys(func, n):
+            Ranks a dataset type's keys by bytes stored or by reads.
+
+        repo_footprint(n):
+            Ranks repos by bytes stored across all dataset types.
+
+        claim(func, [repo], job_id, lease):
+            Atomically marks work as in flight for repos not already pending.
+            Returns claimed repos, and the ids of jobs already in flight for others.
+
+        release(func, [repo], job_id):
+            Removes pending markers, e.g. after a job failed.
+
+        snapshot(path), restore(path, force):
+            Exports all datasets to snapshot files, and reloads them into an empty Redis.
+
+        _restored_parts(name, {column: [value]}) (private) :
+            Splits restored values of time-partitioned datasets into partitions again.
+
+        record_usage([selection]):
+            Counts a search for repos / orgs, weighted by recency.
+
+        popular(n):
+            Returns the most used selections by recency-weighted count.
+
+        invalidate_tag(tag), invalidate_repo(repo),
+        invalidate_dataset(func), invalidate_schema(func, fingerprint):
+            Deletes all keys of a repo, dataset type or schema version.
+
+        grab_figure(viz_id, func, [repo], params, compute):
+            Returns cached figure for visualization, repos, parameters and
+            source data versions, computing it once if not cached.
+
     """
 
-    def __init__(self):
-        # Redis cache for job queue and results cache
-        self._redis = StrictRedis(
-            # openshift will reconcile the 'redis' naming via the dns
-            host=os.getenv("REDIS_SERVICE_HOST", "localhost"),
-            port=os.getenv("REDIS_SERVICE_PORT", "6379"),
-            password=os.getenv("REDIS_PASSWORD", ""),
-            decode_responses=True,
+    def __init__(self, codec="default", compression_threshold=None):
+        """
+        Args:
+        -----
+            codec (str | None): compression codec for values written by this
+                object. "default" reads CACHE_COMPRESSION, None disables.
+            compression_threshold (int | None): values smaller than this many bytes
+                are stored uncompressed. None reads CACHE_COMPRESSION_THRESHOLD.
+        """
+        self._codec = compression.default_codec() if codec == "default" else codec
+        self._compression_threshold = (
+            compression.default_threshold() if compression_threshold is None else compression_threshold
         )
 
+        # Redis cache for job queue and results cache
+        self._redis = _get_client()
+        self._check_and_fetch = self._redis.register_script(_CHECK_AND_FETCH)
+        self._gds_prioritize = self._redis.register_script(_GDS_PRIORITIZE)
+        self._release_held = self._redis.register_script(_RELEASE_HELD)
+        self._resize = self._redis.register_script(_RESIZE)
+        self._evict = self._redis.register_script(_EVICT)
+
     def _get_hash(self, func, repo):
         """
         (private)
-        Creates an MD5-hash based on the string-bytes
-        of the passed function and the list of repos that
-        the function is going to be run on.
+        Creates the key for the data of the passed function run
+        on the passed repo:
+
+            data:{function name}:{function fingerprint}:{repo}:{{bucket}}
 
-        Hash is used as a key by which the status of and results from the
-        worker are accessed from the Queue.
+        The braces make the repo's bucket the key's Redis Cluster hash
+        tag, see SLOT_BUCKETS.
+
+        Key is used to access the results from the worker.
 
         Args:
         -----
@@ -69,164 +655,2262 @@ class CacheManager:
 
         Returns:
         --------
-            _Hash: Unique key in Queue object to access job status and results.
+            str: Unique key of job results.
         """
+        bucket = zlib.crc32(str(repo).encode("utf-8")) % SLOT_BUCKETS
+        return f"data:{func.__name__}:{self._fingerprint(func)}:{repo}:{{{bucket}}}"
 
-        # use md5 instead of sha256 or better because
-        # we're only ensuring limited collision avoidance, not
-        # practicing good securiy protocol.
-        hashfunc = hashlib.md5()
-
-        # use the called function's name
-        hashfunc.update(bytes(func.__name__, "utf-8"))
+    def _hash_tag(self, key):
+        """
+        (private)
+        Hash tag of a key, including its braces, "" if it has none.
+        """
+        if isinstance(key, bytes):
+            key = key.decode("utf-8")
 
-        # and the repo list we're passing to it
-        hashfunc.update(bytes(str(repo), "utf-8"))
-        # grab the hex hash that's been generated.
-        h = hashfunc.hexdigest()
+        start = key.find("{")
+        end = key.find("}", start + 1)
+        if start == -1 or end == -1:
+            return ""
+        return key[start : end + 1]
 
-        return h
+    def _pipeline(self, transaction=False):
+        """
+        (private)
+        Pipeline to the cache. Redis Cluster can't run transactions
+        across slots, so on a cluster every pipeline is a plain batch.
+        """
+        return self._redis.pipeline(transaction=transaction and not REDIS_CLUSTER)
 
-    def set(self, func, repo, data):
-        """Sets redis value as data at name=hash(func, repo)
+    def _slot_groups(self, keys):
+        """
+        (private)
+        Indexes of keys, grouped so that each group can be sent as one
+        multi-key command: by hash slot on a cluster, all together otherwise.
 
         Args:
-            func (function): Query function used
-            repo (int): repo_id of repo
-            data (list(dict)): rows of data in dictionary format.
+        -----
+            keys (list[str | bytes]): keys.
 
         Returns:
-            boolean: confirmation of successful set operation.
+        --------
+            list[list[int]]: groups of indexes into keys.
         """
+        if not keys:
+            return []
+        if not REDIS_CLUSTER:
+            return [list(range(len(keys)))]
 
-        # set redis value at 'name=hash' to 'data'
-        ack = self._redis.set(name=self._get_hash(func=func, repo=repo), value=data)
+        groups = {}
+        for i, k in enumerate(keys):
+            slot = key_slot(k.encode("utf-8") if isinstance(k, str) else k)
+            groups.setdefault(slot, []).append(i)
+        return list(groups.values())
 
-        return ack
-
-    def setm(self, func, repos, datas):
-        """Sets many redis value as data at name=hash(func, repo)
+    def _bucket_groups(self, hs):
+        """
+        (private)
+        Indexes of data keys grouped by hash tag. Each group shares a
+        version index, so it can be checked and fetched by one script call.
 
         Args:
-            func (function): Query function used
-            repo (list[int]): list of repo_ids of repos
-            data (list[list(dict)]): list of rows of data in dictionary format.
+        -----
+            hs (list[str]): data keys.
 
         Returns:
-            list[boolean]: confirmations of successful set operations.
+        --------
+            list[list[int]]: groups of indexes into hs.
         """
+        groups = {}
+        for i, h in enumerate(hs):
+            groups.setdefault(self._hash_tag(h), []).append(i)
+        return list(groups.values())
 
-        # create hashes for each (func, repo_id) pair
-        hs = [self._get_hash(func, r) for r in repos]
-        ds = [str(data) for data in datas]
+    def _mget(self, keys):
+        """
+        (private)
+        MGET of keys, one MGET per slot, all in one round trip.
 
-        # bulk-set keys to values in Redis
-        acks = self._redis.mset(dict(zip(hs, ds)))
+        Args:
+        -----
+            keys (list[str | bytes]): keys.
 
-        # from redis docs: "(Return is) always OK since MSET can't fail."
-        return acks
+        Returns:
+        --------
+            list[bytes | None]: values in order of keys.
+        """
+        groups = self._slot_groups(keys)
+        pipe = self._redis.pipeline(transaction=False)
+        for g in groups:
+            pipe.mget([keys[i] for i in g])
 
-    def get(self, func, repo):
-        """Get redis value as data at name=hash(func, repo)
+        values = [None] * len(keys)
+        for g, vs in zip(groups, pipe.execute()):
+            for i, v in zip(g, vs):
+                values[i] = v
+        return values
 
-        Args:
-            func (function): Query function used
-            repo (int): list of repo_id of repo
+    def _delete(self, pipe, keys):
+        """
+        (private)
+        Queues DEL of keys on 'pipe', one DEL per slot.
 
         Returns:
-            boolean: confirmation of successful set operation.
+        --------
+            int: number of commands queued.
         """
+        groups = self._slot_groups(keys)
+        for g in groups:
+            pipe.delete(*[keys[i] for i in g])
+        return len(groups)
 
-        # get redis value at "name=hash"
-        r = self._redis.get(name=self._get_hash(func, repo))
+    def _version_key(self, func, h):
+        """
+        (private)
+        Name of the version index holding data key 'h'. Version indexes
+        are split by hash tag so that each sits in the slot of its keys.
 
-        return r
+        Args:
+        -----
+            func (function | str): Query function used, or its name
+            h (str | bytes): data key.
 
-    def getm(self, func, repos):
-        """Gets many redis value as data at name=hash(func, repo)
+        Returns:
+        --------
+            str: version index key name.
+        """
+        return self._index_key(func, "version") + self._hash_tag(h)
+
+    def _versions(self, func, hs):
+        """
+        (private)
+        Current versions of data keys, in one round trip.
 
         Args:
+        -----
             func (function): Query function used
-            repo (list[int]): list of repo_ids of repos
+            hs (list[str]): data keys.
 
         Returns:
-            (list[list(dict)]): list of rows of data in dictionary format.
+        --------
+            list[bytes | None]: versions in order of hs, None if not versioned.
         """
+        groups = self._bucket_groups(hs)
+        pipe = self._redis.pipeline(transaction=False)
+        for g in groups:
+            pipe.hmget(self._version_key(func, hs[g[0]]), [hs[i] for i in g])
 
-        # create hashes for each (func, repo_id) pair
-        hs = [self._get_hash(func, r) for r in repos]
-
-        # bulk-get values from keys in Redis
-        rs = self._redis.mget(hs)
-
-        # return results
-        return rs
+        versions = [None] * len(hs)
+        for g, vs in zip(groups, pipe.execute()):
+            for i, v in zip(g, vs):
+                versions[i] = v
+        return versions
 
-    def exists(self, func, repo):
-        """Checks whether key is in Redis for hash(func, repo)
+    def _tags(self, key):
+        """
+        (private)
+        Tag sets a data key is a member of, used for bulk invalidation:
+        its repo, its dataset type and its dataset schema version.
 
         Args:
-            func (function): Query function used
-            repo (int): repo_id of repo
+        -----
+            key (str | bytes): data key from _get_hash
 
         Returns:
-            int: number of names that exist
+        --------
+            list[str]: tag set names, empty for keys written before keys were tagged.
         """
+        if isinstance(key, bytes):
+            key = key.decode("utf-8")
 
-        # convert single value into a list
-        repo = [repo]
+        # keys written before hash tags have no bucket part
+        parts = key.split(":")
+        if len(parts) not in (4, 5) or parts[0] != "data":
+            return []
+        name, fp, repo = parts[1:4]
 
-        # pass to exists_many, processes as a list.
-        return self.existsm(func, repo)
+        return [f"tag:repo:{repo}", f"tag:dataset:{name}", f"tag:schema:{name}:{fp}"]
 
-    def existsm(self, func, repos):
-        """Checks whether keys are in Redis for hash(func, repo)
+    def _forget(self, keys, pipe=None, name=None):
+        """
+        (private)
+        Removes keys from the retention indexes and tag sets.
+        Doesn't delete the keys themselves.
 
         Args:
-            func (function): Query function used
-            repo (list[int]): list of repo_ids of repos
+        -----
+            keys (list[str | bytes]): data keys.
+            pipe (Pipeline | None): queue commands on this pipeline rather than executing them.
+            name (str | None): query function name for keys that don't encode one.
+        """
+        if not keys:
+            return
+
+        own = pipe is None
+        if own:
+            pipe = self._redis.pipeline(transaction=False)
+
+        by_name = {}
+        for k in keys:
+            tags = self._tags(k)
+            for tag in tags:
+                pipe.srem(tag, k)
+
+            # dataset tag is "tag:dataset:{name}"
+            k_name = tags[1].split(":", 2)[2] if tags else name
+            if k_name is not None:
+                by_name.setdefault(k_name, []).append(k)
+
+        for name, ks in by_name.items():
+            pipe.zrem(reads_key(name), *ks)
+            pipe.zrem(self._index_key(name, "atime"), *ks)
+            self._record_sizes(pipe, name, {k: None for k in ks})
+            pipe.hdel(self._index_key(name, "watermark"), *ks)
+            pipe.zrem(self._gds_keys(name)[0], *ks)
+            pipe.hdel(self._gds_keys(name)[1], *ks)
+            for g in self._bucket_groups(ks):
+                pipe.hdel(self._version_key(name, ks[g[0]]), *[ks[i] for i in g])
+
+        if own:
+            pipe.execute()
+
+    def _ready_channel(self, func):
+        """
+        (private)
+        Name of the pub/sub channel that set/setm publish newly
+        written keys for 'func' on. Waiters subscribe to it rather
+        than polling Redis.
+
+        Args:
+        -----
+            func (function | str): Query function used, or its name
 
         Returns:
-            int: number of names that exist
+        --------
+            str: channel name
         """
+        name = func if isinstance(func, str) else func.__name__
+        return f"cache_ready:{name}"
 
-        # create hashes for each (func, repo_id) pair
-        hs = [self._get_hash(func, r) for r in repos]
+    def _missing(self, keys):
+        """
+        (private)
+        Checks which keys don't exist in Redis,
+        all in a single round trip.
+
+        Args:
+        -----
+            keys (set[str]): keys to check.
+
+        Returns:
+        --------
+            set[str]: keys that don't exist.
+        """
+        keys = list(keys)
 
-        # bulk-get values from keys in Redis
-        n = self._redis.exists(*hs)
+        pipe = self._redis.pipeline(transaction=False)
+        for k in keys:
+            pipe.exists(k)
+        found = pipe.execute()
 
-        # return results
-        return n
+        return {k for k, f in zip(keys, found) if not f}
 
-    def grabm(self, func, repos):
-        """Checks to see if data is ready using 'existsm'
-        and builds aggregate DataFrame to return to callback.
+    def _wait_keys(self, channel, keys, deadline, recheck=10.0):
+        """
+        (private)
+        Blocks until all keys exist, woken by notifications on 'channel'
+        that list newly written keys. Subscribes before the first check
+        so no notification can be missed between the check and the
+        subscription, and re-checks presence every 'recheck' seconds
+        without a notification in case one was lost.
 
         Args:
-            func (function): Query function used
-            repo (list[int]): list of repo_ids of repos
+        -----
+            channel (str): pub/sub channel keys are announced on.
+            keys (set[str]): keys to wait for.
+            deadline (float | None): time.monotonic() to give up at, None waits indefinitely.
+            recheck (float): seconds without a notification before presence is checked directly.
 
         Returns:
-            pd.DataFrame | None: Data if all available.
+        --------
+            bool: True if all keys exist, False if timed out.
         """
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
 
-        num_repos = len(repos)
-        ready = self.existsm(func=func, repos=repos) == num_repos
-        if not ready:
-            return None
+        try:
+            missing = self._missing(keys)
+            last_check = time.monotonic()
 
-        # get all results from cache
-        results = self.getm(func=func, repos=repos)
+            while missing:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    return False
 
-        # deserialize results, create list of dfs
-        out_df = pd.DataFrame()
-        for r in results:
-            try:
-                out_df = pd.concat([out_df, pd.read_csv(io.StringIO(r), sep=",")], ignore_index=True)
-            except:
-                # some json lists are empty and aren't deserializable
+                if now - last_check >= recheck:
+                    missing = self._missing(missing)
+                    last_check = now
+                    continue
+
+                wait = recheck - (now - last_check)
+                if deadline is not None:
+                    wait = min(wait, deadline - now)
+
+                msg = pubsub.get_message(timeout=wait)
+                if msg is not None and msg["type"] == "message":
+                    missing -= set(msg["data"].decode("utf-8").split("\n"))
+
+            return True
+        finally:
+            pubsub.close()
+
+    def _remaining(self, deadline):
+        """
+        (private)
+        Seconds left until deadline, None if there's no deadline.
+        """
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def _figure_key(self, viz_id, hs, params, versions):
+        """
+        (private)
+        Key of a computed figure: a hash of the visualization, the source
+        dataset keys in sorted-repo order, the input parameters, and the
+        versions of the source datasets.
+
+        Args:
+        -----
+            viz_id (str): unique id of the visualization.
+            hs (list[str]): source dataset keys.
+            params (tuple): other inputs the figure depends on.
+            versions (list[bytes]): versions of source dataset keys.
+
+        Returns:
+        --------
+            str: figure key.
+        """
+        hashfunc = hashlib.md5()
+        hashfunc.update(bytes(viz_id, "utf-8"))
+        hashfunc.update(bytes("\n".join(hs), "utf-8"))
+        hashfunc.update(bytes(repr(tuple(params)), "utf-8"))
+        for v in versions:
+            hashfunc.update(v)
+
+        return f"figure:{viz_id}:{hashfunc.hexdigest()}"
+
+    def _chunks_key(self, h):
+        """
+        (private)
+        Name of the hash holding the chunks of data key 'h' if its
+        value is chunked. Fields are "{write token}:{chunk index}".
+
+        Args:
+        -----
+            h (str | bytes): data key.
+
+        Returns:
+        --------
+            str: chunk hash key.
+        """
+        if isinstance(h, bytes):
+            h = h.decode("utf-8")
+        return f"{h}:chunks"
+
+    def _write_chunks(self, h, data, policy):
+        """
+        (private)
+        Writes a large value as fixed-size chunks, a few per round trip,
+        under a token unique to this write so readers of the previous
+        value aren't disturbed.
+
+        Args:
+        -----
+            h (str): data key.
+            data (bytes): value to store.
+            policy (RetentionPolicy): policy for key's dataset.
+
+        Returns:
+        --------
+            bytes: manifest to store under 'h'.
+        """
+        token = uuid.uuid4().hex
+        ck = self._chunks_key(h)
+        view = memoryview(data)
+        n = (len(data) + CHUNK_BYTES - 1) // CHUNK_BYTES
+
+        for start in range(0, n, CHUNKS_PER_READ):
+            pipe = self._redis.pipeline(transaction=False)
+            for i in range(start, min(start + CHUNKS_PER_READ, n)):
+                pipe.hset(ck, f"{token}:{i}", bytes(view[i * CHUNK_BYTES : (i + 1) * CHUNK_BYTES]))
+            if policy.ttl is not None:
+                pipe.expire(ck, policy.ttl)
+            else:
+                # the hash may have been left to expire by a write that wasn't chunked
+                pipe.persist(ck)
+            pipe.execute()
+
+        manifest = {"token": token, "chunks": n, "size": len(data)}
+        return _MANIFEST_MAGIC + json.dumps(manifest).encode("utf-8")
+
+    def _resolve(self, h, value):
+        """
+        (private)
+        Returns the full value of data key 'h': the value itself, or if
+        it's a manifest, its chunks reassembled a few chunks per round trip,
+        and decompressed as they arrive if the codec allows it. Partitioned
+        values are combined into one Arrow IPC stream.
+
+        Args:
+        -----
+            h (str): data key.
+            value (bytes | None): value read from 'h'.
+
+        Returns:
+        --------
+            bytes | bytearray | None: full value, compressed or not- read it
+                with compression.decompress. None if value or any chunk or
+                partition is missing.
+        """
+        manifest = partitions.parse(value)
+        if manifest is not None:
+            return self._combine_parts(h, manifest)
+
+        if value is None or not value.startswith(_MANIFEST_MAGIC):
+            return value
+
+        manifest = json.loads(value[len(_MANIFEST_MAGIC) :])
+        token, n = manifest["token"], manifest["chunks"]
+        ck = self._chunks_key(h)
+
+        # compressed values are decompressed chunk by chunk as they arrive,
+        # others are copied into one preallocated buffer.
+        out, feed = None, None
+        offset = 0
+        for start in range(0, n, CHUNKS_PER_READ):
+            fields = [f"{token}:{i}" for i in range(start, min(start + CHUNKS_PER_READ, n))]
+            for chunk in self._redis.hmget(ck, fields):
+                if chunk is None:
+                    logging.warning(f"CACHE_CHUNKS - {h} - MISSING CHUNK")
+                    return None
+                if out is None:
+                    feed = compression.decompressor(chunk)
+                    out = bytearray() if feed is not None else bytearray(manifest["size"])
+                if feed is not None:
+                    out += feed(chunk)
+                else:
+                    out[offset : offset + len(chunk)] = chunk
+                offset += len(chunk)
+
+        return out
+
+    def _combine_parts(self, h, manifest):
+        """
+        (private)
+        Reads all partitions of data key 'h' and combines them into one
+        Arrow IPC stream, for callers that need its value whole.
+
+        Args:
+        -----
+            h (str): data key.
+            manifest (dict): parsed partition manifest read from 'h'.
+
+        Returns:
+        --------
+            bytes | None: full value, None if any partition is missing.
+        """
+        ls = partitions.labels(manifest)
+        rs = self._redis.hmget(self._parts_key(h), ls) if ls else []
+        if any(r is None for r in rs):
+            logging.warning(f"CACHE_PARTITIONS - {h} - MISSING PARTITION")
+            return None
+
+        return _join_parts(rs)
+
+    def _drop_stale_chunks(self, h, manifest):
+        """
+        (private)
+        Removes chunks of key 'h' written before the write 'manifest'
+        replaced. That write's chunks are kept until the next one, so
+        readers that got its manifest just before it was replaced can
+        still reassemble it.
+
+        Args:
+        -----
+            h (str): data key.
+            manifest (bytes): manifest currently stored under 'h'.
+        """
+        token = json.loads(manifest[len(_MANIFEST_MAGIC) :])["token"]
+        ck = self._chunks_key(h)
+
+        # the latest write's token is recorded by the write after it
+        previous = self._redis.hget(ck, _CHUNKS_LATEST)
+        keep = [f"{token}:"] + ([f"{previous.decode('utf-8')}:"] if previous is not None else [])
+
+        pipe = self._redis.pipeline(transaction=False)
+        stale = [f for f in self._redis.hkeys(ck) if not f.decode("utf-8").startswith(tuple(keep) + (_CHUNKS_LATEST,))]
+        if stale:
+            pipe.hdel(ck, *stale)
+        pipe.hset(ck, _CHUNKS_LATEST, token)
+        pipe.execute()
+
+    def _parts_key(self, h):
+        """
+        (private)
+        Name of the hash holding the partitions of data key 'h' if its
+        value is partitioned, see partitions.py. Fields are partition labels.
+
+        Args:
+        -----
+            h (str | bytes): data key.
+
+        Returns:
+        --------
+            str: partition hash key.
+        """
+        if isinstance(h, bytes):
+            h = h.decode("utf-8")
+        return f"{h}:parts"
+
+    def _part_cache_key(self, h, label):
+        """
+        (private)
+        Key of a single partition of data key 'h' in the in-process cache.
+        """
+        return f"{self._parts_key(h)}:{label}"
+
+    def _pending_key(self, h):
+        """
+        (private)
+        Name of the marker that a query job is in flight for data key 'h'.
+        Its value is the job's id.
+        """
+        return f"pending:{h}"
+
+    def _index_key(self, func, kind):
+        """
+        (private)
+        Name of a per-dataset index used for retention.
+        "atime" is a sorted set of key -> last write or read time,
+        "size" is a hash of key -> bytes stored, and "bytes" their sum,
+        "version" is a hash of key -> token that changes on every write,
+        split by hash tag (see _version_key),
+        "watermark" is a hash of key -> latest timestamp in the data,
+        "priority" and "credit" are the eviction priorities and credits of
+        keys, see _gds_keys. The indexes retention reads share a hash tag,
+        so that one script can evict keys, see _enforce_retention.
+
+        Args:
+        -----
+            func (function | str): Query function used, or its name
+            kind (str): "atime" | "size" | "bytes" | "version" | "watermark" | "priority" | "credit"
+
+        Returns:
+        --------
+            str: index key name
+        """
+        name = func if isinstance(func, str) else func.__name__
+        if kind in _RETENTION_INDEXES:
+            return f"cache_index:{name}:{kind}{{{name}}}"
+        return f"cache_index:{name}:{kind}"
+
+    def _gds_keys(self, func):
+        """
+        (private)
+        Names of the indexes of GreedyDual-Size eviction: a sorted set of
+        key -> priority, and a hash of key -> credit, the seconds its query
+        took per byte stored. They share a hash tag (see _index_key) so
+        that one script can update both.
+
+        Args:
+        -----
+            func (function | str): Query function used, or its name
+
+        Returns:
+        --------
+            (str, str): priority index and credit index key names.
+        """
+        name = func if isinstance(func, str) else func.__name__
+        return self._index_key(name, "priority"), self._index_key(name, "credit")
+
+    def _prioritize(self, pipe, func, hs, credits=None, defaults=None):
+        """
+        (private)
+        Queues the update of keys' eviction priorities: a key's credit
+        plus the dataset's inflation value, which rises to the priority
+        of each key evicted. Keys that are read keep a high priority, and
+        those expensive to re-query per byte keep it longest.
+
+        Args:
+        -----
+            pipe (Pipeline): pipeline to queue the update on.
+            func (function | str): Query function used, or its name
+            hs (list[str]): data keys.
+            credits (list[float | None] | None): credits to record, None
+                updates only keys already prioritized, with their recorded credits.
+            defaults (list[float] | None): credits of keys that have none recorded.
+        """
+        args = ["1" if credits is None else ""]
+        for i, h in enumerate(hs):
+            credit = None if credits is None else credits[i]
+            args += [h, "" if credit is None else repr(credit), "" if defaults is None else repr(defaults[i])]
+        self._gds_prioritize(keys=list(self._gds_keys(func)), args=args, client=pipe)
+
+    def _record_sizes(self, pipe, func, sizes):
+        """
+        (private)
+        Queues the update of keys' sizes in the dataset's size index,
+        keeping its byte counter at their sum.
+
+        Args:
+        -----
+            pipe (Pipeline): pipeline to queue the update on.
+            func (function | str): Query function used, or its name
+            sizes (dict[str | bytes, int | None]): key -> bytes stored, None to remove it.
+        """
+        args = []
+        for k, size in sizes.items():
+            args += [k, "" if size is None else str(size)]
+        keys = [self._index_key(func, "size"), self._index_key(func, "bytes")]
+        self._resize(keys=keys, args=args, client=pipe)
+
+    def _touch(self, pipe, func, hs, policy):
+        """
+        (private)
+        Queues a refresh of the keys' ttl and access time on 'pipe'
+        if the retention policy is sliding, and of their eviction
+        priorities, so it rides along with a read.
+
+        Args:
+        -----
+            pipe (Pipeline): pipeline the read is queued on.
+            func (function): Query function used
+            hs (list[str]): keys being read.
+            policy (RetentionPolicy): policy for func's datasets.
+        """
+        if not hs:
+            return
+
+        if policy.eviction == "gds" and policy.max_bytes is not None:
+            self._prioritize(pipe, func, hs)
+
+        if not policy.sliding or policy.ttl is None:
+            return
+
+        for h in hs:
+            pipe.expire(h, policy.ttl)
+            pipe.expire(self._chunks_key(h), policy.ttl)
+            pipe.expire(self._parts_key(h), policy.ttl)
+        # XX only updates keys already in the index
+        pipe.zadd(self._index_key(func, "atime"), {h: time.time() for h in hs}, xx=True)
+
+    def _enforce_retention(self, func, policy, written=()):
+        """
+        (private)
+        Removes keys that have expired from the dataset's index, then
+        evicts keys until the dataset is within its byte budget: lowest
+        GreedyDual-Size priority first, or least-recently used first.
+        The check against the budget and the choice of keys are one
+        script, see _EVICT, so concurrent writers don't evict twice.
+
+        Args:
+        -----
+            func (function | str): Query function used, or its name
+            policy (RetentionPolicy): policy for func's datasets.
+            written (list[str]): keys just written, which are never evicted.
+
+        Returns:
+        --------
+            int: number of keys evicted.
+        """
+        name = func if isinstance(func, str) else func.__name__
+        atime_key = self._index_key(func, "atime")
+
+        # keys that haven't been touched for a ttl have been expired by Redis.
+        if policy.ttl is not None:
+            expired = self._redis.zrangebyscore(atime_key, "-inf", time.time() - policy.ttl)
+            if expired:
+                self._forget(expired, name=name)
+
+        if policy.max_bytes is None:
+            return 0
+
+        priority_key, credit_key = self._gds_keys(name)
+        keys = [self._index_key(name, "size"), self._index_key(name, "bytes"), atime_key, priority_key, credit_key]
+        args = [policy.max_bytes, "1" if policy.eviction == "gds" else ""] + list(written)
+        evict = self._evict(keys=keys, args=args)
+        if not evict:
+            return 0
+
+        self._spill(func, evict)
+
+        pipe = self._pipeline(transaction=True)
+        self._delete(pipe, evict + [self._chunks_key(k) for k in evict] + [self._parts_key(k) for k in evict])
+        self._forget(evict, pipe=pipe, name=name)
+        pipe.execute()
+
+        logging.info(f"CACHE_RETENTION - {name} - EVICTED {len(evict)} KEYS")
+        return len(evict)
+
+    def _spill(self, func, hs):
+        """
+        (private)
+        Copies keys from Redis to the disk tier, if it's enabled.
+
+        Args:
+        -----
+            func (function | str): Query function used, or its name
+            hs (list[str | bytes]): data keys.
+
+        Returns:
+        --------
+            int: number of keys spilled.
+        """
+        if not _disk_tier.enabled or not hs:
+            return 0
+
+        spilled = 0
+        for h, r in zip(hs, self._mget(hs)):
+            r = self._resolve(h, r)
+            if r is None:
+                continue
+            try:
+                spilled += _disk_tier.put(h, deserialize_df(compression.decompress(r)))
+            except:
                 e = sys.exc_info()[0]
                 logging.error(e)
 
-        return out_df
+        name = func if isinstance(func, str) else func.__name__
+        logging.info(f"CACHE_DISK_TIER - {name} - SPILLED {spilled} KEYS")
+        return spilled
+
+    def _serialize(self, data):
+        """
+        (private)
+        Converts a value to the bytes stored in Redis.
+        DataFrames are written in Arrow IPC format, str is utf-8 encoded.
+        Values over the compression threshold are then compressed.
+
+        Args:
+        -----
+            data (pd.DataFrame | bytes | str): value to store.
+
+        Returns:
+        --------
+            bytes: value ready for Redis.
+        """
+        if isinstance(data, pd.DataFrame):
+            data = serialize_df(data)
+        elif isinstance(data, str):
+            data = data.encode("utf-8")
+
+        return compression.compress(data, self._codec, self._compression_threshold)
+
+    def _with_header(self, df, column, schema):
+        """
+        (private)
+        Shallow copy of a frame carrying its header, stored with it.
+
+        Args:
+        -----
+            df (pd.DataFrame): frame, sorted by 'column'.
+            column (str | None): column the frame is sorted by, None if unsorted.
+            schema (str): fingerprint of the query function.
+
+        Returns:
+        --------
+            pd.DataFrame: frame with attrs["header"], see partitions.header.
+        """
+        df = df.copy(deep=False)
+        df.attrs["header"] = partitions.header(column, df, schema)
+        return df
+
+    def set(self, func, repo, data):
+        """Sets redis value as data at name=hash(func, repo)
+
+        Args:
+            func (function): Query function used
+            repo (int): repo_id of repo
+            data (pd.DataFrame): data for repo, serialized before storage.
+
+        Returns:
+            boolean: confirmation of successful set operation.
+        """
+
+        # single set is a bulk-set of one
+        return self.setm(func=func, repos=[repo], datas=[data])
+
+    def setm(self, func, repos, datas, cost=None):
+        """Sets many redis value as data at name=hash(func, repo)
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            data (list[pd.DataFrame]): list of data per repo, serialized before storage.
+            cost (float | None): seconds the query of all repos took. It's
+                shared out by rows returned per repo, and recorded for
+                cost-aware eviction, see RetentionPolicy.eviction.
+
+        Returns:
+            list[boolean]: confirmations of successful set operations.
+        """
+
+        # create hashes for each (func, repo_id) pair
+        hs = [self._get_hash(func, r) for r in repos]
+
+        # new version for each key invalidates in-process copies
+        versions = [uuid.uuid4().hex for _ in hs]
+
+        # frames of time-partitioned datasets are stored sorted, per partition,
+        # under a manifest of them with their headers, see partitions.py
+        column = partitions.column_for(func)
+        schema = self._fingerprint(func)
+        ds, parts = [], {}
+        for h, v, data in zip(hs, versions, datas):
+            if not isinstance(data, pd.DataFrame):
+                ds.append(self._serialize(data))
+                continue
+            if column is None:
+                ds.append(self._serialize(self._with_header(data, None, schema)))
+                continue
+            d, parts[h] = self._partition(data, column, schema, v)
+            ds.append(d)
+
+        # high-water marks for incremental refresh
+        marks = None
+        spec = refresh.spec_for(func)
+        if spec is not None:
+            marks = [refresh.watermark(spec, d) if isinstance(d, pd.DataFrame) else None for d in datas]
+            marks = [None if m is None else m.isoformat() for m in marks]
+
+        # each repo's share of the query time, at least an even share of a row's
+        costs = None
+        if cost is not None:
+            rows = [len(d) if isinstance(d, pd.DataFrame) else 0 for d in datas]
+            costs = [cost * (n + 1) / (sum(rows) + len(rows)) for n in rows]
+
+        return self._write(func.__name__, hs, ds, versions, marks, parts, costs=costs)
+
+    def _partition(self, data, column, schema, version):
+        """
+        (private)
+        Splits a frame into its time partitions, sorted and serialized
+        with their headers, under a manifest of them, see partitions.py.
+
+        Args:
+        -----
+            data (pd.DataFrame): frame to store.
+            column (str): partition column.
+            schema (str): fingerprint of the query function's output version.
+            version (str): version of the value.
+
+        Returns:
+        --------
+            (bytes, dict[str, bytes]): manifest to store under the data key,
+                and the serialized partitions by label.
+        """
+        split = partitions.split(column, partitions.sort(column, data))
+        split = {l: self._with_header(p, column, schema) for l, p in split.items()}
+        parts = {l: self._serialize(p) for l, p in split.items()}
+        headers = {l: p.attrs["header"] for l, p in split.items()}
+        return partitions.manifest({l: (version, len(p)) for l, p in parts.items()}, headers), parts
+
+    def _write(self, name, hs, ds, versions, marks=None, parts=None, replace_parts=True, costs=None):
+        """
+        (private)
+        Stores serialized values under data keys with their versions
+        and watermarks, applying the dataset's retention policy.
+
+        Args:
+        -----
+            name (str): query function name.
+            hs (list[str]): data keys.
+            ds (list[bytes]): serialized, compressed values.
+            versions (list[str | bytes]): version of each value.
+            marks (list[str | None] | None): watermark of each value, None
+                if the dataset type has no watermarks.
+            parts (dict[str, dict[str, bytes]] | None): partitions written
+                per partitioned value, whose manifest is in ds.
+            replace_parts (bool): drop the partitions a partitioned value
+                had before, rather than only overwriting those in parts.
+            costs (list[float | None] | None): seconds each value took to
+                query, None keeps a key's recorded cost.
+
+        Returns:
+        --------
+            list[boolean]: confirmations of successful set operations.
+        """
+        ds = list(ds)
+        parts = parts or {}
+
+        # partitioned values count the bytes of all their partitions
+        sizes = {}
+        for h, d in zip(hs, ds):
+            manifest = partitions.parse(d)
+            sizes[h] = len(d) + (sum(size for _, size in manifest["parts"].values()) if manifest else 0)
+
+        policy = retention.policy_for(name)
+        now = time.time()
+
+        # large values are written chunk by chunk ahead of the transaction,
+        # and replaced by their manifest. partition manifests are read whole.
+        chunked = {}
+        for i, (h, d) in enumerate(zip(hs, ds)):
+            if len(d) > CHUNK_BYTES and not d.startswith(partitions.MAGIC):
+                ds[i] = self._write_chunks(h, d, policy)
+                chunked[h] = ds[i]
+
+        # bulk-set keys to values in Redis with their expiry and index
+        # entries in one transaction, so no key is ever left without a ttl.
+        # on a cluster this is a plain batch, one MSET per slot.
+        pipe = self._pipeline(transaction=True)
+        for g in self._slot_groups(hs):
+            pipe.mset({hs[i]: ds[i] for i in g})
+        if policy.ttl is not None:
+            for h in hs:
+                pipe.expire(h, policy.ttl)
+
+        # values that aren't chunked anymore leave no chunks behind, once
+        # readers of the value they replace have had time to finish
+        for h in hs:
+            if h not in chunked:
+                pipe.expire(self._chunks_key(h), CHUNK_GRACE)
+
+        # likewise for partitions
+        self._delete(pipe, [self._parts_key(h) for h in hs if h not in parts or replace_parts])
+        for h, ps in parts.items():
+            if ps:
+                pipe.hset(self._parts_key(h), mapping=ps)
+            if policy.ttl is not None:
+                pipe.expire(self._parts_key(h), policy.ttl)
+
+        pipe.zadd(self._index_key(name, "atime"), {h: now for h in hs})
+        self._record_sizes(pipe, name, sizes)
+
+        if policy.eviction == "gds" and policy.max_bytes is not None:
+            costs = costs or [None] * len(hs)
+            credits = [None if c is None else c / max(sizes[h], 1) for h, c in zip(hs, costs)]
+            defaults = [DEFAULT_QUERY_COST / max(sizes[h], 1) for h in hs]
+            self._prioritize(pipe, name, hs, credits, defaults)
+
+        for g in self._bucket_groups(hs):
+            pipe.hset(self._version_key(name, hs[g[0]]), mapping={hs[i]: versions[i] for i in g})
+
+        if marks is not None:
+            wm = {h: m for h, m in zip(hs, marks) if m is not None}
+            if wm:
+                pipe.hset(self._index_key(name, "watermark"), mapping=wm)
+            if len(wm) < len(hs):
+                pipe.hdel(self._index_key(name, "watermark"), *[h for h in hs if h not in wm])
+
+        # tag each key by repo, dataset and schema for bulk invalidation
+        for h in hs:
+            for tag in self._tags(h):
+                pipe.sadd(tag, h)
+
+        # work is done, release pending markers
+        self._delete(pipe, [self._pending_key(h) for h in hs])
+
+        # announce to waiters
+        pipe.publish(self._ready_channel(name), "\n".join(hs))
+
+        _metrics.incr(name, "bytes_written", sum(sizes.values()))
+        _metrics.flush(pipe)
+        acks = pipe.execute()[0]
+
+        # chunks of the values these manifests replaced
+        for h, manifest in chunked.items():
+            self._drop_stale_chunks(h, manifest)
+
+        # spilled copies are stale now
+        if _disk_tier.enabled:
+            for h in hs:
+                _disk_tier.remove(h)
+
+        self._enforce_retention(name, policy, hs)
+
+        # from redis docs: "(Return is) always OK since MSET can't fail."
+        return acks
+
+    def get(self, func, repo):
+        """Get redis value as data at name=hash(func, repo)
+
+        Args:
+            func (function): Query function used
+            repo (int): list of repo_id of repo
+
+        Returns:
+            bytes | None: decompressed value, None if Nil.
+        """
+
+        # single get is a bulk-get of one
+        return self.getm(func=func, repos=[repo])[0]
+
+    def getm(self, func, repos):
+        """Gets many redis value as data at name=hash(func, repo)
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            list[bytes | None]: list of decompressed values, None if Nil.
+        """
+
+        # create hashes for each (func, repo_id) pair
+        hs = [self._get_hash(func, r) for r in repos]
+
+        policy = retention.policy_for(func)
+
+        # bulk-get values from keys in Redis, refreshing their
+        # expiry in the same round trip if policy is sliding.
+        groups = self._slot_groups(hs)
+        pipe = self._redis.pipeline(transaction=False)
+        for g in groups:
+            pipe.mget([hs[i] for i in g])
+        self._touch(pipe, func, hs, policy)
+        results = pipe.execute()
+
+        values = [None] * len(hs)
+        for g, vs in zip(groups, results):
+            for i, v in zip(g, vs):
+                values[i] = v
+
+        # reassemble chunked values, decompress
+        rs = [compression.decompress(self._resolve(h, r)) for h, r in zip(hs, values)]
+
+        # return results
+        return rs
+
+    def exists(self, func, repo):
+        """Checks whether key is in Redis for hash(func, repo)
+
+        Args:
+            func (function): Query function used
+            repo (int): repo_id of repo
+
+        Returns:
+            int: number of names that exist
+        """
+
+        # convert single value into a list
+        repo = [repo]
+
+        # pass to exists_many, processes as a list.
+        return self.existsm(func, repo)
+
+    def existsm(self, func, repos):
+        """Checks whether keys are in Redis for hash(func, repo)
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            int: number of names that exist
+        """
+
+        # create hashes for each (func, repo_id) pair
+        hs = [self._get_hash(func, r) for r in repos]
+
+        # bulk-check keys in Redis, one EXISTS per slot
+        pipe = self._redis.pipeline(transaction=False)
+        for g in self._slot_groups(hs):
+            pipe.exists(*[hs[i] for i in g])
+        n = sum(pipe.execute())
+
+        # return results
+        return n
+
+    def missing(self, func, repos):
+        """Repos whose data isn't in Redis, all checked in a single round trip.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            list[int]: repos not cached, in the order of repos.
+        """
+        hs = [self._get_hash(func, r) for r in repos]
+        gone = self._missing(hs) if hs else set()
+        return [r for r, h in zip(repos, hs) if h in gone]
+
+    def grabm(self, func, repos, promote=True, start=None, end=None):
+        """Checks to see if data is ready and builds aggregate
+        DataFrame to return to callback. Presence, versions and
+        values are read in one round trip by a Lua script.
+
+        Datasets partitioned by time (see partitions.py) can be read over a
+        time range, fetching only the partitions that overlap it. Their
+        rows come back sorted by the partition column, with the header of
+        the result in attrs["header"].
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            promote (bool): restore missing repos from the disk tier and retry once.
+            start (str | pd.Timestamp | None): earliest time of rows wanted, None for no bound.
+            end (str | pd.Timestamp | None): time after the latest rows wanted, None for no bound.
+
+        Returns:
+            pd.DataFrame | None: Data if all available, with column types preserved.
+        """
+        df, missing = self._grab(func, repos, partial=False, promote=promote, start=start, end=end)
+        return None if missing else df
+
+    def grabm_partial(self, func, repos, promote=True, start=None, end=None):
+        """Like grabm, but builds the aggregate DataFrame of whichever
+        repos are available rather than none unless all are, so large
+        selections can be shown while their slowest repos are queried.
+        See docs/new_fig_guidance.md for a card drawn this way.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            promote (bool): restore missing repos from the disk tier and retry once.
+            start (str | pd.Timestamp | None): earliest time of rows wanted, None for no bound.
+            end (str | pd.Timestamp | None): time after the latest rows wanted, None for no bound.
+
+        Returns:
+            (pd.DataFrame, list[int]): Data of available repos, and repos missing.
+        """
+        return self._grab(func, repos, partial=True, promote=promote, start=start, end=end)
+
+    def _grab(self, func, repos, partial, promote, start=None, end=None):
+        """
+        (private)
+        Reads and deserializes repos' datasets for grabm and grabm_partial.
+
+        Args:
+        -----
+            func (function): Query function used
+            repos (list[int]): list of repo_ids of repos
+            partial (bool): read whichever repos are present, rather than none unless all are.
+            promote (bool): restore missing repos from the disk tier and retry once.
+            start (str | pd.Timestamp | None): earliest time of rows wanted, None for no bound.
+            end (str | pd.Timestamp | None): time after the latest rows wanted, None for no bound.
+
+        Returns:
+        --------
+            (pd.DataFrame | None, list[int]): Data, and repos missing. Unless
+                partial, data is None and every repo counts as missing if any is.
+        """
+        column, ranged = self._range_column(func, start, end)
+
+        # presence, current versions, and values of keys whose version
+        # isn't held locally, all in one round trip- one script call per
+        # hash tag, as a script can only touch keys of one slot.
+        hs = [self._get_hash(func, r) for r in repos]
+        groups, calls = self._fetch_calls(func, hs, partial)
+        pipe = self._redis.pipeline(transaction=False)
+        for keys, args in calls:
+            self._check_and_fetch(keys=keys, args=args, client=pipe)
+        self._touch(pipe, func, hs, retention.policy_for(func))
+        _metrics.flush(pipe)
+        try:
+            replies = pipe.execute()[: len(groups)]
+        except NoScriptError:
+            # a cluster node lost its scripts, e.g. after a failover
+            self._redis.script_load(_CHECK_AND_FETCH)
+            self._redis.script_load(_GDS_PRIORITIZE)
+            self._redis.script_load(_RELEASE_HELD)
+            self._redis.script_load(_RESIZE)
+            self._redis.script_load(_EVICT)
+            return self._grab(func, repos, partial, promote, start, end)
+
+        versions, values, missing = self._fetched(func, hs, groups, replies)
+
+        # missing repos may have been spilled to disk
+        if missing and promote and _disk_tier.enabled:
+            if self.promote(func, repos if versions is None else [repos[i] for i in missing]):
+                return self._grab(func, repos, partial, False, start, end)
+        if versions is None:
+            return None, list(repos)
+
+        frames, present, to_load = self._held_frames(func, hs, versions, values, missing)
+
+        if to_load:
+            with _local_cache.loading([hs[i] for i in to_load]):
+                # another thread may have loaded them while we waited
+                for i in to_load:
+                    frames[i] = _local_cache.get(hs[i], versions[i])
+                to_load = [i for i in to_load if frames[i] is None]
+
+                # held frames evicted since the round trip are re-read
+                refetch = [i for i in to_load if values[i] is None]
+                if refetch:
+                    for i, r in zip(refetch, self._mget([hs[i] for i in refetch])):
+                        values[i] = r
+
+                payloads, layout, parts, fetch = self._plan_load(hs, to_load, values, start, end)
+
+                # whole values, reassembled if chunked
+                gone = []
+                for i in list(payloads):
+                    payloads[i] = self._resolve(hs[i], payloads[i])
+                    if payloads[i] is None:
+                        del payloads[i]
+                        gone.append(i)
+
+                # partitions not held locally, one HMGET per key
+                if fetch:
+                    pipe = self._redis.pipeline(transaction=False)
+                    for i, ls in fetch.items():
+                        pipe.hmget(self._parts_key(hs[i]), ls)
+                    gone += self._fetched_parts(fetch, pipe.execute(), payloads, layout)
+
+                if gone:
+                    # value, its chunks or partitions removed since presence check
+                    if not partial:
+                        return None, list(repos)
+                    missing += gone
+
+                _metrics.incr(func.__name__, "bytes_read", sum(len(r) for r in payloads.values()))
+                decoded = self._decode(func, payloads)
+                self._assemble(hs, to_load, versions, values, layout, parts, fetch, decoded, frames, ranged)
+
+        _metrics.incr(func.__name__, "local_hits", len(present) - len(to_load))
+        return self._combine(repos, frames, missing, column, start, end)
+
+    def _range_column(self, func, start, end):
+        """
+        (private)
+        Partition column of func and whether a time range was given,
+        raising ValueError if func's datasets can't be read by range.
+        """
+        column = partitions.column_for(func)
+        ranged = start is not None or end is not None
+        if ranged and column is None:
+            raise ValueError(f"{func.__name__} isn't partitioned by time, it can't be read by range")
+        return column, ranged
+
+    def _fetch_calls(self, func, hs, partial):
+        """
+        (private)
+        Check-and-fetch script calls reading data keys, one per hash tag.
+        Keys whose version is held in this process aren't transferred.
+
+        Args:
+        -----
+            func (function): Query function used
+            hs (list[str]): data keys.
+            partial (bool): read whichever keys are present, rather than none unless all are.
+
+        Returns:
+        --------
+            (list[list[int]], list[(list[str], list[bytes])]): groups of
+                indexes into hs, and the keys and args of each group's call.
+        """
+        # versions of frames already deserialized in this process
+        held = [_local_cache.version(h) or b"" for h in hs]
+
+        groups = self._bucket_groups(hs)
+        calls = []
+        for g in groups:
+            keys = [hs[i] for i in g] + [self._version_key(func, hs[g[0]])]
+            calls.append((keys, ["1" if partial else ""] + [held[i] for i in g]))
+        return groups, calls
+
+    def _fetched(self, func, hs, groups, replies):
+        """
+        (private)
+        Versions and values from check-and-fetch replies, recording hit metrics.
+
+        Args:
+        -----
+            func (function): Query function used
+            hs (list[str]): data keys.
+            groups (list[list[int]]): groups of indexes into hs, see _fetch_calls.
+            replies (list[list]): script reply of each group.
+
+        Returns:
+        --------
+            (list | None, list | None, list[int]): versions and values per key,
+                both None if keys are missing and the read isn't partial, and
+                indexes of missing keys.
+        """
+        if any(reply[0] == 0 for reply in replies):
+            present = sum(reply[1] if reply[0] == 0 else len(g) for g, reply in zip(groups, replies))
+            _metrics.incr(func.__name__, "partial_hits" if present > 0 else "misses")
+            return None, None, list(range(len(hs)))
+
+        versions, values = [None] * len(hs), [None] * len(hs)
+        for g, reply in zip(groups, replies):
+            for j, i in enumerate(g):
+                versions[i], values[i] = reply[1 + 2 * j], reply[2 + 2 * j]
+
+        # only partial reads get this far with keys missing
+        missing = [i for i in range(len(hs)) if versions[i] is None and values[i] is None]
+        if missing:
+            _metrics.incr(func.__name__, "partial_hits" if len(missing) < len(hs) else "misses")
+        else:
+            _metrics.incr(func.__name__, "hits")
+
+        return versions, values, missing
+
+    def _held_frames(self, func, hs, versions, values, missing):
+        """
+        (private)
+        Frames held in this process at their current version.
+
+        Returns:
+        --------
+            (list[pd.DataFrame | None], list[int], list[int]): frame per key,
+                indexes of keys present, and of those that need loading.
+        """
+        gone = set(missing)
+        present = [i for i in range(len(hs)) if i not in gone]
+        _metrics.read(func.__name__, [hs[i] for i in present])
+
+        frames = [None] * len(hs)
+        for i in present:
+            frames[i] = _local_cache.get(hs[i], versions[i]) if values[i] is None else None
+        return frames, present, [i for i in present if frames[i] is None]
+
+    def _plan_load(self, hs, to_load, values, start, end):
+        """
+        (private)
+        Splits the keys to load into whole values and partitions. Partitioned
+        values are read partition by partition, see partitions.py; ranged
+        reads only read those in range, and reuse partitions held locally.
+
+        Returns:
+        --------
+            (dict, dict, dict, dict): position -> whole value, position ->
+                labels of partitions read, (position, label) -> frame held
+                locally or None, position -> labels to fetch.
+        """
+        ranged = start is not None or end is not None
+        payloads, layout, parts, fetch = {}, {}, {}, {}
+        for i in to_load:
+            manifest = partitions.parse(values[i])
+            if manifest is None:
+                payloads[i] = values[i]
+                continue
+
+            layout[i] = partitions.labels(manifest, start, end)
+            for l in layout[i]:
+                v = manifest["parts"][l][0].encode("utf-8")
+                parts[(i, l)] = _local_cache.get(self._part_cache_key(hs[i], l), v) if ranged else None
+                if parts[(i, l)] is None:
+                    fetch.setdefault(i, []).append(l)
+
+        return payloads, layout, parts, fetch
+
+    def _fetched_parts(self, fetch, replies, payloads, layout):
+        """
+        (private)
+        Adds fetched partitions to payloads, keyed (position, label).
+
+        Returns:
+        --------
+            list[int]: positions whose partitions were removed meanwhile.
+        """
+        gone = []
+        for (i, ls), rs in zip(fetch.items(), replies):
+            if any(r is None for r in rs):
+                gone.append(i)
+                del layout[i]
+                continue
+            payloads.update({(i, l): r for l, r in zip(ls, rs)})
+        return gone
+
+    def _assemble(self, hs, to_load, versions, values, layout, parts, fetch, decoded, frames, ranged):
+        """
+        (private)
+        Fills frames with decoded values, combining partitions, and keeps
+        them in the in-process cache: whole frames under their key, or
+        for ranged reads, each partition read.
+        """
+        for i in to_load:
+            if i in layout:
+                ps = [parts[(i, l)] if parts[(i, l)] is not None else decoded[(i, l)] for l in layout[i]]
+                if any(p is None for p in ps):
+                    continue
+                frames[i] = partitions.join(ps)
+
+                if not ranged:
+                    _local_cache.put(hs[i], versions[i], frames[i])
+                    continue
+                manifest = partitions.parse(values[i])
+                for l in fetch.get(i, []):
+                    v = manifest["parts"][l][0].encode("utf-8")
+                    _local_cache.put(self._part_cache_key(hs[i], l), v, decoded[(i, l)])
+            elif i in decoded:
+                frames[i] = decoded[i]
+                if frames[i] is not None:
+                    _local_cache.put(hs[i], versions[i], frames[i])
+
+    def _combine(self, repos, frames, missing, column, start, end):
+        """
+        (private)
+        Rows in range of all frames: time-partitioned datasets merged in
+        time order, see partitions.merge, others concatenated once in the
+        order of repos.
+
+        Returns:
+        --------
+            (pd.DataFrame, list[int]): data, and repos missing.
+        """
+        missing = [repos[i] for i in sorted(missing)]
+        frames = [f for f in frames if f is not None]
+        if not frames:
+            return pd.DataFrame(), missing
+
+        if column is None:
+            return concat_frames(frames), missing
+
+        df = partitions.merge(column, frames)
+        if start is not None or end is not None:
+            schema = df.attrs["header"]["schema"]
+            df = partitions.select(column, df, start, end)
+            df.attrs["header"] = partitions.header(column, df, schema)
+        return df, missing
+
+    def _decode(self, func, payloads):
+        """
+        (private)
+        Decompresses and deserializes values, concurrently on the
+        decoding threads when there is more than one.
+
+        Args:
+        -----
+            func (function): Query function used
+            payloads (dict[int, bytes]): position in the read -> stored value.
+
+        Returns:
+        --------
+            dict[int, pd.DataFrame | None]: position -> frame, None if it
+                couldn't be deserialized.
+        """
+
+        def decode(r):
+            start = time.perf_counter()
+            try:
+                return deserialize_df(compression.decompress(r))
+            except:
+                # some values are empty and aren't deserializable
+                e = sys.exc_info()[0]
+                logging.error(e)
+                return None
+            finally:
+                _metrics.incr(func.__name__, "decode_seconds", time.perf_counter() - start)
+
+        if len(payloads) < 2 or DECODE_THREADS < 2:
+            return {i: decode(r) for i, r in payloads.items()}
+
+        return dict(zip(payloads.keys(), _get_decoder().map(decode, payloads.values())))
+
+    def watermarks(self, func, repos):
+        """High-water marks of cached datasets: the latest timestamp in
+        their refresh spec's watermark columns when they were written.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            dict[int, str | None]: repo -> ISO timestamp, None if not cached
+                or the dataset has no mark.
+        """
+        hs = [self._get_hash(func, r) for r in repos]
+        marks = self._redis.hmget(self._index_key(func, "watermark"), hs) if hs else []
+        return {r: m.decode("utf-8") if m is not None else None for r, m in zip(repos, marks)}
+
+    def headers(self, func, repos):
+        """Headers of cached datasets: the column they're sorted by, row
+        count, earliest and latest time, and schema version, see
+        partitions.header. Partitioned datasets' are read from their
+        manifests, so none of their partitions are. Others' are read from
+        their values' schema: the value is still fetched and decompressed
+        whole, but its rows aren't decoded.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            dict[int, dict | None]: repo -> header, None if not cached or
+                written without one.
+        """
+        hs = [self._get_hash(func, r) for r in repos]
+        values = self._mget(hs) if hs else []
+
+        headers = {}
+        for r, h, v in zip(repos, hs, values):
+            manifest = partitions.parse(v)
+            if manifest is not None:
+                hd = manifest.get("headers") or {}
+                headers[r] = partitions.combine([hd.get(l) for l in partitions.labels(manifest)])
+                continue
+            v = self._resolve(h, v)
+            headers[r] = None if v is None else read_header(compression.decompress(v))
+        return headers
+
+    def upsert(self, func, repos, datas):
+        """Merges rows changed since each repo's watermark into its cached
+        frame, replacing cached rows with the same primary key, see
+        cache_manager/refresh.py. Time-partitioned values only rewrite the
+        partitions the rows fall in, see cache_manager/partitions.py.
+
+        Repos whose cached frame has gone, e.g. expired since the refresh
+        was enqueued, are dropped rather than set to the changed rows
+        alone: their markers are released and their watermarks cleared, so
+        the next warm-up queries them in full.
+
+        Callers hold the repos' pending markers (see 'claim') so that no
+        other write lands between the read and the write back.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            data (list[pd.DataFrame]): rows changed per repo.
+
+        Returns:
+            list[boolean]: confirmations of successful set operations.
+        """
+        spec = refresh.spec_for(func)
+        if spec is None:
+            raise ValueError(f"{func.__name__} has no refresh spec, it can't be upserted")
+
+        # rows changed since a mark are only part of a frame that's gone
+        missing = self._missing({self._get_hash(func, r) for r in repos})
+        gone = [r for r in repos if self._get_hash(func, r) in missing]
+        self._drop_gone(func, gone)
+
+        # nothing changed, the cached frames stay as they are
+        unchanged = [r for r, d in zip(repos, datas) if d.empty and r not in gone]
+        self.release(func, unchanged)
+
+        changed = [(r, d) for r, d in zip(repos, datas) if r not in unchanged and r not in gone]
+        if not changed:
+            return True
+
+        # partitioned values only rewrite the partitions changed rows fall in
+        manifests = {}
+        column = partitions.column_for(func)
+        if column is not None:
+            hs = [self._get_hash(func, r) for r, _ in changed]
+            manifests = {r: m for (r, _), m in zip(changed, map(partitions.parse, self._mget(hs))) if m is not None}
+            in_parts = [(r, d) for r, d in changed if r in manifests]
+            if in_parts:
+                self._upsert_parts(func, spec, column, in_parts, [manifests[r] for r, _ in in_parts])
+
+        whole = [(r, d) for r, d in changed if r not in manifests]
+        if not whole:
+            return True
+        repos, datas = [r for r, _ in whole], [d for _, d in whole]
+
+        kept, merged, gone = [], [], []
+        for r, delta, cached in zip(repos, datas, self.getm(func, repos)):
+            # evicted since it was checked
+            if cached is None:
+                gone.append(r)
+                continue
+            kept.append(r)
+            merged.append(refresh.merge(spec, deserialize_df(cached), delta))
+        self._drop_gone(func, gone)
+
+        if not kept:
+            return True
+        return self.setm(func, kept, merged)
+
+    def _drop_gone(self, func, repos):
+        """
+        (private)
+        Gives up upserting into repos whose cached frames have gone:
+        releases their pending markers and forgets their index entries,
+        watermark included, so they're re-queried in full.
+
+        Args:
+        -----
+            func (function): Query function used
+            repos (list[int]): repos whose cached frames are missing.
+        """
+        if not repos:
+            return
+        self._forget([self._get_hash(func, r) for r in repos], name=func.__name__)
+        self.release(func, repos)
+        logging.info(f"CACHE_UPSERT - {func.__name__} - DROPPED {len(repos)} REPOS NO LONGER CACHED")
+
+    def _upsert_parts(self, func, spec, column, changed, manifests):
+        """
+        (private)
+        Upserts rows into partitioned values, reading and rewriting only
+        the partitions they fall in. The others keep their versions, so
+        processes holding them keep using them.
+
+        Args:
+        -----
+            func (function): Query function used
+            spec (RefreshSpec): dataset's refresh spec.
+            column (str): partition column.
+            changed (list[(int, pd.DataFrame)]): repo and rows changed, per repo.
+            manifests (list[dict]): each repo's current partition manifest.
+
+        Returns:
+        --------
+            list[boolean]: confirmations of successful set operations.
+        """
+        repos = [r for r, _ in changed]
+        hs = [self._get_hash(func, r) for r in repos]
+        splits = [{l: p for l, p in partitions.split(column, d).items() if not p.empty} for _, d in changed]
+
+        # cached partitions the changed rows fall in, in one round trip
+        pipe = self._redis.pipeline(transaction=False)
+        for h, ps in zip(hs, splits):
+            pipe.hmget(self._parts_key(h), list(ps))
+        cached = pipe.execute()
+
+        # a partition the manifest lists but that has gone would be
+        # replaced by the changed rows alone
+        gone = [
+            i
+            for i, (m, ps, cs) in enumerate(zip(manifests, splits, cached))
+            if any(c is None and l in m["parts"] for l, c in zip(ps, cs))
+        ]
+        if gone:
+            self._drop_gone(func, [repos[i] for i in gone])
+            keep = [i for i in range(len(repos)) if i not in gone]
+            if not keep:
+                return True
+            repos, hs, manifests, splits, cached, changed = (
+                [xs[i] for i in keep] for xs in (repos, hs, manifests, splits, cached, changed)
+            )
+
+        old_marks = self.watermarks(func, repos)
+        versions = [uuid.uuid4().hex for _ in hs]
+        ds, parts, marks = [], {}, []
+        schema = self._fingerprint(func)
+        for h, r, v, manifest, ps, cs, (_, delta) in zip(hs, repos, versions, manifests, splits, cached, changed):
+            parts[h] = {}
+            for (l, rows), c in zip(ps.items(), cs):
+                c = deserialize_df(compression.decompress(c)) if c is not None else None
+                merged = self._with_header(partitions.sort(column, refresh.merge(spec, c, rows)), column, schema)
+                parts[h][l] = self._serialize(merged)
+                manifest["parts"][l] = (v, len(parts[h][l]))
+                if "headers" in manifest:
+                    manifest["headers"][l] = merged.attrs["header"]
+            ds.append(partitions.manifest(manifest["parts"], manifest.get("headers")))
+
+            # rows only move the mark forward
+            ms = [refresh.watermark(spec, delta), old_marks[r]]
+            ms = [pd.Timestamp(m) for m in ms if m is not None]
+            marks.append(max(ms).isoformat() if ms else None)
+
+        return self._write(func.__name__, hs, ds, versions, marks, parts, replace_parts=False)
+
+    def promote(self, func, repos):
+        """Restores datasets that aren't in Redis from the disk tier,
+        writing them back as if they'd just been queried.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            list[int]: repos restored.
+        """
+        if not _disk_tier.enabled or not repos:
+            return []
+
+        hs = {self._get_hash(func, r): r for r in repos}
+        missing = self._missing(hs.keys())
+
+        restored, datas = [], []
+        for h in missing:
+            df = _disk_tier.get(h)
+            if df is not None:
+                restored.append(hs[h])
+                datas.append(df)
+
+        if restored:
+            self.setm(func, restored, datas)
+            logging.info(f"CACHE_DISK_TIER - {func.__name__} - PROMOTED {len(restored)} KEYS")
+
+        return restored
+
+    def spill_expiring(self, funcs=None):
+        """Copies keys about to expire from Redis, within DISK_SPILL_MARGIN
+        of their ttl, to the disk tier, so a later read promotes them
+        rather than re-querying. Run periodically, see cache_warming.py.
+
+        Args:
+            funcs (list[function | str] | None): dataset types, None for all.
+
+        Returns:
+            int: number of keys spilled.
+        """
+        if not _disk_tier.enabled:
+            return 0
+
+        if funcs is None:
+            funcs = self._dataset_names()
+
+        now = time.time()
+        spilled = 0
+        for func in funcs:
+            policy = retention.policy_for(func)
+            if policy.ttl is None:
+                continue
+            expiring = self._redis.zrangebyscore(
+                self._index_key(func, "atime"), now - policy.ttl, now - policy.ttl + DISK_SPILL_MARGIN
+            )
+            spilled += self._spill(func, [k for k in expiring if not _disk_tier.has(k)])
+
+        logging.info(f"CACHE_DISK_TIER - SPILLED {spilled} EXPIRING KEYS")
+        return spilled
+
+    def cached_repos(self, func):
+        """Repos that have data cached for a dataset type.
+
+        Args:
+            func (function): Query function used
+
+        Returns:
+            list[int]: repo_ids of repos.
+        """
+        repos = {}
+        for k in self._redis.zrange(self._index_key(func, "atime"), 0, -1):
+            tags = self._tags(k)
+            if tags:
+                # repo tag is "tag:repo:{repo}"
+                r = tags[0].split(":", 2)[2]
+                r = int(r) if r.isdigit() else r
+
+                # keys of older schema versions don't count
+                if k.decode("utf-8") == self._get_hash(func, r):
+                    repos[k.decode("utf-8")] = r
+
+        # keys that expired leave their index entries behind
+        gone = self._missing(repos.keys())
+        self._forget(list(gone), name=func.__name__)
+        return [r for h, r in repos.items() if h not in gone]
+
+    def wait_for(self, func, repos, timeout=None, recheck=10.0):
+        """Blocks until data for all repos is available and returns
+        it as an aggregate DataFrame, like 'grabm'.
+
+        Rather than polling, subscribes to the notifications that
+        set/setm publish when query workers store results. Presence is
+        re-checked every 'recheck' seconds without a notification in case
+        one was missed- pub/sub messages aren't persisted.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            timeout (float | None): seconds to wait before giving up, None waits indefinitely.
+            recheck (float): seconds without a notification before presence is checked directly.
+
+        Returns:
+            pd.DataFrame | None: Data if all available, None if timed out.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        hs = {self._get_hash(func, r) for r in repos}
+
+        while True:
+            if not self._wait_keys(self._ready_channel(func), hs, deadline, recheck):
+                return None
+
+            # keys could be removed between the check and the read,
+            # in which case we go back to waiting.
+            df = self.grabm(func=func, repos=repos)
+            if df is not None:
+                return df
+
+    def grab_figure(self, viz_id, func, repos, params, compute, timeout=None):
+        """Returns the figure for a visualization of 'repos', computing it
+        from the grabm DataFrame only if no identical figure is cached.
+
+        Figures are keyed by visualization, sorted repos, input parameters and
+        the versions of the source datasets, so a rewrite of any repo's data
+        makes a new key. Concurrent requests for the same figure are
+        de-duplicated: one caller computes it while the others wait for it
+        to be published.
+
+        Args:
+            viz_id (str): unique id of the visualization. Change it when the
+                visualization's processing changes to stop serving old figures.
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            params (tuple): all other inputs that the figure depends on.
+            compute (function): pd.DataFrame -> plotly figure.
+            timeout (float | None): seconds to wait before giving up, None waits indefinitely.
+
+        Returns:
+            go.Figure | dict | None: figure, None if timed out.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        hs = [self._get_hash(func, r) for r in sorted(repos)]
+
+        # figure can only be keyed once all data is present
+        if not self._wait_keys(self._ready_channel(func), set(hs), deadline):
+            return None
+
+        versions = self._versions(func, hs)
+        if any(v is None for v in versions):
+            # data written without versions can't be keyed reliably
+            df = self.wait_for(func=func, repos=repos, timeout=self._remaining(deadline))
+            return None if df is None else compute(df)
+
+        fkey = self._figure_key(viz_id, hs, params, versions)
+        lock = f"{fkey}:lock"
+        token = uuid.uuid4().hex
+
+        while True:
+            cached = self._redis.get(fkey)
+            if cached is not None:
+                logging.debug(f"FIGURE_CACHE - {viz_id} - HIT")
+                return json.loads(compression.decompress(cached))
+
+            if self._redis.set(lock, token, nx=True, ex=FIGURE_LOCK_TTL):
+                break
+
+            # another worker is computing this figure- wait for it to be
+            # published, or for its lock to lapse if that worker died.
+            lock_deadline = time.monotonic() + FIGURE_LOCK_TTL
+            if not self._wait_keys(FIGURE_CHANNEL, {fkey}, min(deadline or lock_deadline, lock_deadline)):
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+
+        try:
+            df = self.wait_for(func=func, repos=repos, timeout=self._remaining(deadline))
+            if df is None:
+                return None
+
+            fig = compute(df)
+            fig_json = fig.to_json() if hasattr(fig, "to_json") else json.dumps(fig)
+
+            # store figure and announce to waiters
+            pipe = self._pipeline(transaction=True)
+            pipe.set(fkey, compression.compress(fig_json.encode("utf-8"), self._codec), ex=FIGURE_TTL)
+            pipe.publish(FIGURE_CHANNEL, fkey)
+            pipe.execute()
+
+            return fig
+        finally:
+            # only release the lock if it's still ours. if no figure was
+            # stored, e.g. compute raised, waiters are woken to take the lock.
+            pipe = self._pipeline()
+            self._release_held(keys=[lock], args=[token], client=pipe)
+            pipe.exists(fkey)
+            released, stored = pipe.execute()
+            if released and not stored:
+                self._redis.publish(FIGURE_CHANNEL, fkey)
+
+    def invalidate_tag(self, tag, batch=500):
+        """Deletes every data key in a tag set, in batches so that no
+        single command blocks Redis, then deletes the tag set.
+
+        Args:
+            tag (str): tag set name, see _tags.
+            batch (int): keys deleted per round trip.
+
+        Returns:
+            int: number of keys deleted.
+        """
+
+        deleted = 0
+        keys = list(self._redis.sscan_iter(tag, count=batch))
+
+        for i in range(0, len(keys), batch):
+            ks = keys[i : i + batch]
+            pipe = self._redis.pipeline(transaction=False)
+            n = self._delete(pipe, ks)
+            self._delete(pipe, [self._chunks_key(k) for k in ks] + [self._parts_key(k) for k in ks])
+            self._forget(ks, pipe=pipe)
+            deleted += sum(pipe.execute()[:n])
+
+        self._redis.delete(tag)
+
+        # and their spilled copies
+        kind, _, rest = tag.split(":", 1)[1].partition(":")
+        if kind == "repo":
+            deleted += _disk_tier.invalidate(repo=rest)
+        elif kind == "dataset":
+            deleted += _disk_tier.invalidate(name=rest)
+        elif kind == "schema":
+            name, _, fp = rest.partition(":")
+            deleted += _disk_tier.invalidate(name=name, fingerprint=fp)
+
+        logging.info(f"CACHE_INVALIDATE - {tag} - DELETED {deleted} KEYS")
+        return deleted
+
+    def invalidate_repo(self, repo):
+        """Deletes all datasets of a repo.
+
+        Args:
+            repo (int): repo_id of repo
+
+        Returns:
+            int: number of keys deleted.
+        """
+        return self.invalidate_tag(f"tag:repo:{repo}")
+
+    def invalidate_dataset(self, func):
+        """Deletes all repos' data of a dataset type, every schema version.
+
+        Args:
+            func (function | str): Query function used, or its name
+
+        Returns:
+            int: number of keys deleted.
+        """
+        name = func if isinstance(func, str) else func.__name__
+        return self.invalidate_tag(f"tag:dataset:{name}")
+
+    def invalidate_schema(self, func, fingerprint=None):
+        """Deletes data of a dataset type written by one version of its query.
+        By default, deletes every version other than the current one.
+
+        Args:
+            func (function): Query function used
+            fingerprint (str | None): schema version to delete, None for all stale versions.
+
+        Returns:
+            int: number of keys deleted.
+        """
+        if fingerprint is not None:
+            return self.invalidate_tag(f"tag:schema:{func.__name__}:{fingerprint}")
+
+        current = f"tag:schema:{func.__name__}:{self._fingerprint(func)}"
+        deleted = 0
+        for tag in self._redis.scan_iter(match=f"tag:schema:{func.__name__}:*"):
+            tag = tag.decode("utf-8")
+            if tag != current:
+                deleted += self.invalidate_tag(tag)
+
+        # versions only left on disk
+        for fp in _disk_tier.fingerprints(func.__name__):
+            if fp != self._fingerprint(func):
+                deleted += _disk_tier.invalidate(name=func.__name__, fingerprint=fp)
+
+        return deleted
+
+    def claim(self, func, repos, job_id, lease=None):
+        """Marks a query job as in flight for each repo that doesn't
+        already have one, so concurrent sessions attach to the existing
+        job rather than enqueuing duplicate work.
+
+        Markers are set with SET NX and expire after 'lease' seconds,
+        so the work of an abandoned job is reclaimed automatically.
+        setm removes them when the data is written.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            job_id (str): id of the job that will do the claimed work.
+            lease (int | None): seconds before markers expire, None for PENDING_LEASE.
+
+        Returns:
+            (list[int], dict[int, str]): repos claimed for job_id, and
+                repo -> id of the job already in flight for other repos.
+        """
+        lease = PENDING_LEASE if lease is None else lease
+        pks = [self._pending_key(self._get_hash(func, r)) for r in repos]
+
+        # set-if-absent then read back each marker, in one round trip
+        pipe = self._redis.pipeline(transaction=False)
+        for pk in pks:
+            pipe.set(pk, job_id, nx=True, ex=lease)
+            pipe.get(pk)
+        results = pipe.execute()
+
+        claimed, pending = [], {}
+        for r, owner in zip(repos, results[1::2]):
+            owner = owner.decode("utf-8") if owner is not None else job_id
+            if owner == job_id:
+                claimed.append(r)
+            else:
+                pending[r] = owner
+
+        return claimed, pending
+
+    def release(self, func, repos, job_id=None):
+        """Removes pending markers of repos, for instance when the job
+        holding them has failed and the work should be reclaimed.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            job_id (str | None): only remove markers held by this job.
+
+        Returns:
+            int: number of markers removed.
+        """
+        pks = [self._pending_key(self._get_hash(func, r)) for r in repos]
+        if not pks:
+            return 0
+
+        pipe = self._redis.pipeline(transaction=False)
+        if job_id is None:
+            self._delete(pipe, pks)
+        else:
+            # compare and delete per marker: one key per script, so each
+            # call stays within a single slot on a cluster
+            for pk in pks:
+                self._release_held(keys=[pk], args=[job_id], client=pipe)
+        try:
+            return sum(pipe.execute())
+        except NoScriptError:
+            self._redis.script_load(_RELEASE_HELD)
+            return self.release(func, repos, job_id)
+
+    def _dataset_names(self):
+        """
+        (private)
+        Names of all dataset types with keys in the cache.
+        """
+        names = set()
+        for k in self._redis.scan_iter(match="cache_index:*:size{*}"):
+            names.add(k.decode("utf-8").split(":")[1])
+        return sorted(names)
+
+    def stats(self, funcs=None):
+        """Metrics per dataset type: hits (every repo present), misses
+        (no repo present), partial hits, frames served from the in-process
+        cache, bytes read and written, seconds spent decoding, number of
+        keys and bytes stored.
+
+        Args:
+            funcs (list[function | str] | None): dataset types, None for all.
+
+        Returns:
+            pd.DataFrame: one row per dataset type.
+        """
+        # make sure this process' own buffered increments are counted
+        pipe = self._redis.pipeline(transaction=False)
+        _metrics.flush(pipe)
+        pipe.execute()
+
+        if funcs is None:
+            names = self._dataset_names()
+        else:
+            names = [f if isinstance(f, str) else f.__name__ for f in funcs]
+
+        pipe = self._redis.pipeline(transaction=False)
+        for name in names:
+            pipe.hgetall(stats_key(name))
+            pipe.hvals(self._index_key(name, "size"))
+        results = pipe.execute()
+
+        rows = []
+        for name, counters, sizes in zip(names, results[0::2], results[1::2]):
+            row = {"dataset": name}
+            for c in COUNTERS:
+                v = counters.get(c.encode("utf-8"), b"0")
+                row[c] = float(v) if c == "decode_seconds" else int(float(v))
+            lookups = row["hits"] + row["misses"] + row["partial_hits"]
+            row["hit_ratio"] = row["hits"] / lookups if lookups else None
+            row["keys"] = len(sizes)
+            row["bytes_stored"] = sum(int(v) for v in sizes)
+            rows.append(row)
+
+        return pd.DataFrame(rows, columns=["dataset"] + COUNTERS + ["hit_ratio", "keys", "bytes_stored"])
+
+    def largest_keys(self, func, n=20):
+        """Keys of a dataset type ranked by bytes stored.
+
+        Args:
+            func (function | str): Query function used, or its name
+            n (int): number of keys to return.
+
+        Returns:
+            list[(str, int)]: (key, bytes) largest first.
+        """
+        sizes = self._redis.hgetall(self._index_key(func, "size"))
+        ranked = sorted(((k.decode("utf-8"), int(v)) for k, v in sizes.items()), key=lambda kv: -kv[1])
+        return ranked[:n]
+
+    def hottest_keys(self, func, n=20):
+        """Keys of a dataset type ranked by number of reads.
+
+        Args:
+            func (function | str): Query function used, or its name
+            n (int): number of keys to return.
+
+        Returns:
+            list[(str, int)]: (key, reads) most read first.
+        """
+        name = func if isinstance(func, str) else func.__name__
+        ranked = self._redis.zrevrange(reads_key(name), 0, n - 1, withscores=True)
+        return [(k.decode("utf-8"), int(v)) for k, v in ranked]
+
+    def repo_footprint(self, n=20):
+        """Repos ranked by bytes stored across all dataset types.
+
+        Args:
+            n (int): number of repos to return.
+
+        Returns:
+            list[(str, int)]: (repo, bytes) largest first.
+        """
+        totals = {}
+        for name in self._dataset_names():
+            for k, v in self._redis.hgetall(self._index_key(name, "size")).items():
+                tags = self._tags(k)
+                if tags:
+                    repo = tags[0].split(":", 2)[2]
+                    totals[repo] = totals.get(repo, 0) + int(v)
+
+        return sorted(totals.items(), key=lambda kv: -kv[1])[:n]
+
+    def record_usage(self, selections):
+        """Counts a search for each selected repo url or org name,
+        for ranking selections by recency-weighted frequency.
+
+        Args:
+            selections (list[str]): repo urls and org names searched for.
+        """
+        if not selections:
+            return
+
+        w = usage.weight()
+        pipe = self._redis.pipeline(transaction=False)
+        for s in set(selections):
+            pipe.zincrby(usage.USAGE_KEY, w, s)
+        # keep the set bounded, dropping the least popular
+        pipe.zremrangebyrank(usage.USAGE_KEY, 0, -usage.USAGE_MAX_MEMBERS - 1)
+        _metrics.flush(pipe)
+        pipe.execute()
+
+    def popular(self, n=20):
+        """Most used selections, ranked by recency-weighted frequency.
+
+        Args:
+            n (int): number of selections to return.
+
+        Returns:
+            list[(str, float)]: (repo url or org name, weighted count) most used first.
+        """
+        now = time.time()
+        ranked = self._redis.zrevrange(usage.USAGE_KEY, 0, n - 1, withscores=True)
+        return [(k.decode("utf-8"), usage.decayed(v, now)) for k, v in ranked]
+
+    def _restored_parts(self, name, cols):
+        """
+        (private)
+        Values to write for a batch of snapshot rows: partitioned again if
+        the dataset type is time-partitioned, as they are otherwise.
+
+        Args:
+        -----
+            name (str): query function name.
+            cols (dict[str, list]): "key", "version" and "value" of each row.
+
+        Returns:
+        --------
+            (list[bytes], dict[str, dict[str, bytes]]): values to store, and
+                the partitions of those that are partition manifests.
+        """
+        column = partitions.column_for(name)
+        if column is None:
+            return cols["value"], {}
+
+        ds, parts = [], {}
+        for k, ver, v in zip(cols["key"], cols["version"], cols["value"]):
+            df = deserialize_df(compression.decompress(v))
+            # keys are "data:{name}:{fingerprint}:{repo}:{bucket}"
+            schema = k.split(":")[2]
+            d, parts[k] = self._partition(df, column, schema, ver.decode("utf-8"))
+            ds.append(d)
+        return ds, parts
+
+    def snapshot(self, path, batch=100):
+        """Exports every cached dataset, with its key, version and
+        watermark, to snapshot files under 'path', see snapshot.py.
+        Skipped while this Redis hasn't been restored, so a restarted,
+        empty Redis never overwrites the snapshot it's about to load.
+
+        Args:
+            path (str): snapshot directory.
+            batch (int): keys read per round trip.
+
+        Returns:
+            int: number of keys exported.
+        """
+        if not self._redis.exists(SNAPSHOT_SENTINEL):
+            logging.warning("CACHE_SNAPSHOT - Redis not restored yet, not exporting")
+            return 0
+
+        exported = 0
+        for name in self._dataset_names():
+            keys = [k.decode("utf-8") for k in self._redis.hkeys(self._index_key(name, "size"))]
+            writer = SnapshotWriter(path, name)
+
+            for i in range(0, len(keys), batch):
+                ks = keys[i : i + batch]
+                pipe = self._redis.pipeline(transaction=False)
+                pipe.hmget(self._index_key(name, "watermark"), ks)
+                marks = pipe.execute()[0]
+                values = self._mget(ks)
+                versions = self._versions(name, ks)
+
+                rows = []
+                for k, v, ver, m in zip(ks, values, versions, marks):
+                    # partitioned values are exported whole, and split again on restore.
+                    # they and chunked values are resolved decompressed, so compressed again.
+                    rebuilt = partitions.parse(v) is not None or (v is not None and v.startswith(_MANIFEST_MAGIC))
+                    v = self._resolve(k, v)
+                    if v is None:
+                        # expired since listed
+                        continue
+                    if rebuilt:
+                        v = self._serialize(v)
+                    rows.append((k, ver or b"", None if m is None else m.decode("utf-8"), v))
+
+                if rows:
+                    writer.write(*[list(c) for c in zip(*rows)])
+
+            writer.close()
+            exported += writer.count
+            logging.info(f"CACHE_SNAPSHOT - {name} - EXPORTED {writer.count} KEYS")
+
+        return exported
+
+    def restore(self, path, force=False):
+        """Reloads a snapshot written by 'snapshot', with pipelined writes
+        that keep each key's version. Values of time-partitioned datasets
+        are split into partitions again. Keys already in Redis, e.g. written
+        by queries since it restarted, are newer and kept. Runs once per
+        Redis instance: the caller holding SNAPSHOT_LOCK restores and sets
+        SNAPSHOT_SENTINEL once the last key is written, later callers
+        return straight away.
+
+        Args:
+            path (str): snapshot directory.
+            force (bool): restore even if this Redis was already restored.
+
+        Returns:
+            int: number of keys restored.
+        """
+        if self._redis.exists(SNAPSHOT_SENTINEL) and not force:
+            return 0
+
+        token = uuid.uuid4().hex
+        if not self._redis.set(SNAPSHOT_LOCK, token, nx=True, ex=SNAPSHOT_LOCK_TTL):
+            logging.info("CACHE_SNAPSHOT - restore already in progress")
+            return 0
+
+        try:
+            restored = 0
+            start = time.monotonic()
+            for name, batch in read_snapshot(path):
+                cols = batch.to_pydict()
+                missing = self._missing(cols["key"])
+                keep = [i for i, k in enumerate(cols["key"]) if k in missing]
+                if keep:
+                    cols = {c: [vs[i] for i in keep] for c, vs in cols.items()}
+                    ds, parts = self._restored_parts(name, cols)
+                    self._write(name, cols["key"], ds, cols["version"], cols["watermark"], parts)
+                    restored += len(keep)
+
+            # only now is this Redis as complete as the snapshot
+            self._redis.set(SNAPSHOT_SENTINEL, time.time())
+        finally:
+            self._release_held(keys=[SNAPSHOT_LOCK], args=[token])
+
+        logging.info(f"CACHE_SNAPSHOT - RESTORED {restored} KEYS IN {time.monotonic() - start:.1f}s")
+        return restored
@@ -0,0 +1,204 @@
+"""
+    Compression of cached values.
+
+    Compressed values carry a small header- a magic prefix and the id of the
+    codec that compressed them- so any reader can decompress them regardless
+    of how it's configured, and values written without a header (older keys,
+    or values under the size threshold) are returned unchanged.
+
+    Header layout:
+        b"\\x008KZ" (4 bytes) + codec id (1 byte) + compressed payload
+"""
+import os
+import zlib
+import logging
+
+# leading NUL can't start an Arrow stream or CSV text, so
+# there is no ambiguity with values written without a header.
+_MAGIC = b"\x008KZ"
+_HEADER_LEN = len(_MAGIC) + 1
+
+# codec name -> (codec id, compress function, decompress function)
+_CODECS = {}
+
+# codec id -> codec name
+_CODEC_IDS = {}
+
+# codec name -> factory of incremental decompress functions, for codecs that have one
+_STREAMING = {}
+
+
+def register_codec(name: str, codec_id: int, compress, decompress, stream=None):
+    """
+    Makes a codec available for compressing and decompressing cached values.
+
+    Args:
+    -----
+        name (str): name used to select codec in configuration.
+        codec_id (int): id written into value header, 1-255. Must never be
+            reused for another codec, otherwise existing values can't be read.
+        compress (function): bytes -> bytes
+        decompress (function): bytes -> bytes
+        stream (function | None): () -> (bytes -> bytes), a function that
+            decompresses successive pieces of one value. None if the codec
+            can only decompress whole values.
+    """
+    if not 0 < codec_id < 256:
+        raise ValueError(f"Codec id must be in 1-255, got {codec_id}")
+
+    if codec_id in _CODEC_IDS and _CODEC_IDS[codec_id] != name:
+        raise ValueError(f"Codec id {codec_id} already used by '{_CODEC_IDS[codec_id]}'")
+
+    _CODECS[name] = (codec_id, compress, decompress)
+    _CODEC_IDS[codec_id] = name
+    if stream is not None:
+        _STREAMING[name] = stream
+    else:
+        _STREAMING.pop(name, None)
+
+
+register_codec("zlib", 1, lambda b: zlib.compress(b, 6), zlib.decompress, lambda: zlib.decompressobj().decompress)
+
+try:
+    import zstandard
+
+    register_codec(
+        "zstd",
+        2,
+        lambda b: zstandard.ZstdCompressor(level=3).compress(b),
+        lambda b: zstandard.ZstdDecompressor().decompress(b),
+        lambda: zstandard.ZstdDecompressor().decompressobj().decompress,
+    )
+except ImportError:
+    logging.debug("CACHE_COMPRESSION - zstandard not installed, zstd codec unavailable")
+
+try:
+    import lz4.frame
+
+    register_codec(
+        "lz4", 3, lz4.frame.compress, lz4.frame.decompress, lambda: lz4.frame.LZ4FrameDecompressor().decompress
+    )
+except ImportError:
+    logging.debug("CACHE_COMPRESSION - lz4 not installed, lz4 codec unavailable")
+
+
+def default_codec():
+    """
+    Codec configured by the CACHE_COMPRESSION environment variable.
+    Defaults to zstd, falling back to zlib if zstandard isn't installed.
+    'none' disables compression.
+
+    Returns:
+    --------
+        str | None: codec name, None if compression is disabled.
+    """
+    name = os.getenv("CACHE_COMPRESSION", "zstd" if "zstd" in _CODECS else "zlib")
+
+    if name.lower() == "none":
+        return None
+
+    if name not in _CODECS:
+        logging.warning(f"CACHE_COMPRESSION - unknown codec '{name}', storing values uncompressed")
+        return None
+
+    return name
+
+
+def default_threshold():
+    """
+    Size in bytes, configured by the CACHE_COMPRESSION_THRESHOLD environment
+    variable, below which values are stored uncompressed.
+
+    Returns:
+    --------
+        int: threshold in bytes.
+    """
+    return int(os.getenv("CACHE_COMPRESSION_THRESHOLD", "16384"))
+
+
+def compress(data: bytes, codec: str, threshold: int = 0) -> bytes:
+    """
+    Compresses data and prepends the self-describing header.
+
+    Args:
+    -----
+        data (bytes): value to compress.
+        codec (str | None): registered codec name, None to skip compression.
+        threshold (int): values smaller than this are returned unchanged.
+
+    Returns:
+    --------
+        bytes: header + compressed data, or data unchanged.
+    """
+    if codec is None or len(data) < threshold:
+        return data
+
+    codec_id, comp, _ = _CODECS[codec]
+    compressed = comp(data)
+
+    # incompressible values aren't worth the decompression on every read.
+    if len(compressed) + _HEADER_LEN >= len(data):
+        return data
+
+    return _MAGIC + bytes([codec_id]) + compressed
+
+
+def decompress(data: bytes) -> bytes:
+    """
+    Decompresses a value written by 'compress'.
+    Values without a header are returned unchanged.
+
+    Args:
+    -----
+        data (bytes | bytearray): value read from cache.
+
+    Returns:
+    --------
+        bytes: decompressed value.
+    """
+    if data is None or not data.startswith(_MAGIC):
+        return data
+
+    codec_id = data[len(_MAGIC)]
+    if codec_id not in _CODEC_IDS:
+        raise ValueError(f"Cached value compressed with unavailable codec id {codec_id}")
+
+    # memoryview so that the payload isn't copied before decompression
+    _, _, decomp = _CODECS[_CODEC_IDS[codec_id]]
+    return decomp(memoryview(data)[_HEADER_LEN:])
+
+
+def decompressor(head: bytes):
+    """
+    Incremental counterpart of 'decompress', for a value read in pieces,
+    e.g. the chunks of a large value, so the compressed value is never
+    held whole next to its decompressed copy.
+
+    Args:
+    -----
+        head (bytes | bytearray): first piece of the value, at least as long as the header.
+
+    Returns:
+    --------
+        function | None: bytes -> bytes, decompresses the value's pieces
+            in order, starting with 'head'. None if the value isn't
+            compressed or its codec can't decompress incrementally.
+    """
+    if not head.startswith(_MAGIC) or len(head) < _HEADER_LEN:
+        return None
+
+    name = _CODEC_IDS.get(head[len(_MAGIC)])
+    if name not in _STREAMING:
+        return None
+
+    decomp = _STREAMING[name]()
+    first = [True]
+
+    def feed(piece):
+        if first[0]:
+            # header is only at the start of the first piece
+            first[0] = False
+            piece = memoryview(piece)[_HEADER_LEN:]
+        return decomp(piece)
+
+    return feed
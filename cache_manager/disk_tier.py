@@ -0,0 +1,307 @@
+"""
+    Disk-backed second cache tier.
+
+    Datasets evicted from Redis, or about to expire from it, are spilled to
+    Arrow IPC files on a local or shared volume instead of being dropped.
+    A read that misses in Redis finds them here, memory-maps the file and
+    promotes the dataset back into Redis, which is far quicker than
+    re-querying Augur. The tier has its own byte budget; files least
+    recently written are removed when it's exceeded. Each process keeps an
+    index of the files' sizes, so a write doesn't walk the tree; it's
+    rebuilt every INDEX_TTL seconds to catch files written by other hosts.
+
+    Layout:
+        {root}/{query function name}/{query fingerprint}/{repo}.arrow
+"""
+import os
+import shutil
+import logging
+import tempfile
+import time
+import pyarrow as pa
+from cache_manager.serialization import to_table, to_frame
+
+_SUFFIX = ".arrow"
+
+# seconds a process trusts its index of file sizes before walking the tree again.
+INDEX_TTL = int(os.getenv("CACHE_DISK_INDEX_TTL", "300"))
+
+
+class DiskTier:
+    """
+    Arrow files of spilled datasets, one per data key.
+
+    Attributes:
+    -----------
+        root : str | None
+            Directory holding the files. None disables the tier.
+
+        max_bytes : int
+            Budget for all files together.
+
+    Methods:
+    --------
+        enabled:
+            Whether the tier is configured.
+
+        put(key, df):
+            Writes a dataset, evicting the oldest files over budget.
+
+        get(key):
+            Returns memory-mapped dataset, None if not spilled.
+
+        has(key), stat(key):
+            Whether a dataset is spilled, and its file's status.
+
+        remove(key):
+            Removes a spilled dataset.
+
+        invalidate(name, fingerprint, repo):
+            Removes spilled datasets matching all given parts of their key.
+
+        fingerprints(name):
+            Returns query fingerprints with spilled datasets.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root or None
+        self.max_bytes = max_bytes
+
+        # path -> (mtime, size) of files, and their total, see _index
+        self._files = None
+        self._total = 0
+        self._indexed_at = 0.0
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    def _path(self, key):
+        """
+        (private)
+        File of a data key "data:{name}:{fingerprint}:{repo}[:{{bucket}}]",
+        None for keys that don't encode those parts.
+        """
+        if isinstance(key, bytes):
+            key = key.decode("utf-8")
+
+        parts = key.split(":")
+        if len(parts) not in (4, 5) or parts[0] != "data":
+            return None
+        name, fp, repo = parts[1:4]
+
+        return os.path.join(self.root, name, fp, f"{repo}{_SUFFIX}")
+
+    def put(self, key, df):
+        """
+        Writes a dataset as an Arrow IPC file. The file is written under a
+        temporary name and renamed into place, so readers on other hosts
+        never see a partial file.
+
+        Args:
+        -----
+            key (str | bytes): data key.
+            df (pd.DataFrame): dataset.
+
+        Returns:
+        --------
+            bool: whether the dataset was written.
+        """
+        path = self._path(key) if self.enabled else None
+        if path is None:
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = to_table(df)
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, path)
+        except:
+            os.remove(tmp)
+            raise
+
+        self._indexed(path)
+        self._evict()
+        return True
+
+    def get(self, key):
+        """
+        Reads a spilled dataset. The file is memory-mapped, so columns
+        are read straight from the page cache.
+
+        Args:
+        -----
+            key (str | bytes): data key.
+
+        Returns:
+        --------
+            pd.DataFrame | None: dataset, None if not spilled.
+        """
+        path = self._path(key) if self.enabled else None
+        if path is None:
+            return None
+
+        try:
+            with pa.memory_map(path, "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+        except FileNotFoundError:
+            return None
+
+        return to_frame(table)
+
+    def stat(self, key):
+        """
+        File status of a spilled dataset, None if not spilled.
+        Its modification time changes whenever the dataset is rewritten.
+        """
+        path = self._path(key) if self.enabled else None
+        if path is None:
+            return None
+
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    def has(self, key):
+        path = self._path(key) if self.enabled else None
+        return path is not None and os.path.exists(path)
+
+    def remove(self, key):
+        path = self._path(key) if self.enabled else None
+        if path is None:
+            return
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self._unindexed(path)
+
+    def invalidate(self, name=None, fingerprint=None, repo=None):
+        """
+        Removes spilled datasets matching all given parts of their key.
+
+        Args:
+        -----
+            name (str | None): query function name.
+            fingerprint (str | None): query fingerprint, requires name.
+            repo (int | str | None): repo id.
+
+        Returns:
+        --------
+            int: number of datasets removed.
+        """
+        if not self.enabled or not os.path.isdir(self.root):
+            return 0
+
+        removed = 0
+        for n in [name] if name is not None else os.listdir(self.root):
+            fps = [fingerprint] if fingerprint is not None else os.listdir(os.path.join(self.root, n))
+            for fp in fps:
+                d = os.path.join(self.root, n, fp)
+                if not os.path.isdir(d):
+                    continue
+
+                if repo is None:
+                    removed += len(os.listdir(d))
+                    shutil.rmtree(d, ignore_errors=True)
+                    # cheaper to rebuild the index than to find the directory's files in it
+                    self._files = None
+                    continue
+
+                path = os.path.join(d, f"{repo}{_SUFFIX}")
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                self._unindexed(path)
+
+        return removed
+
+    def fingerprints(self, name):
+        """
+        Query fingerprints a dataset type has spilled datasets of.
+
+        Args:
+        -----
+            name (str): query function name.
+
+        Returns:
+        --------
+            list[str]: fingerprints.
+        """
+        d = os.path.join(self.root, name) if self.enabled else None
+        return os.listdir(d) if d is not None and os.path.isdir(d) else []
+
+    def _index(self):
+        """
+        (private)
+        Index of the tier's files, path -> (mtime, size), walking the
+        tree if it hasn't been for INDEX_TTL seconds.
+        """
+        if self._files is not None and time.monotonic() - self._indexed_at < INDEX_TTL:
+            return self._files
+
+        files = {}
+        for dirpath, _, names in os.walk(self.root):
+            for n in names:
+                if n.endswith(_SUFFIX):
+                    path = os.path.join(dirpath, n)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files[path] = (st.st_mtime, st.st_size)
+
+        self._files = files
+        self._total = sum(size for _, size in files.values())
+        self._indexed_at = time.monotonic()
+        return files
+
+    def _indexed(self, path):
+        """
+        (private)
+        Records a file just written in the index.
+        """
+        files = self._index()
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return
+        self._total += st.st_size - files.get(path, (0, 0))[1]
+        files[path] = (st.st_mtime, st.st_size)
+
+    def _unindexed(self, path):
+        """
+        (private)
+        Drops a removed file from the index, if there is one.
+        """
+        if self._files is not None and path in self._files:
+            self._total -= self._files.pop(path)[1]
+
+    def _evict(self):
+        """
+        (private)
+        Removes least recently written files until the tier is within budget.
+        """
+        files = self._index()
+        if self._total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for path, (_, size) in sorted(files.items(), key=lambda f: f[1][0]):
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._unindexed(path)
+            evicted += 1
+
+        logging.info(f"CACHE_DISK_TIER - EVICTED {evicted} FILES")
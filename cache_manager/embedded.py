@@ -0,0 +1,472 @@
+"""
+    Embedded cache backend.
+
+    Stores datasets as Arrow files on local disk (see disk_tier.py), fronted
+    by the in-process LRU of deserialized frames (see local_cache.py). Every
+    process on the host- web server, callback and query workers- shares the
+    files, so no cache service is needed. Meant for single-node installs and
+    for benchmarking the query -> cache -> figure pipeline on one machine.
+
+    A file's modification time is its version: frames held in memory are
+    reused until their file is rewritten. Pending markers are hard links to
+    a file holding the job id, created exclusively, so claims are atomic
+    between processes. Computed figures
+    are cached as JSON files keyed like CacheManager's.
+
+    Layout under CACHE_EMBEDDED_PATH:
+        data/{query function name}/{query fingerprint}/{repo}.arrow
+        pending/{key hash}
+        figures/{viz id}/{key hash}.json
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import logging
+import pandas as pd
+from cache_manager.backend import CacheBackend
+from cache_manager.disk_tier import DiskTier
+from cache_manager.local_cache import LocalCache
+from cache_manager.serialization import serialize_df, concat_frames
+from cache_manager import refresh
+from cache_manager import partitions
+
+# longest a query job may hold its pending markers, in seconds.
+PENDING_LEASE = int(os.getenv("CACHE_PENDING_LEASE", "3600"))
+
+# frames shared by all EmbeddedCacheManager objects in this process.
+_local_cache = LocalCache(max_bytes=int(os.getenv("CACHE_LOCAL_MAX_BYTES", str(256 * 1024 * 1024))))
+
+
+class EmbeddedCacheManager(CacheBackend):
+    """
+    CacheBackend on local disk and process memory.
+
+    Attributes:
+    -----------
+        root : str
+            Directory holding the cache.
+
+        _store : (private) DiskTier
+            Arrow files of datasets, evicted oldest first over CACHE_EMBEDDED_MAX_BYTES.
+
+    Methods:
+    --------
+        setm(func, [repo], [data]):
+            Writes DataFrames, releasing their pending markers.
+
+        getm(func, [repo]):
+            Returns values as Arrow IPC stream bytes, None if missing.
+
+        existsm(func, [repo]):
+            Returns number of repos stored.
+
+        grabm(func, [repo], start, end):
+            Returns aggregate DataFrame of all repos, None if any missing.
+
+        grabm_partial(func, [repo]):
+            Returns aggregate DataFrame of the repos available, and the repos missing.
+
+        grab_figure(viz_id, func, [repo], params, compute):
+            Returns cached figure, computing and storing it if not cached.
+
+        upsert(func, [repo], [data]), watermarks(func, [repo]), cached_repos(func):
+            Incremental refresh, see refresh.py.
+
+        claim(func, [repo], job_id, lease), release(func, [repo], job_id):
+            Pending markers as exclusively created files.
+
+        invalidate_repo(repo), invalidate_dataset(func):
+            Deletes all datasets of a repo or dataset type.
+    """
+
+    def __init__(self, root=None, max_bytes=None, **kwargs):
+        """
+        Args:
+        -----
+            root (str | None): cache directory, None reads CACHE_EMBEDDED_PATH.
+            max_bytes (int | None): budget for stored datasets, None reads CACHE_EMBEDDED_MAX_BYTES.
+            kwargs: options of other backends, ignored.
+        """
+        if root is None:
+            root = os.getenv("CACHE_EMBEDDED_PATH", os.path.join(tempfile.gettempdir(), "8knot-cache"))
+        if max_bytes is None:
+            max_bytes = int(os.getenv("CACHE_EMBEDDED_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+
+        self.root = root
+        self._store = DiskTier(os.path.join(root, "data"), max_bytes)
+
+    def _get_hash(self, func, repo):
+        """
+        (private)
+        Key of a dataset, laid out like CacheManager's so that DiskTier can map it to a file.
+        """
+        return f"data:{func.__name__}:{self._fingerprint(func)}:{repo}"
+
+    def _version(self, h):
+        """
+        (private)
+        Version of a stored dataset: its file's modification time, None if not stored.
+        """
+        st = self._store.stat(h)
+        return None if st is None else str(st.st_mtime_ns).encode("utf-8")
+
+    def _frame(self, h):
+        """
+        (private)
+        Stored dataset, from memory if its file hasn't been rewritten since it was read.
+        """
+        version = self._version(h)
+        df = _local_cache.get(h, version)
+        if df is not None or version is None:
+            return df
+
+        with _local_cache.loading([h]):
+            df = _local_cache.get(h, version)
+            if df is None:
+                df = self._store.get(h)
+                if df is not None:
+                    _local_cache.put(h, version, df)
+                    df = df.copy(deep=False)
+
+        return df
+
+    def _pending_path(self, h):
+        return os.path.join(self.root, "pending", hashlib.md5(h.encode("utf-8")).hexdigest())
+
+    def setm(self, func, repos, datas, cost=None):
+        """Writes many datasets.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            data (list[pd.DataFrame]): list of data per repo.
+            cost (float | None): seconds the query took, unused; files are
+                evicted oldest first.
+
+        Returns:
+            bool: confirmation of successful set operations.
+        """
+        # time-partitioned datasets are stored sorted, with their header
+        column = partitions.column_for(func)
+        for r, data in zip(repos, datas):
+            if not isinstance(data, pd.DataFrame):
+                raise TypeError(f"EmbeddedCacheManager stores DataFrames, got {type(data).__name__}")
+
+            data = (partitions.sort(column, data) if column is not None else data).copy(deep=False)
+            data.attrs["header"] = partitions.header(column, data, self._fingerprint(func))
+
+            h = self._get_hash(func, r)
+            self._store.put(h, data)
+
+        # work is done, release pending markers
+        self.release(func, repos)
+        return True
+
+    def getm(self, func, repos):
+        """Gets many datasets as serialized values, like CacheManager.getm.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            list[bytes | None]: Arrow IPC streams, None if missing.
+        """
+        frames = [self._frame(self._get_hash(func, r)) for r in repos]
+        return [None if df is None else serialize_df(df) for df in frames]
+
+    def existsm(self, func, repos):
+        """Checks whether datasets are stored.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            int: number of repos stored.
+        """
+        return sum(self._store.has(self._get_hash(func, r)) for r in repos)
+
+    def grabm(self, func, repos, start=None, end=None):
+        """Builds aggregate DataFrame of repos' datasets.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            start (str | pd.Timestamp | None): earliest time of rows wanted, None for no bound.
+            end (str | pd.Timestamp | None): time after the latest rows wanted, None for no bound.
+
+        Returns:
+            pd.DataFrame | None: Data if all available.
+        """
+        df, missing = self.grabm_partial(func, repos, start, end)
+        return None if missing else df
+
+    def grabm_partial(self, func, repos, start=None, end=None):
+        """Builds aggregate DataFrame of whichever repos' datasets are stored.
+
+        Datasets are stored whole here; a time range selects rows by the
+        dataset's partition column, see partitions.py. Time-partitioned
+        datasets are merged in time order, like CacheManager's.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            start (str | pd.Timestamp | None): earliest time of rows wanted, None for no bound.
+            end (str | pd.Timestamp | None): time after the latest rows wanted, None for no bound.
+
+        Returns:
+            (pd.DataFrame, list[int]): Data of available repos, and repos missing.
+        """
+        column = partitions.column_for(func)
+        if (start is not None or end is not None) and column is None:
+            raise ValueError(f"{func.__name__} isn't partitioned by time, it can't be read by range")
+
+        frames, missing = [], []
+        for r in repos:
+            df = self._frame(self._get_hash(func, r))
+            if df is None:
+                missing.append(r)
+            else:
+                frames.append(df)
+
+        if not frames:
+            return pd.DataFrame(), missing
+
+        if column is None:
+            return concat_frames(frames), missing
+
+        df = partitions.merge(column, frames)
+        if start is not None or end is not None:
+            schema = df.attrs["header"]["schema"]
+            df = partitions.select(column, df, start, end)
+            df.attrs["header"] = partitions.header(column, df, schema)
+        return df, missing
+
+    def grab_figure(self, viz_id, func, repos, params, compute, timeout=None):
+        """Returns the figure for a visualization of 'repos', computing it
+        only if no figure of the same inputs and data versions is cached.
+        Concurrent callers aren't de-duplicated; each computes the figure
+        and the last write wins.
+
+        Args:
+            viz_id (str): unique id of the visualization.
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            params (tuple): all other inputs that the figure depends on.
+            compute (function): pd.DataFrame -> plotly figure.
+            timeout (float | None): seconds to wait before giving up, None waits indefinitely.
+
+        Returns:
+            go.Figure | dict | None: figure, None if timed out.
+        """
+        df = self.wait_for(func=func, repos=repos, timeout=timeout)
+        if df is None:
+            return None
+
+        hs = [self._get_hash(func, r) for r in sorted(repos)]
+        hashfunc = hashlib.md5()
+        hashfunc.update(bytes(viz_id, "utf-8"))
+        hashfunc.update(bytes("\n".join(hs), "utf-8"))
+        hashfunc.update(bytes(repr(tuple(params)), "utf-8"))
+        for h in hs:
+            hashfunc.update(self._version(h) or b"")
+        path = os.path.join(self.root, "figures", viz_id, f"{hashfunc.hexdigest()}.json")
+
+        try:
+            with open(path, "r") as f:
+                logging.debug(f"FIGURE_CACHE - {viz_id} - HIT")
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+
+        fig = compute(df)
+        fig_json = fig.to_json() if hasattr(fig, "to_json") else json.dumps(fig)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(fig_json)
+        os.replace(tmp, path)
+
+        return fig
+
+    def upsert(self, func, repos, datas):
+        """Merges rows changed since each repo's watermark into its
+        stored dataset by primary key, see refresh.py. Repos whose stored
+        dataset has gone are dropped and their markers released, rather
+        than stored as the changed rows alone.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            data (list[pd.DataFrame]): rows changed per repo.
+
+        Returns:
+            bool: confirmation of successful set operations.
+        """
+        spec = refresh.spec_for(func)
+        if spec is None:
+            raise ValueError(f"{func.__name__} has no refresh spec, it can't be upserted")
+
+        kept, merged, gone = [], [], []
+        for r, d in zip(repos, datas):
+            cached = self._frame(self._get_hash(func, r))
+            if cached is None:
+                gone.append(r)
+                continue
+            kept.append(r)
+            merged.append(refresh.merge(spec, cached, d))
+
+        if gone:
+            self.release(func, gone)
+            logging.info(f"CACHE_UPSERT - {func.__name__} - DROPPED {len(gone)} REPOS NO LONGER STORED")
+        if not kept:
+            return True
+        return self.setm(func, kept, merged)
+
+    def watermarks(self, func, repos):
+        """High-water marks of stored datasets, computed from the data.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+
+        Returns:
+            dict[int, str | None]: repo -> ISO timestamp, None if not stored or no mark.
+        """
+        spec = refresh.spec_for(func)
+        marks = {}
+        for r in repos:
+            df = self._frame(self._get_hash(func, r)) if spec is not None else None
+            m = refresh.watermark(spec, df) if df is not None else None
+            marks[r] = None if m is None else m.isoformat()
+        return marks
+
+    def cached_repos(self, func):
+        """Repos that have data stored for a dataset type.
+
+        Args:
+            func (function): Query function used
+
+        Returns:
+            list[int]: repo_ids of repos.
+        """
+        d = os.path.join(self._store.root, func.__name__, self._fingerprint(func))
+        if not os.path.isdir(d):
+            return []
+
+        repos = [n[: -len(".arrow")] for n in os.listdir(d) if n.endswith(".arrow")]
+        return [int(r) if r.isdigit() else r for r in repos]
+
+    def claim(self, func, repos, job_id, lease=None):
+        """Marks a query job as in flight for each repo that doesn't
+        already have one. Markers older than 'lease' are taken over.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            job_id (str): id of the job that will do the claimed work.
+            lease (int | None): seconds before markers lapse, None for PENDING_LEASE.
+
+        Returns:
+            (list[int], dict[int, str]): repos claimed for job_id, and
+                repo -> id of the job already in flight for other repos.
+        """
+        lease = PENDING_LEASE if lease is None else lease
+        pending_dir = os.path.join(self.root, "pending")
+        os.makedirs(pending_dir, exist_ok=True)
+
+        # markers are hard links to a file already holding job_id, so a
+        # marker appears complete or not at all- never empty to a reader.
+        fd, marker = tempfile.mkstemp(dir=pending_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(job_id)
+
+        claimed, pending = [], {}
+        try:
+            for r in repos:
+                path = self._pending_path(self._get_hash(func, r))
+                for _ in range(2):
+                    try:
+                        os.link(marker, path)
+                    except FileExistsError:
+                        try:
+                            with open(path, "r") as f:
+                                owner = f.read()
+                            lapsed = time.time() - os.stat(path).st_mtime > lease
+                        except FileNotFoundError:
+                            # released meanwhile, try again
+                            continue
+                        if lapsed:
+                            self._remove(path)
+                            continue
+                        if owner == job_id:
+                            claimed.append(r)
+                        else:
+                            pending[r] = owner
+                        break
+
+                    claimed.append(r)
+                    break
+        finally:
+            self._remove(marker)
+
+        return claimed, pending
+
+    def release(self, func, repos, job_id=None):
+        """Removes pending markers of repos.
+
+        Args:
+            func (function): Query function used
+            repo (list[int]): list of repo_ids of repos
+            job_id (str | None): only remove markers held by this job.
+
+        Returns:
+            int: number of markers removed.
+        """
+        released = 0
+        for r in repos:
+            path = self._pending_path(self._get_hash(func, r))
+            if job_id is not None:
+                try:
+                    with open(path, "r") as f:
+                        if f.read() != job_id:
+                            continue
+                except FileNotFoundError:
+                    continue
+            released += self._remove(path)
+
+        return released
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    def invalidate_repo(self, repo):
+        """Deletes all datasets of a repo.
+
+        Args:
+            repo (int): repo_id of repo
+
+        Returns:
+            int: number of datasets deleted.
+        """
+        return self._store.invalidate(repo=repo)
+
+    def invalidate_dataset(self, func):
+        """Deletes all repos' data of a dataset type, every schema version.
+
+        Args:
+            func (function | str): Query function used, or its name
+
+        Returns:
+            int: number of datasets deleted.
+        """
+        name = func if isinstance(func, str) else func.__name__
+        return self._store.invalidate(name=name)
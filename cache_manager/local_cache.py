@@ -0,0 +1,175 @@
+"""
+    In-process LRU cache of deserialized datasets.
+
+    Sits in front of Redis in the callback workers so that several figures
+    rendering the same selection fetch and decode each (func, repo) dataset
+    once. Entries are validated against the version Redis holds for the key,
+    so a rewrite by a query worker is picked up on the next read.
+"""
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+import pandas as pd
+
+
+class LocalCache:
+    """
+    Size-bounded LRU of DataFrames keyed by cache key and version.
+
+    Frames are shared between callers: each 'get' returns a shallow copy,
+    so replacing or renaming columns, dropna, etc. only affect the caller's
+    copy. Callers must not write values in place.
+
+    Attributes:
+    -----------
+        max_bytes : int
+            Budget for the deep memory usage of all cached frames.
+            0 disables the cache.
+
+        _entries : (private) OrderedDict
+            key -> (version, DataFrame, bytes), least recently used first.
+
+        _bytes : (private) int
+            Memory usage of all cached frames.
+
+        _lock : (private) threading.Lock
+            Guards _entries and _bytes.
+
+        _load_locks : (private) list[threading.Lock]
+            Striped locks that serialize loads of the same key.
+
+    Methods:
+    --------
+        get(key, version):
+            Returns shallow copy of cached frame, None if missing or stale.
+
+        version(key):
+            Returns version of cached frame, None if missing.
+
+        put(key, version, df):
+            Caches frame, evicting least recently used frames over budget.
+
+        loading([key]):
+            Context manager held while loading keys from Redis.
+
+        clear():
+            Drops all cached frames.
+    """
+
+    def __init__(self, max_bytes: int, stripes: int = 64):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks = [threading.Lock() for _ in range(stripes)]
+
+    def get(self, key, version):
+        """
+        Returns cached frame for key if its version matches.
+
+        Args:
+        -----
+            key (str | bytes): cache key.
+            version (bytes | None): current version of key in Redis.
+
+        Returns:
+        --------
+            pd.DataFrame | None: shallow copy of cached frame, None on miss.
+        """
+        if version is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[0] != version:
+                # stale, key has been rewritten since
+                self._drop(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return entry[1].copy(deep=False)
+
+    def version(self, key):
+        """
+        Version of the cached frame for key, without touching its recency.
+
+        Args:
+        -----
+            key (str | bytes): cache key.
+
+        Returns:
+        --------
+            bytes | None: version, None if not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0]
+
+    def put(self, key, version, df: pd.DataFrame):
+        """
+        Caches frame for key at version, evicting least recently
+        used frames until the cache is within its budget.
+
+        Args:
+        -----
+            key (str | bytes): cache key.
+            version (bytes | None): version of key the frame was read at.
+                Frames without a version can't be validated and aren't cached.
+            df (pd.DataFrame): frame to cache. Must not be modified afterwards.
+        """
+        if version is None or self.max_bytes <= 0:
+            return
+
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            logging.debug(f"LOCAL_CACHE - {size} BYTES EXCEEDS BUDGET, NOT CACHED")
+            return
+
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (version, df, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    @contextmanager
+    def loading(self, keys):
+        """
+        Held while loading keys from Redis, so concurrent readers
+        of the same keys wait for one load rather than repeating it.
+        Stripes are acquired in a fixed order to avoid deadlock.
+
+        Args:
+        -----
+            keys (list[str | bytes]): cache keys being loaded.
+        """
+        stripes = sorted({hash(k) % len(self._load_locks) for k in keys})
+        locks = [self._load_locks[i] for i in stripes]
+
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def clear(self):
+        """Drops all cached frames."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        """
+        (private)
+        Removes key, caller holds _lock.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
@@ -0,0 +1,114 @@
+"""
+    Cache metrics.
+
+    CacheManager records counters (hits, misses, bytes moved, decode time)
+    per dataset type. Increments are buffered in-process and flushed onto
+    the next pipeline CacheManager sends to Redis, so recording a metric
+    never costs a round trip of its own. Totals live in Redis, so they
+    aggregate across every worker process.
+"""
+import threading
+
+# counters kept per dataset type
+COUNTERS = [
+    "hits",
+    "misses",
+    "partial_hits",
+    "local_hits",
+    "bytes_read",
+    "bytes_written",
+    "decode_seconds",
+]
+
+
+def stats_key(name):
+    """
+    Name of the hash of counters for a dataset type.
+
+    Args:
+    -----
+        name (str): query function name.
+
+    Returns:
+    --------
+        str: hash key.
+    """
+    return f"cache_stats:{name}"
+
+
+def reads_key(name):
+    """
+    Name of the sorted set of data key -> number of reads for a dataset type.
+
+    Args:
+    -----
+        name (str): query function name.
+
+    Returns:
+    --------
+        str: sorted set key.
+    """
+    return f"cache_stats:{name}:reads"
+
+
+class Metrics:
+    """
+    Buffer of metric increments not yet sent to Redis.
+
+    Attributes:
+    -----------
+        _counters : (private) dict
+            (dataset name, counter) -> amount.
+
+        _reads : (private) dict
+            (dataset name, data key) -> number of reads.
+
+        _lock : (private) threading.Lock
+            Guards the buffers.
+
+    Methods:
+    --------
+        incr(name, counter, amount):
+            Buffers an increment of a dataset's counter.
+
+        read(name, [key]):
+            Buffers a read of each data key.
+
+        flush(pipe):
+            Queues buffered increments on a pipeline and clears the buffers.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._reads = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, counter, amount=1):
+        with self._lock:
+            self._counters[(name, counter)] = self._counters.get((name, counter), 0) + amount
+
+    def read(self, name, keys):
+        with self._lock:
+            for k in keys:
+                self._reads[(name, k)] = self._reads.get((name, k), 0) + 1
+
+    def flush(self, pipe):
+        """
+        Queues all buffered increments on 'pipe', which the caller executes.
+
+        Args:
+        -----
+            pipe (Pipeline): pipeline about to be sent to Redis.
+        """
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            reads, self._reads = self._reads, {}
+
+        for (name, counter), amount in counters.items():
+            if isinstance(amount, float):
+                pipe.hincrbyfloat(stats_key(name), counter, amount)
+            else:
+                pipe.hincrby(stats_key(name), counter, amount)
+
+        for (name, k), n in reads.items():
+            pipe.zincrby(reads_key(name), n, k)
@@ -0,0 +1,342 @@
+"""
+    Time-partitioned storage of cached datasets.
+
+    Datasets of the query functions listed below aren't stored as one value
+    holding a repo's whole history, but as one partition per year of a
+    timestamp column. The data key holds a small manifest of the partitions
+    with their versions and sizes, and the partitions live in a hash next to
+    it. Reads over a time range fetch only the partitions overlapping it,
+    and incremental refreshes rewrite only the partitions their changed
+    rows fall in- for append-mostly data, the newest.
+
+    The partition column must not change once a row exists (e.g. an issue's
+    creation time), so that a refreshed row lands in the partition that
+    already holds it. Rows without a value go in their own partition.
+
+    Rows are stored sorted by the partition column, and each partition
+    carries a header (see 'header') with its sort column, row count and
+    time bounds. Reads merge the repos' sorted frames rather than sorting
+    their concatenation, so the data comes back in time order, and the
+    manifest's headers give a dataset's bounds without reading its rows.
+"""
+import json
+import numpy as np
+import pandas as pd
+from cache_manager.serialization import concat_frames
+
+# keyed by query function name. Dataset types not listed are stored whole.
+PARTITION_COLUMNS = {
+    "commits_query": "date",
+    "contributors_query": "created_at",
+    "issues_query": "created",
+    "prs_query": "created",
+}
+
+# partition of rows whose partition column is null.
+UNDATED = "undated"
+
+# partitioned values store a manifest under their key, marked by this prefix.
+# leading NUL can't start an Arrow stream, CSV text or a compressed value.
+MAGIC = b"\x008KP"
+
+
+def column_for(func):
+    """
+    Partition column of a query function's datasets.
+
+    Args:
+    -----
+        func (function | str): Query function used, or its name
+
+    Returns:
+    --------
+        str | None: column, None if the datasets are stored whole.
+    """
+    name = func if isinstance(func, str) else func.__name__
+    return PARTITION_COLUMNS.get(name)
+
+
+def _timestamp(t):
+    """
+    Timestamp in UTC; naive times are taken to be UTC already.
+    """
+    t = pd.Timestamp(t)
+    return t.tz_localize("UTC") if t.tzinfo is None else t.tz_convert("UTC")
+
+
+def _times(df, column):
+    """
+    Partition column of a frame as UTC timestamps.
+    """
+    times = df[column]
+    if not isinstance(times.dtype, pd.DatetimeTZDtype):
+        times = pd.to_datetime(times, utc=True, errors="coerce")
+    return times
+
+
+def sort(column, df):
+    """
+    Rows of a frame in order of the partition column, undated last.
+
+    Args:
+    -----
+        column (str): partition column.
+        df (pd.DataFrame): dataset of one repo.
+
+    Returns:
+    --------
+        pd.DataFrame: sorted rows, 'df' itself if already sorted.
+    """
+    if column not in df.columns or len(df) < 2:
+        return df
+
+    times = _times(df, column)
+    dated = int(times.notna().sum())
+    if times.iloc[:dated].is_monotonic_increasing and times.iloc[dated:].isna().all():
+        return df
+
+    order = np.argsort(times.dt.tz_convert(None).to_numpy(), kind="stable")
+    return df.take(order).reset_index(drop=True)
+
+
+def header(column, df, schema=None):
+    """
+    Header describing a frame sorted by 'column'.
+
+    Args:
+    -----
+        column (str | None): column the frame is sorted by, None if unsorted.
+        df (pd.DataFrame): sorted frame.
+        schema (str | None): schema version of the dataset, its query's fingerprint.
+
+    Returns:
+    --------
+        dict: {"sort", "rows", "min", "max", "schema"}, with the earliest
+            and latest time of the sort column as ISO timestamps, None if
+            it has none.
+    """
+    lo = hi = None
+    if column is not None and column in df.columns and len(df):
+        times = _times(df, column)
+        dated = int(times.notna().sum())
+        if dated:
+            lo, hi = times.iloc[0].isoformat(), times.iloc[dated - 1].isoformat()
+
+    return {"sort": column, "rows": len(df), "min": lo, "max": hi, "schema": schema}
+
+
+def bounds(df, column):
+    """
+    Earliest and latest time of a frame's column. Read from the frame's
+    header if the frame is sorted by the column, rather than scanning it.
+
+    Args:
+    -----
+        df (pd.DataFrame): frame, e.g. as read from the cache.
+        column (str): timestamp column.
+
+    Returns:
+    --------
+        (pd.Timestamp | None, pd.Timestamp | None): bounds in UTC, None if
+            the column has no times.
+    """
+    hd = df.attrs.get("header")
+    # rows filtered since the header was written may have held the bounds
+    if hd is not None and hd.get("sort") == column and hd.get("rows") == len(df):
+        return tuple(None if t is None else _timestamp(t) for t in (hd["min"], hd["max"]))
+
+    times = _times(df, column)
+    return tuple(None if pd.isnull(t) else t for t in (times.min(), times.max()))
+
+
+def combine(headers):
+    """
+    Header of the concatenation of frames, from their headers.
+
+    Args:
+    -----
+        headers (list[dict | None]): headers of the frames.
+
+    Returns:
+    --------
+        dict | None: combined header, None if any frame has none. It's
+            sorted only if all frames are sorted by the same column.
+    """
+    if not headers or any(h is None for h in headers):
+        return None
+
+    sorts = {h["sort"] for h in headers}
+    schemas = {h.get("schema") for h in headers}
+    los = [h["min"] for h in headers if h["min"] is not None]
+    his = [h["max"] for h in headers if h["max"] is not None]
+    return {
+        "sort": sorts.pop() if len(sorts) == 1 else None,
+        "rows": sum(h["rows"] for h in headers),
+        "min": min(los, key=_timestamp) if los else None,
+        "max": max(his, key=_timestamp) if his else None,
+        "schema": schemas.pop() if len(schemas) == 1 else None,
+    }
+
+
+def join(frames):
+    """
+    Concatenates a value's partitions, read oldest first, into its frame.
+
+    Args:
+    -----
+        frames (list[pd.DataFrame]): partitions in the order of 'labels'.
+
+    Returns:
+    --------
+        pd.DataFrame: frame, with the combined header of the partitions.
+    """
+    df = concat_frames(frames)
+    df.attrs["header"] = combine([f.attrs.get("header") for f in frames])
+    return df
+
+
+def merge(column, frames):
+    """
+    Merges repos' frames into one sorted by the partition column.
+
+    Frames whose header says they're sorted by it are taken as sorted
+    runs, others are sorted first. The runs are concatenated and merged
+    by a stable sort, whose timsort merges k runs in O(n log k) rather
+    than sorting the rows from scratch.
+
+    Args:
+    -----
+        column (str): partition column.
+        frames (list[pd.DataFrame]): data of each repo.
+
+    Returns:
+    --------
+        pd.DataFrame: merged rows, undated last, with their header.
+    """
+    headers = [f.attrs.get("header") for f in frames]
+    schemas = {h["schema"] for h in headers if h is not None}
+    frames = [f if h is not None and h["sort"] == column else sort(column, f) for f, h in zip(frames, headers)]
+
+    df = concat_frames(frames)
+    if len(frames) > 1 and column in df.columns:
+        order = np.argsort(_times(df, column).dt.tz_convert(None).to_numpy(), kind="stable")
+        df = df.take(order).reset_index(drop=True)
+
+    df.attrs["header"] = header(column, df, schemas.pop() if len(schemas) == 1 else None)
+    return df
+
+
+def split(column, df):
+    """
+    Splits a frame into its yearly partitions.
+
+    Args:
+    -----
+        column (str): partition column.
+        df (pd.DataFrame): dataset of one repo.
+
+    Returns:
+    --------
+        dict[str, pd.DataFrame]: partition label -> rows, a year or UNDATED.
+            A frame without rows is kept as one empty partition, so its
+            columns survive the round trip.
+    """
+    if df.empty or column not in df.columns:
+        return {UNDATED: df}
+
+    years = _times(df, column).dt.year
+    parts = {str(int(y)): p.reset_index(drop=True) for y, p in df.groupby(years, sort=True)}
+
+    undated = years.isna()
+    if undated.any():
+        parts[UNDATED] = df[undated].reset_index(drop=True)
+
+    return parts
+
+
+def labels(manifest, start=None, end=None):
+    """
+    Partitions of a manifest overlapping a time range, oldest first.
+
+    Args:
+    -----
+        manifest (dict): parsed manifest, see 'parse'.
+        start (str | pd.Timestamp | None): earliest time wanted, None for no bound.
+        end (str | pd.Timestamp | None): time after the latest wanted, None for no bound.
+
+    Returns:
+    --------
+        list[str]: partition labels. UNDATED is only included without a range.
+    """
+    ls = sorted(manifest["parts"], key=lambda l: (l == UNDATED, l))
+    if start is None and end is None:
+        return ls
+
+    lo = _timestamp(start).year if start is not None else None
+    hi = _timestamp(end).year if end is not None else None
+    return [l for l in ls if l != UNDATED and (lo is None or int(l) >= lo) and (hi is None or int(l) <= hi)]
+
+
+def select(column, df, start=None, end=None):
+    """
+    Rows of a frame whose partition column falls in [start, end).
+
+    Args:
+    -----
+        column (str): partition column.
+        df (pd.DataFrame): data read from the cache.
+        start (str | pd.Timestamp | None): earliest time wanted, None for no bound.
+        end (str | pd.Timestamp | None): time after the latest wanted, None for no bound.
+
+    Returns:
+    --------
+        pd.DataFrame: selected rows.
+    """
+    if (start is None and end is None) or column not in df.columns:
+        return df
+
+    times = _times(df, column)
+    keep = times.notna()
+    if start is not None:
+        keep &= times >= _timestamp(start)
+    if end is not None:
+        keep &= times < _timestamp(end)
+    return df[keep].reset_index(drop=True)
+
+
+def manifest(parts, headers=None):
+    """
+    Manifest stored under a partitioned value's key.
+
+    Args:
+    -----
+        parts (dict[str, (str, int)]): label -> (version, size) of every partition.
+        headers (dict[str, dict] | None): label -> header of every partition.
+
+    Returns:
+    --------
+        bytes: manifest.
+    """
+    m = {"parts": {l: list(vs) for l, vs in parts.items()}}
+    if headers is not None:
+        m["headers"] = headers
+    return MAGIC + json.dumps(m).encode("utf-8")
+
+
+def parse(value):
+    """
+    Parses the manifest of a partitioned value.
+
+    Args:
+    -----
+        value (bytes | None): value read from a data key.
+
+    Returns:
+    --------
+        dict | None: {"parts": {label: [version, size]}, "headers": {label: header}},
+            None if the value isn't partitioned. Values written before
+            partitions had headers have no "headers".
+    """
+    if value is None or not bytes(value[: len(MAGIC)]) == MAGIC:
+        return None
+    return json.loads(bytes(value[len(MAGIC) :]))
@@ -0,0 +1,141 @@
+"""
+    Incremental refresh of cached datasets.
+
+    Datasets with a RefreshSpec have a high-water mark recorded per repo
+    when they're written: the latest timestamp in any of the spec's
+    watermark columns. A refresh queries only rows whose watermark columns
+    are at or after that mark, and upserts them into the cached frame by
+    the spec's primary key, instead of re-querying the repo's full history.
+
+    Rows deleted from the database aren't seen by a refresh; they're
+    dropped when the key expires or is invalidated and fully re-queried.
+"""
+import pandas as pd
+
+
+class RefreshSpec:
+    """
+    How a dataset type is refreshed incrementally.
+
+    Attributes:
+    -----------
+        watermark : list[str]
+            Timestamp columns; a row changed when any of them moved past the mark.
+
+        key : list[str]
+            Columns identifying a row, newer rows replace cached rows with equal keys.
+
+        order : str | None
+            Column the merged frame is sorted by, None keeps arrival order.
+    """
+
+    def __init__(self, watermark, key, order=None):
+        self.watermark = watermark
+        self.key = key
+        self.order = order
+
+    def __repr__(self):
+        return f"RefreshSpec(watermark={self.watermark}, key={self.key}, order={self.order})"
+
+
+# keyed by query function name. Dataset types not listed are always fully re-queried.
+REFRESH_SPECS = {
+    "commits_query": RefreshSpec(watermark=["date"], key=["commits"]),
+    "contributors_query": RefreshSpec(watermark=["created_at"], key=["cntrb_id", "Action", "created_at"]),
+    "issues_query": RefreshSpec(watermark=["created", "closed"], key=["issue"], order="created"),
+    "prs_query": RefreshSpec(watermark=["created", "closed", "merged"], key=["pull_request"], order="created"),
+}
+
+
+def spec_for(func):
+    """
+    Refresh spec for a query function's datasets.
+
+    Args:
+    -----
+        func (function | str): Query function used, or its name
+
+    Returns:
+    --------
+        RefreshSpec | None: spec, None if the dataset can't be refreshed incrementally.
+    """
+    name = func if isinstance(func, str) else func.__name__
+    return REFRESH_SPECS.get(name)
+
+
+def watermark(spec, df):
+    """
+    High-water mark of a frame: latest timestamp in the spec's watermark columns.
+
+    Args:
+    -----
+        spec (RefreshSpec): dataset's refresh spec.
+        df (pd.DataFrame): frame written to the cache.
+
+    Returns:
+    --------
+        pd.Timestamp | None: mark, None if the frame has no timestamps.
+    """
+    marks = [df[c].max() for c in spec.watermark if c in df.columns]
+    marks = [m for m in marks if not pd.isnull(m)]
+    return max(marks) if marks else None
+
+
+def merge(spec, cached, delta):
+    """
+    Upserts changed rows into a cached frame by the spec's key.
+
+    Args:
+    -----
+        spec (RefreshSpec): dataset's refresh spec.
+        cached (pd.DataFrame | None): frame currently in the cache.
+        delta (pd.DataFrame): rows changed since the cached frame's mark.
+
+    Returns:
+    --------
+        pd.DataFrame: merged frame.
+    """
+    if cached is None or cached.empty:
+        merged = delta
+    elif delta.empty:
+        return cached
+    else:
+        merged = pd.concat([cached, delta], ignore_index=True)
+        merged = merged.drop_duplicates(subset=spec.key, keep="last")
+
+    if spec.order is not None:
+        merged = merged.sort_values(by=spec.order, kind="stable")
+
+    return merged.reset_index(drop=True)
+
+
+def since_clause(repos, since, repo_column, columns):
+    """
+    SQL condition selecting rows changed since each repo's mark.
+    Repos without a mark are selected in full.
+
+    Args:
+    -----
+        repos (list[int]): repos queried.
+        since (list[str | None]): ISO timestamp of each repo's mark.
+        repo_column (str): column holding the repo id, e.g. "c.repo_id".
+        columns (list[str]): timestamp columns compared to the mark, of a
+            timestamp type or text Postgres can cast to timestamptz.
+
+    Returns:
+    --------
+        str: condition, to be joined with the query's WHERE clause by AND.
+    """
+    conds = []
+    for repo, mark in zip(repos, since):
+        if mark is None:
+            conds.append(f"{repo_column} = {int(repo)}")
+        else:
+            # marks are rows' own timestamps, re-formatted so they can't inject.
+            # both sides are compared as timestamps: some columns are text,
+            # e.g. commits' dates, and as text '2022-05-01 00:00:00' < '2022-05-01T00:00:00'.
+            mark = pd.Timestamp(mark).isoformat()
+            changed = " OR ".join(f"{c}::timestamptz >= '{mark}'::timestamptz" for c in columns)
+            conds.append(f"({repo_column} = {int(repo)} AND ({changed}))")
+
+    return "(" + " OR ".join(conds) + ")"
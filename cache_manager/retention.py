@@ -0,0 +1,86 @@
+"""
+    Retention policies for cached datasets.
+
+    Every query function's results are kept according to a RetentionPolicy:
+    how long keys live, whether reading a key extends its life, and how many
+    bytes all of that function's keys may use together. Policies are set
+    here, in one place, with defaults from environment variables.
+"""
+import os
+
+
+class RetentionPolicy:
+    """
+    How long and how much of a dataset type is kept in the cache.
+
+    Attributes:
+    -----------
+        ttl : int | None
+            Seconds a key lives after it's written. None never expires.
+
+        sliding : bool
+            Whether reading a key resets its ttl.
+
+        max_bytes : int | None
+            Budget for all keys of the dataset type. When a write exceeds it,
+            keys are evicted in the order of 'eviction'. None is unbounded.
+
+        eviction : str
+            "gds" evicts the keys cheapest to rebuild per byte first, aged
+            GreedyDual-Size style so keys not read for long go eventually.
+            "lru" evicts least-recently used keys first.
+    """
+
+    def __init__(self, ttl=None, sliding=False, max_bytes=None, eviction="gds"):
+        if eviction not in ("gds", "lru"):
+            raise ValueError(f"Unknown eviction order '{eviction}', expected 'gds' or 'lru'")
+
+        self.ttl = ttl
+        self.sliding = sliding
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+
+    def __repr__(self):
+        return (
+            f"RetentionPolicy(ttl={self.ttl}, sliding={self.sliding}, "
+            f"max_bytes={self.max_bytes}, eviction={self.eviction})"
+        )
+
+
+def _env_int(name, default):
+    # 0 or empty disables the limit
+    value = int(os.getenv(name, default) or 0)
+    return value if value > 0 else None
+
+
+# applies to any query function not listed in RETENTION_POLICIES.
+DEFAULT_POLICY = RetentionPolicy(
+    ttl=_env_int("CACHE_TTL", 7 * 24 * 60 * 60),
+    sliding=os.getenv("CACHE_TTL_SLIDING", "True") == "True",
+    max_bytes=_env_int("CACHE_MAX_BYTES_PER_DATASET", 0),
+    eviction=os.getenv("CACHE_EVICTION", "gds"),
+)
+
+# keyed by query function name.
+RETENTION_POLICIES = {
+    "commits_query": DEFAULT_POLICY,
+    "contributors_query": DEFAULT_POLICY,
+    "issues_query": DEFAULT_POLICY,
+    "prs_query": DEFAULT_POLICY,
+}
+
+
+def policy_for(func):
+    """
+    Retention policy for a query function's datasets.
+
+    Args:
+    -----
+        func (function | str): Query function used, or its name
+
+    Returns:
+    --------
+        RetentionPolicy: policy to apply.
+    """
+    name = func if isinstance(func, str) else func.__name__
+    return RETENTION_POLICIES.get(name, DEFAULT_POLICY)
@@ -0,0 +1,191 @@
+"""
+    Serialization of cached datasets.
+
+    Datasets are stored in Redis as Arrow IPC streams rather than CSV text.
+    Arrow keeps column types (int64 ids, tz-aware datetime64, categoricals)
+    intact across the round trip, so callbacks don't need to re-parse
+    strings after reading from the cache.
+
+    A frame's header (see partitions.header), kept in its attrs, is
+    stored in the stream's schema metadata, so it can be read without
+    reading the rows.
+"""
+import io
+import json
+import logging
+import pandas as pd
+import pyarrow as pa
+
+# every Arrow IPC stream begins with this continuation token.
+# values that don't start with it were written by the old CSV format.
+_ARROW_STREAM_PREFIX = b"\xff\xff\xff\xff"
+
+# schema metadata key of a frame's header.
+_HEADER_KEY = b"8knot.header"
+
+
+def to_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Converts a DataFrame to an Arrow table, with its header if it has one.
+
+    Args:
+    -----
+        df (pd.DataFrame): data to convert.
+
+    Returns:
+    --------
+        pa.Table: table, without the index.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    header = df.attrs.get("header")
+    if header is not None:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), _HEADER_KEY: json.dumps(header)})
+
+    return table
+
+
+def schema_header(schema: pa.Schema):
+    """
+    Header stored in an Arrow schema by 'to_table', None if there is none.
+    """
+    raw = (schema.metadata or {}).get(_HEADER_KEY)
+    return None if raw is None else json.loads(raw)
+
+
+def to_frame(table: pa.Table) -> pd.DataFrame:
+    """
+    Converts an Arrow table written by 'to_table' back to a DataFrame,
+    with its header in attrs.
+    """
+    df = table.to_pandas()
+    header = schema_header(table.schema)
+    if header is not None:
+        df.attrs["header"] = header
+    return df
+
+
+def serialize_df(df: pd.DataFrame) -> bytes:
+    """
+    Serializes a DataFrame to bytes in Arrow IPC stream format.
+
+    The index isn't stored- the query functions don't use it, and it
+    would otherwise come back as an extra column.
+
+    Args:
+    -----
+        df (pd.DataFrame): data to serialize.
+
+    Returns:
+    --------
+        bytes: Arrow IPC stream.
+    """
+    table = to_table(df)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue().to_pybytes()
+
+
+def deserialize_df(data: bytes) -> pd.DataFrame:
+    """
+    Deserializes bytes written by 'serialize_df' back into a DataFrame.
+
+    Values written before the switch to Arrow are CSV text; those are
+    still readable so that a deploy doesn't require a cache flush.
+
+    Args:
+    -----
+        data (bytes): Arrow IPC stream or legacy CSV text.
+
+    Returns:
+    --------
+        pd.DataFrame: deserialized data.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    if not data.startswith(_ARROW_STREAM_PREFIX):
+        logging.debug("CACHE_DESERIALIZE - LEGACY CSV VALUE")
+        return pd.read_csv(io.BytesIO(data), sep=",")
+
+    with pa.ipc.open_stream(pa.py_buffer(data)) as reader:
+        table = reader.read_all()
+
+    return to_frame(table)
+
+
+def read_header(data: bytes):
+    """
+    Reads the header of a value written by 'serialize_df', from the
+    stream's schema alone, without reading its rows.
+
+    Args:
+    -----
+        data (bytes): Arrow IPC stream or legacy CSV text.
+
+    Returns:
+    --------
+        dict | None: header, None if the value has none.
+    """
+    if isinstance(data, str) or not bytes(data[: len(_ARROW_STREAM_PREFIX)]) == _ARROW_STREAM_PREFIX:
+        return None
+
+    with pa.ipc.open_stream(pa.py_buffer(data)) as reader:
+        return schema_header(reader.schema)
+
+
+def concat_frames(frames: list) -> pd.DataFrame:
+    """
+    Concatenates per-repo DataFrames of one dataset type in a single pass.
+
+    Arrow decodes a column that's entirely missing in a repo's data as
+    object, and pandas would then upcast the column of the whole result to
+    object. Such columns are cast to the type the other frames agree on
+    before concatenating, and frames without rows are left out, so the
+    result keeps the query's column types. Likewise categorical columns
+    whose categories differ between repos get the union of them.
+
+    Args:
+    -----
+        frames ([pd.DataFrame]): per-repo data, in result order.
+
+    Returns:
+    --------
+        pd.DataFrame: concatenated data with a fresh index.
+    """
+    nonempty = [f for f in frames if len(f)]
+    if not nonempty:
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    # dtypes of each column across frames; most columns agree
+    seen = {}
+    for f in nonempty:
+        for c, t in f.dtypes.items():
+            seen.setdefault(c, set()).add(t)
+
+    known = {}
+    for c, ts in seen.items():
+        typed = [t for t in ts if t != object]
+        if len(ts) > 1 and len(typed) == 1:
+            known[c] = typed[0]
+        elif len(ts) > 1 and all(isinstance(t, pd.CategoricalDtype) for t in ts):
+            categories = pd.api.types.union_categoricals([pd.Categorical([], dtype=t) for t in ts]).categories
+            known[c] = pd.CategoricalDtype(categories)
+
+    if known:
+        aligned = []
+        for f in nonempty:
+            cast = {c: t for c, t in known.items() if c in f and f[c].dtype == object and f[c].isna().all()}
+            cast.update({c: t for c, t in known.items() if c in f and isinstance(t, pd.CategoricalDtype)})
+            if cast:
+                try:
+                    f = f.astype(cast)
+                except (TypeError, ValueError):
+                    logging.debug(f"CACHE_DESERIALIZE - COLUMNS {list(cast)} KEEP OBJECT DTYPE")
+            aligned.append(f)
+        nonempty = aligned
+
+    return pd.concat(nonempty, ignore_index=True)
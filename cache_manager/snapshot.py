@@ -0,0 +1,124 @@
+"""
+    Snapshots of the dataset cache.
+
+    A snapshot is one Arrow IPC file per dataset type holding every key with
+    its stored value- already serialized and compressed, so neither export
+    nor restore re-encodes data- its version and its watermark. Files are
+    written in record batches, so neither side holds a whole dataset type
+    in memory, and restore memory-maps them.
+
+    Usage:
+        python -m cache_manager.snapshot export [path]
+        python -m cache_manager.snapshot restore [path] [--force]
+
+    path defaults to CACHE_SNAPSHOT_PATH.
+"""
+import os
+import sys
+import argparse
+import logging
+import pyarrow as pa
+
+SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "/cache-snapshot")
+
+_SUFFIX = ".arrow"
+
+SCHEMA = pa.schema(
+    [
+        ("key", pa.string()),
+        ("version", pa.binary()),
+        ("watermark", pa.string()),
+        ("value", pa.large_binary()),
+    ]
+)
+
+
+class SnapshotWriter:
+    """
+    Writes one dataset type's snapshot file batch by batch. The file is
+    renamed into place when closed, so a crash never leaves a partial
+    snapshot where a complete one was.
+
+    Methods:
+    --------
+        write(keys, versions, watermarks, values):
+            Appends a batch of keys.
+
+        close():
+            Finishes the file and moves it into place.
+    """
+
+    def __init__(self, path, name):
+        os.makedirs(path, exist_ok=True)
+        self.path = os.path.join(path, f"{name}{_SUFFIX}")
+        self._tmp = f"{self.path}.tmp"
+        self._sink = pa.OSFile(self._tmp, "wb")
+        self._writer = pa.ipc.new_file(self._sink, SCHEMA)
+        self.count = 0
+
+    def write(self, keys, versions, watermarks, values):
+        batch = pa.record_batch(
+            [
+                pa.array(keys, pa.string()),
+                pa.array(versions, pa.binary()),
+                pa.array(watermarks, pa.string()),
+                pa.array([bytes(v) for v in values], pa.large_binary()),
+            ],
+            schema=SCHEMA,
+        )
+        self._writer.write_batch(batch)
+        self.count += len(keys)
+
+    def close(self):
+        self._writer.close()
+        self._sink.close()
+        os.replace(self._tmp, self.path)
+
+
+def read_snapshot(path):
+    """
+    Reads all snapshot files under path, batch by batch.
+
+    Args:
+    -----
+        path (str): snapshot directory.
+
+    Yields:
+    -------
+        (str, pa.RecordBatch): dataset type name and a batch of its keys.
+    """
+    if not os.path.isdir(path):
+        logging.warning(f"CACHE_SNAPSHOT - no snapshot at {path}")
+        return
+
+    for n in sorted(os.listdir(path)):
+        if not n.endswith(_SUFFIX):
+            continue
+
+        with pa.memory_map(os.path.join(path, n), "r") as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield n[: -len(_SUFFIX)], reader.get_batch(i)
+
+
+def main(argv=None):
+    from cache_manager.cache_manager import CacheManager
+
+    parser = argparse.ArgumentParser(prog="python -m cache_manager.snapshot", description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["export", "restore"])
+    parser.add_argument("path", nargs="?", default=SNAPSHOT_PATH)
+    parser.add_argument("--force", action="store_true", help="restore even if this Redis was already restored")
+    args = parser.parse_args(argv)
+
+    cache = CacheManager()
+    if args.command == "export":
+        n = cache.snapshot(args.path)
+        print(f"exported {n} keys to {args.path}")
+    else:
+        n = cache.restore(args.path, force=args.force)
+        print(f"restored {n} keys from {args.path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s %(levelname)-8s %(message)s", level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+    Usage tracking for cache warming.
+
+    Each search records the repos and orgs selected in a sorted set whose
+    scores are recency-weighted counts: a selection made one half-life ago
+    counts half as much as one made now. Rather than decaying every score
+    over time, new selections are weighted by 2 ** (age of epoch / half-life),
+    which ranks members identically without ever rewriting old scores.
+"""
+import os
+import time
+
+USAGE_KEY = "cache_usage:selections"
+
+# seconds after which a selection counts half as much.
+USAGE_HALF_LIFE = int(os.getenv("CACHE_USAGE_HALF_LIFE", str(7 * 24 * 60 * 60)))
+
+# members kept in the usage set, least popular are dropped beyond this.
+USAGE_MAX_MEMBERS = int(os.getenv("CACHE_USAGE_MAX_MEMBERS", "10000"))
+
+# scores grow by a factor of 2 every half-life from this point, so the
+# epoch has to be recent enough for them to stay well within float range.
+_EPOCH = 1640995200  # 2022-01-01 UTC
+
+
+def weight(now=None):
+    """
+    Score added for one selection made at 'now'.
+
+    Args:
+    -----
+        now (float | None): unix time, None for the current time.
+
+    Returns:
+    --------
+        float: weight of the selection.
+    """
+    now = time.time() if now is None else now
+    return 2.0 ** ((now - _EPOCH) / USAGE_HALF_LIFE)
+
+
+def decayed(score, now=None):
+    """
+    Converts a stored score into the equivalent number of selections made at 'now'.
+
+    Args:
+    -----
+        score (float): score read from the usage set.
+        now (float | None): unix time, None for the current time.
+
+    Returns:
+    --------
+        float: recency-weighted count of selections.
+    """
+    return score / weight(now)
@@ -0,0 +1,295 @@
+"""
+    Cache warming.
+
+    A periodic task, scheduled by Celery beat, that pre-populates the cache
+    for the most used repos and orgs (see 'record_usage' in update_output)
+    during off-peak hours, so the most viewed dashboards open warm.
+
+    Each run tops up the warming jobs in flight to CACHE_WARM_CONCURRENCY,
+    so the load warming puts on the database stays bounded no matter how
+    many selections are popular; work left over is picked up by the next
+    run. Jobs are claimed like any other query job, so users selecting a
+    repo that's being warmed attach to the warming job rather than
+    enqueuing their own.
+
+    A second task keeps what's cached fresh: every CACHE_REFRESH_INTERVAL
+    it queries only the rows changed since each cached dataset's watermark
+    and upserts them, see cache_manager/refresh.py.
+
+    With the Redis backend, the cache is also snapshotted to disk every
+    CACHE_SNAPSHOT_INTERVAL, and reloaded from the snapshot as soon as a
+    restarted, empty Redis is noticed, see cache_manager/snapshot.py.
+    Keys about to expire from Redis are copied to the disk tier every
+    CACHE_SPILL_INTERVAL, if the tier is enabled, see cache_manager/disk_tier.py.
+
+    These tasks run on their own "maintenance" queue, so that a long
+    snapshot or refresh pass never holds up the callback workers that
+    serve user requests; see the maintenance-worker in docker-compose.yml.
+"""
+import os
+import uuid
+import logging
+from datetime import datetime
+from redis import StrictRedis
+from celery.result import AsyncResult
+from app import augur_db
+from app_global import celery_app
+import worker_settings
+from app_callbacks import QUERIES, _parse_repo_choices, _parse_org_choices
+from cache_manager.backend import get_cache as cm
+from cache_manager import refresh
+from cache_manager.snapshot import SNAPSHOT_PATH
+
+# number of most used selections kept warm.
+WARM_TOP_N = int(os.getenv("CACHE_WARM_TOP_N", "20"))
+
+# off-peak window as "start-end" hours of the day in server time,
+# e.g. "22-6" wraps past midnight. Empty warms at any hour.
+WARM_HOURS = os.getenv("CACHE_WARM_HOURS", "1-6")
+
+# warming jobs allowed in flight at once.
+WARM_CONCURRENCY = int(os.getenv("CACHE_WARM_CONCURRENCY", "2"))
+
+# repos queried per warming job.
+WARM_BATCH = int(os.getenv("CACHE_WARM_BATCH", "50"))
+
+# seconds between runs.
+WARM_INTERVAL = int(os.getenv("CACHE_WARM_INTERVAL", "300"))
+
+# seconds between incremental refreshes of cached datasets, 0 disables.
+REFRESH_INTERVAL = int(os.getenv("CACHE_REFRESH_INTERVAL", str(6 * 60 * 60)))
+
+# seconds between snapshots of the cache, 0 disables snapshots and restores.
+SNAPSHOT_INTERVAL = int(os.getenv("CACHE_SNAPSHOT_INTERVAL", str(60 * 60)))
+
+# seconds between checks whether Redis restarted and needs restoring.
+RESTORE_CHECK_INTERVAL = int(os.getenv("CACHE_RESTORE_CHECK_INTERVAL", "60"))
+
+# seconds between copies of keys about to expire to the disk tier, 0 disables.
+SPILL_INTERVAL = int(os.getenv("CACHE_SPILL_INTERVAL", str(60 * 60)))
+
+# queue of the tasks below, served by a worker of their own.
+MAINTENANCE_QUEUE = os.getenv("CACHE_MAINTENANCE_QUEUE", "maintenance")
+
+# set of ids of warming jobs in flight, kept in Celery's broker
+# since it's bookkeeping of jobs, whatever the cache backend.
+_JOBS_KEY = "cache_warming:jobs"
+
+
+def _in_window(hour, window):
+    """
+    Whether 'hour' falls in an off-peak window "start-end", end exclusive.
+    """
+    if not window:
+        return True
+
+    start, end = (int(h) for h in window.split("-"))
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def _selection_repos(selections):
+    """
+    Repo ids of repo urls and org names, in order of first appearance.
+    Selections that are no longer in the database are skipped.
+    """
+    repo_ids = []
+    for s in selections:
+        try:
+            if s.startswith("http"):
+                ids, _ = _parse_repo_choices(repo_git_set=[s])
+            else:
+                ids, _ = _parse_org_choices(org_name_set=[s])
+        except KeyError:
+            logging.debug(f"CACHE_WARMING - UNKNOWN SELECTION {s}")
+            continue
+        repo_ids += ids
+
+    return list(dict.fromkeys(repo_ids))
+
+
+@celery_app.task
+def warm_cache():
+    """
+    (Worker Query)
+    Enqueues query jobs for the most used repos that aren't cached,
+    keeping at most WARM_CONCURRENCY warming jobs in flight.
+
+    Returns:
+    --------
+        [str]: ids of the jobs enqueued.
+    """
+    if not _in_window(datetime.now().hour, WARM_HOURS):
+        logging.debug("CACHE_WARMING - OUTSIDE OFF-PEAK WINDOW")
+        return []
+
+    cache = cm()
+    r = StrictRedis.from_url(worker_settings.REDIS_URL)
+
+    # forget warming jobs that have finished
+    in_flight = [j.decode("utf-8") for j in r.smembers(_JOBS_KEY)]
+    done = [j for j in in_flight if AsyncResult(j).ready()]
+    if done:
+        r.srem(_JOBS_KEY, *done)
+
+    budget = WARM_CONCURRENCY - (len(in_flight) - len(done))
+    if budget <= 0:
+        logging.debug("CACHE_WARMING - CONCURRENCY BUDGET IN USE")
+        return []
+
+    repos = _selection_repos([s for s, _ in cache.popular(WARM_TOP_N)])
+
+    logging.debug("CACHE_WARMING - START")
+    jobs = []
+    for f in QUERIES:
+        not_ready = cache.missing(f, repos)
+
+        for i in range(0, len(not_ready), WARM_BATCH):
+            if len(jobs) == budget:
+                break
+
+            job_id = str(uuid.uuid4())
+            claimed, _ = cache.claim(f, not_ready[i : i + WARM_BATCH], job_id)
+
+            # repos already pending are being fetched by someone else
+            if claimed:
+                r.sadd(_JOBS_KEY, job_id)
+                try:
+                    f.apply_async(args=(augur_db.package_config(), claimed), queue="data", task_id=job_id)
+                except Exception:
+                    # no job will remove the markers; free the repos for the next run.
+                    cache.release(f, claimed, job_id=job_id)
+                    r.srem(_JOBS_KEY, job_id)
+                    raise
+                jobs.append(job_id)
+
+    logging.debug(f"CACHE_WARMING - END, {len(jobs)} JOBS ENQUEUED")
+    return jobs
+
+
+@celery_app.task
+def refresh_cache():
+    """
+    (Worker Query)
+    Enqueues incremental refresh jobs for every cached dataset
+    that can be refreshed incrementally.
+
+    Returns:
+    --------
+        [str]: ids of the jobs enqueued.
+    """
+    cache = cm()
+
+    logging.debug("CACHE_REFRESH - START")
+    jobs = []
+    for f in QUERIES:
+        if refresh.spec_for(f) is None:
+            continue
+
+        repos = cache.cached_repos(f)
+        for i in range(0, len(repos), WARM_BATCH):
+            job_id = str(uuid.uuid4())
+
+            # repos already pending are being re-queried by someone else
+            claimed, _ = cache.claim(f, repos[i : i + WARM_BATCH], job_id)
+            if not claimed:
+                continue
+
+            marks = cache.watermarks(f, claimed)
+            since = [marks[r] for r in claimed]
+            try:
+                f.apply_async(args=(augur_db.package_config(), claimed, since), queue="data", task_id=job_id)
+            except Exception:
+                # no job will remove the markers; free the repos for the next run.
+                cache.release(f, claimed, job_id=job_id)
+                raise
+            jobs.append(job_id)
+
+    logging.debug(f"CACHE_REFRESH - END, {len(jobs)} JOBS ENQUEUED")
+    return jobs
+
+
+@celery_app.task
+def snapshot_cache():
+    """
+    (Worker Query)
+    Exports the cache to CACHE_SNAPSHOT_PATH.
+
+    Returns:
+    --------
+        int: number of keys exported.
+    """
+    cache = cm()
+    if not hasattr(cache, "snapshot"):
+        return 0
+    return cache.snapshot(SNAPSHOT_PATH)
+
+
+@celery_app.task
+def restore_cache():
+    """
+    (Worker Query)
+    Reloads the snapshot at CACHE_SNAPSHOT_PATH if Redis has restarted
+    since it was last restored; a no-op otherwise.
+
+    Returns:
+    --------
+        int: number of keys restored.
+    """
+    cache = cm()
+    if not hasattr(cache, "restore"):
+        return 0
+    return cache.restore(SNAPSHOT_PATH)
+
+
+@celery_app.task
+def spill_cache():
+    """
+    (Worker Query)
+    Copies keys about to expire from Redis to the disk tier.
+
+    Returns:
+    --------
+        int: number of keys spilled.
+    """
+    cache = cm()
+    if not hasattr(cache, "spill_expiring"):
+        return 0
+    return cache.spill_expiring()
+
+
+celery_app.conf.task_routes = {
+    **(celery_app.conf.task_routes or {}),
+    **{
+        t.name: {"queue": MAINTENANCE_QUEUE}
+        for t in (warm_cache, refresh_cache, snapshot_cache, restore_cache, spill_cache)
+    },
+}
+
+celery_app.conf.beat_schedule = {
+    **celery_app.conf.beat_schedule,
+    "warm-cache": {"task": warm_cache.name, "schedule": float(WARM_INTERVAL)},
+}
+
+if REFRESH_INTERVAL > 0:
+    celery_app.conf.beat_schedule["refresh-cache"] = {
+        "task": refresh_cache.name,
+        "schedule": float(REFRESH_INTERVAL),
+    }
+
+if SNAPSHOT_INTERVAL > 0:
+    celery_app.conf.beat_schedule["snapshot-cache"] = {
+        "task": snapshot_cache.name,
+        "schedule": float(SNAPSHOT_INTERVAL),
+    }
+    celery_app.conf.beat_schedule["restore-cache"] = {
+        "task": restore_cache.name,
+        "schedule": float(RESTORE_CHECK_INTERVAL),
+    }
+
+if SPILL_INTERVAL > 0:
+    celery_app.conf.beat_schedule["spill-cache"] = {
+        "task": spill_cache.name,
+        "schedule": float(SPILL_INTERVAL),
+    }
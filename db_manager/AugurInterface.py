@@ -3,8 +3,35 @@
 """
 import pandas as pd
 import sqlalchemy as salc
+import pyarrow as pa
+from pyarrow import csv
 import os
 import logging
+import threading
+
+# rows fetched from the database at a time by streaming queries.
+STREAM_CHUNK_ROWS = int(os.getenv("AUGUR_STREAM_CHUNK_ROWS", "50000"))
+
+# whether queries that opt into bulk export (see run_query_copy) use it.
+COPY_EXPORT = os.getenv("AUGUR_COPY_EXPORT", "True") == "True"
+
+# bytes of COPY output parsed at a time by the CSV reader.
+COPY_BLOCK_BYTES = int(os.getenv("AUGUR_COPY_BLOCK_BYTES", str(4 * 1024 * 1024)))
+
+# Arrow types of the Postgres types the CSV reader converts, by type oid.
+# Other types are read as strings.
+_ARROW_TYPES = {
+    16: pa.bool_(),  # bool
+    20: pa.int64(),  # int8
+    21: pa.int64(),  # int2
+    23: pa.int64(),  # int4
+    700: pa.float64(),  # float4
+    701: pa.float64(),  # float8
+    1700: pa.float64(),  # numeric
+    1082: pa.date32(),  # date
+    1114: pa.timestamp("us"),  # timestamp
+    1184: pa.timestamp("us", tz="UTC"),  # timestamptz
+}
 
 
 class AugurInterface:
@@ -53,6 +80,18 @@ class AugurInterface:
             Runs a SQL-query against Augur database and returns resulting
             Pandas dataframe.
 
+        run_query_stream(query_string, chunksize, parse_dates, dtype):
+            Runs a SQL-query on a server-side cursor and yields the results
+            as typed Pandas dataframes of at most 'chunksize' rows.
+
+        run_query_copy(query_string, chunksize, parse_dates, dtype):
+            Exports a SQL-query's results with COPY and yields them as
+            Pandas dataframes parsed by Arrow's CSV reader, like run_query_stream.
+
+        run_query_by_repo(query_string, repos, column, chunksize, parse_dates, dtype, copy):
+            Streams a SQL-query's results ordered by repo, yielding repos
+            whose rows have all arrived, a chunk's worth at a time.
+
         package_pconfig():
             Packages current credentials into a list for transportation to workers.
             We need to do this because _engine.Engine objects can't be pickled and
@@ -154,11 +193,227 @@ class AugurInterface:
         except:
             raise Exception("DB Read Failure")
 
-        result_df = result_df.reset_index()
-        result_df.drop("index", axis=1, inplace=True)
-
         return result_df
 
+    def run_query_stream(self, query_string: str, chunksize=None, parse_dates=None, dtype=None):
+        """
+        Runs SQL query against our Augur database on a server-side cursor,
+        so that only 'chunksize' rows are held in memory at a time rather
+        than the whole result.
+
+        Args:
+        -----
+            query_string (str): SQL query to run.
+            chunksize (int | None): rows per chunk, None reads AUGUR_STREAM_CHUNK_ROWS.
+            parse_dates (dict | None): column -> pd.to_datetime arguments, applied to every chunk.
+            dtype (dict | None): column -> type, applied to every chunk.
+
+        Yields:
+        -------
+            pd.DataFrame: Results from SQL query, chunk by chunk. A query
+                without results yields one empty frame with its columns.
+        """
+        if self.engine is None:
+            logging.critical("No engine- please use 'get_engine' method to create engine.")
+            return
+
+        chunksize = chunksize or STREAM_CHUNK_ROWS
+        query = salc.sql.text(query_string)
+
+        try:
+            with self.engine.connect() as conn:
+                conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+                for chunk in pd.read_sql_query(
+                    query, con=conn, chunksize=chunksize, parse_dates=parse_dates, dtype=dtype
+                ):
+                    yield chunk
+        except Exception as e:
+            raise Exception("DB Read Failure") from e
+
+    def run_query_copy(self, query_string: str, chunksize=None, parse_dates=None, dtype=None):
+        """
+        Runs SQL query against our Augur database as a bulk export,
+        COPY (query) TO STDOUT in CSV, parsed as it arrives by Arrow's
+        multithreaded CSV reader rather than row by row through the
+        driver. Column types come from the query's result description,
+        so every chunk is typed alike; large results are several times
+        quicker to extract than with run_query_stream.
+
+        Args:
+        -----
+            query_string (str): SQL query to run.
+            chunksize (int | None): least rows per chunk, None reads AUGUR_STREAM_CHUNK_ROWS.
+            parse_dates (dict | None): column -> pd.to_datetime arguments, applied to every chunk.
+            dtype (dict | None): column -> type, applied to every chunk.
+
+        Yields:
+        -------
+            pd.DataFrame: Results from SQL query, chunk by chunk. A query
+                without results yields one empty frame with its columns.
+        """
+        if self.engine is None:
+            logging.critical("No engine- please use 'get_engine' method to create engine.")
+            return
+
+        chunksize = chunksize or STREAM_CHUNK_ROWS
+
+        def frame(batches, schema):
+            df = pa.Table.from_batches(batches, schema=schema).to_pandas()
+            for c, kwargs in (parse_dates or {}).items():
+                df[c] = pd.to_datetime(df[c], **kwargs)
+            return df.astype(dtype) if dtype else df
+
+        try:
+            conn = self.engine.raw_connection()
+        except Exception as e:
+            raise Exception("DB Read Failure") from e
+
+        source = sink = None
+        failed, complete = [], False
+        try:
+            cur = conn.cursor()
+            # ISO dates are what the CSV reader parses
+            cur.execute("SET LOCAL DateStyle TO ISO")
+            cur.execute(f"SELECT * FROM ({query_string}) AS q LIMIT 0")
+            names = [d[0] for d in cur.description]
+            types = {d[0]: _ARROW_TYPES.get(d[1], pa.string()) for d in cur.description}
+
+            # the export is written to a pipe by a thread while it's parsed here,
+            # so neither side holds the whole result.
+            r, w = os.pipe()
+            source, sink = os.fdopen(r, "rb"), os.fdopen(w, "wb")
+
+            def export():
+                try:
+                    cur.copy_expert(f"COPY ({query_string}) TO STDOUT WITH (FORMAT csv)", sink)
+                    sink.close()
+                except Exception as e:
+                    failed.append(e)
+                    # the reader stopped early, or the export failed
+                    try:
+                        sink.close()
+                    except OSError:
+                        pass
+
+            exporter = threading.Thread(target=export, daemon=True)
+            exporter.start()
+
+            # no output at all for a query without results
+            if not source.peek(1):
+                exporter.join()
+                if failed:
+                    raise failed[0]
+                yield frame([], pa.schema([(n, types[n]) for n in names]))
+                complete = True
+                return
+
+            reader = csv.open_csv(
+                source,
+                read_options=csv.ReadOptions(column_names=names, block_size=COPY_BLOCK_BYTES),
+                convert_options=csv.ConvertOptions(
+                    column_types=types,
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=False,
+                    # COPY writes booleans as t and f
+                    true_values=["t"],
+                    false_values=["f"],
+                ),
+            )
+
+            batches, rows, empty = [], 0, True
+            for batch in reader:
+                batches.append(batch)
+                rows += batch.num_rows
+                if rows >= chunksize:
+                    yield frame(batches, reader.schema)
+                    batches, rows, empty = [], 0, False
+
+            exporter.join()
+            if failed:
+                raise failed[0]
+
+            if batches or empty:
+                yield frame(batches, reader.schema)
+            complete = True
+        except Exception as e:
+            raise Exception("DB Read Failure") from e
+        finally:
+            if source is not None:
+                # unblocks the export if the caller stopped reading early
+                source.close()
+
+            # a connection left mid-COPY can't be reused
+            if complete:
+                conn.close()
+            else:
+                conn.invalidate()
+
+    def run_query_by_repo(
+        self, query_string: str, repos, column="id", chunksize=None, parse_dates=None, dtype=None, copy=False
+    ):
+        """
+        Streams SQL query results grouped by repo. The query must order its
+        rows by the repo column, so that a repo's rows are complete once
+        rows of the next repo arrive; memory held is then about a chunk
+        plus the largest repo, rather than the whole result.
+
+        Args:
+        -----
+            query_string (str): SQL query to run, ordered by 'column'.
+            repos (list[int]): repos the query selects.
+            column (str): column holding the repo id.
+            chunksize (int | None): rows per chunk, None reads AUGUR_STREAM_CHUNK_ROWS.
+            parse_dates (dict | None): column -> pd.to_datetime arguments, see run_query_stream.
+            dtype (dict | None): column -> type, see run_query_stream.
+            copy (bool): read the results with run_query_copy if AUGUR_COPY_EXPORT
+                is set, rather than run_query_stream.
+
+        Yields:
+        -------
+            (list[int], list[pd.DataFrame]): repos whose rows have all arrived
+                and their rows, about 'chunksize' rows at a time. Repos
+                without rows come last, with empty frames.
+        """
+        chunksize = chunksize or STREAM_CHUNK_ROWS
+        by_id = {str(r): r for r in repos}
+
+        empty = None
+        current, parts = None, []
+        done, frames, rows = [], [], 0
+        seen = set()
+
+        read = self.run_query_copy if copy and COPY_EXPORT else self.run_query_stream
+        for chunk in read(query_string, chunksize, parse_dates, dtype):
+            if empty is None:
+                empty = chunk.iloc[:0]
+
+            for r, g in chunk.groupby(column, sort=False):
+                if current is not None and r != current:
+                    done.append(by_id.get(str(current), current))
+                    frames.append(pd.concat(parts, ignore_index=True))
+                    rows += len(frames[-1])
+                    parts = []
+                current = r
+                parts.append(g)
+
+            if rows >= chunksize:
+                seen.update(done)
+                yield done, frames
+                done, frames, rows = [], [], 0
+
+        if current is not None:
+            done.append(by_id.get(str(current), current))
+            frames.append(pd.concat(parts, ignore_index=True))
+        seen.update(done)
+
+        for r in repos:
+            if r not in seen:
+                done.append(r)
+                frames.append(empty.copy() if empty is not None else pd.DataFrame())
+
+        if done:
+            yield done, frames
+
     def package_config(self):
         """
         Packages current credentials into a list for transportation to workers.
@@ -11,7 +11,7 @@ from pages.utils.job_utils import nodata_graph
 from queries.contributors_query import contributors_query as ctq
 import time
 import io
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
 
 gc_contrib_drive_repeat = dbc.Card(
     [
@@ -140,14 +140,21 @@ def graph_title(view):
 )
 def repeat_drive_by_graph(repolist, contribs, view):
 
-    # wait for data to asynchronously download and become available.
+    # wait for data to asynchronously download and become available,
+    # figure is only computed if an identical one isn't cached.
     cache = cm()
-    df = cache.grabm(func=ctq, repos=repolist)
-    while df is None:
-        time.sleep(1.0)
-        df = cache.grabm(func=ctq, repos=repolist)
+    fig = cache.grab_figure(
+        viz_id="cont-drive-repeat",
+        func=ctq,
+        repos=repolist,
+        params=(contribs, view),
+        compute=lambda df: compute_figure(df, contribs, view),
+    )
+
+    return fig
+
 
-    # data ready.
+def compute_figure(df, contribs, view):
     start = time.perf_counter()
     logging.debug("CONTRIB_DRIVE_REPEAT_VIZ - START")
 
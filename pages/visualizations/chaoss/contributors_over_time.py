@@ -13,7 +13,7 @@ from pages.utils.job_utils import nodata_graph
 from queries.contributors_query import contributors_query as ctq
 import time
 import io
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
 
 gc_contributors_over_time = dbc.Card(
     [
@@ -129,13 +129,21 @@ def toggle_popover_3(n, is_open):
 )
 def create_contrib_over_time_graph(repolist, contribs, interval):
 
-    # wait for data to asynchronously download and become available.
+    # wait for data to asynchronously download and become available,
+    # figure is only computed if an identical one isn't cached.
     cache = cm()
-    df = cache.grabm(func=ctq, repos=repolist)
-    while df is None:
-        time.sleep(1.0)
-        df = cache.grabm(func=ctq, repos=repolist)
+    fig = cache.grab_figure(
+        viz_id="contributors-over-time",
+        func=ctq,
+        repos=repolist,
+        params=(contribs, interval),
+        compute=lambda df: compute_figure(df, contribs, interval),
+    )
+
+    return fig
+
 
+def compute_figure(df, contribs, interval):
     start = time.perf_counter()
     logging.debug("CONTRIB_DRIVE_REPEAT_VIZ - START")
 
@@ -168,8 +176,7 @@ def process_data(df, interval, contribs):
     df_drive_temp = df.loc[~df["cntrb_id"].isin(contributors)]
     df_repeat_temp = df.loc[df["cntrb_id"].isin(contributors)]
 
-    # order values chronologically by creation date
-    df = df.sort_values(by="created", axis=0, ascending=True)
+    # values come from the cache ordered chronologically by creation date
 
     # variable to slice on to handle weekly period edge case
     period_slice = None
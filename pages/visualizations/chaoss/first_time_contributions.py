@@ -8,7 +8,7 @@ import logging
 import plotly.express as px
 from pages.utils.graph_utils import color_seq
 from queries.contributors_query import contributors_query as ctq
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
 import io
 import time
 from pages.utils.job_utils import nodata_graph
@@ -71,20 +71,28 @@ def toggle_popover_2(n, is_open):
 )
 def create_first_time_contributors_graph(repolist):
 
-    # wait for data to asynchronously download and become available.
+    # wait for data to asynchronously download and become available,
+    # figure is only computed if an identical one isn't cached.
     cache = cm()
-    df = cache.grabm(func=ctq, repos=repolist)
-    while df is None:
-        time.sleep(1.0)
-        df = cache.grabm(func=ctq, repos=repolist)
+    fig = cache.grab_figure(
+        viz_id="first-time-contributions",
+        func=ctq,
+        repos=repolist,
+        params=(),
+        compute=compute_figure,
+    )
+
+    return fig
+
 
+def compute_figure(df):
     start = time.perf_counter()
     logging.debug("CONTRIB_DRIVE_REPEAT_VIZ - START")
 
     # test if there is data
     if df.empty:
         logging.debug("1ST CONTRIBUTIONS - NO DATA AVAILABLE")
-        return nodata_graph, False
+        return nodata_graph
 
     # function for all data pre processing
     df = process_data(df)
@@ -10,7 +10,8 @@ import plotly.express as px
 from pages.utils.graph_utils import get_graph_time_values, color_seq
 from queries.contributors_query import contributors_query as ctq
 import io
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
+from cache_manager import partitions
 from pages.utils.job_utils import nodata_graph
 
 import time
@@ -154,20 +155,28 @@ def active_drifting_contributors_graph(repolist, interval, drift_interval, away_
     if drift_interval > away_interval:
         return dash.no_update, True
 
-    # wait for data to asynchronously download and become available.
+    # wait for data to asynchronously download and become available,
+    # figure is only computed if an identical one isn't cached.
     cache = cm()
-    df = cache.grabm(func=ctq, repos=repolist)
-    while df is None:
-        time.sleep(1.0)
-        df = cache.grabm(func=ctq, repos=repolist)
+    fig = cache.grab_figure(
+        viz_id="active_drifting_contributors",
+        func=ctq,
+        repos=repolist,
+        params=(interval, drift_interval, away_interval),
+        compute=lambda df: compute_figure(df, interval, drift_interval, away_interval),
+    )
+
+    return fig, False
+
 
+def compute_figure(df, interval, drift_interval, away_interval):
     logging.debug(f"ACTIVE_DRIFTING_CONTRIBUTOR_GROWTH_VIZ - START")
     start = time.perf_counter()
 
     # test if there is data
     if df.empty:
         logging.debug("PULL REQUEST STALENESS - NO DATA AVAILABLE")
-        return nodata_graph, False
+        return nodata_graph
 
     # function for all data pre processing
     df_status = process_data(df, interval, drift_interval, away_interval)
@@ -175,21 +184,20 @@ def active_drifting_contributors_graph(repolist, interval, drift_interval, away_
     fig = create_figure(df_status, interval)
 
     logging.debug(f"ACTIVE_DRIFTING_CONTRIBUTOR_GROWTH_VIZ - END - {time.perf_counter() - start}")
-    return fig, False
+    return fig
 
 
 def process_data(df: pd.DataFrame, interval, drift_interval, away_interval):
 
-    # convert to datetime objects with consistent column name
+    # convert to datetime objects
     df["created_at"] = pd.to_datetime(df["created_at"], utc=True)
-    df.rename(columns={"created_at": "created"}, inplace=True)
 
-    # order from beginning of time to most recent
-    df = df.sort_values("created", axis=0, ascending=True)
+    # rows come from the cache ordered from beginning of time to most recent,
+    # so the earliest and latest events are in its header
+    earliest, latest = partitions.bounds(df, "created_at")
 
-    # first and last elements of the dataframe are the
-    # earliest and latest events respectively
-    earliest, latest = df["created"].min(), df["created"].max()
+    # consistent column name
+    df.rename(columns={"created_at": "created"}, inplace=True)
 
     # beginning to the end of time by the specified interval
     dates = pd.date_range(start=earliest, end=latest, freq=interval, inclusive="both")
@@ -8,7 +8,7 @@ import logging
 import plotly.express as px
 from pages.utils.graph_utils import get_graph_time_values, color_seq
 from queries.commits_query import commits_query as cmq
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
 from pages.utils.job_utils import nodata_graph
 import io
 import time
@@ -108,14 +108,21 @@ def toggle_popover_2(n, is_open):
 )
 def commits_over_time_graph(repolist, interval):
 
-    # wait for data to asynchronously download and become available.
+    # wait for data to asynchronously download and become available,
+    # figure is only computed if an identical one isn't cached.
     cache = cm()
-    df = cache.grabm(func=cmq, repos=repolist)
-    while df is None:
-        time.sleep(1.0)
-        df = cache.grabm(func=cmq, repos=repolist)
+    fig = cache.grab_figure(
+        viz_id="commits-over-time",
+        func=cmq,
+        repos=repolist,
+        params=(interval,),
+        compute=lambda df: compute_figure(df, interval),
+    )
+
+    return fig
+
 
-    # data ready.
+def compute_figure(df, interval):
     start = time.perf_counter()
     logging.debug("COMMITS_OVER_TIME_VIZ - START")
 
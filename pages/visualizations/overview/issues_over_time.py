@@ -9,7 +9,8 @@ import logging
 from pages.utils.graph_utils import get_graph_time_values, color_seq
 from pages.utils.job_utils import nodata_graph
 from queries.issues_query import issues_query as iq
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
+from cache_manager import partitions
 import io
 import time
 
@@ -109,14 +110,21 @@ def toggle_popover_3(n, is_open):
 )
 def issues_over_time_graph(repolist, interval):
 
-    # wait for data to asynchronously download and become available.
+    # wait for data to asynchronously download and become available,
+    # figure is only computed if an identical one isn't cached.
     cache = cm()
-    df = cache.grabm(func=iq, repos=repolist)
-    while df is None:
-        time.sleep(1.0)
-        df = cache.grabm(func=iq, repos=repolist)
+    fig = cache.grab_figure(
+        viz_id="issues-over-time",
+        func=iq,
+        repos=repolist,
+        params=(interval,),
+        compute=lambda df: compute_figure(df, interval),
+    )
+
+    return fig
+
 
-    # data ready.
+def compute_figure(df, interval):
     start = time.perf_counter()
     logging.debug("ISSUES OVER TIME - START")
 
@@ -141,8 +149,7 @@ def process_data(df: pd.DataFrame, interval):
     df["created"] = pd.to_datetime(df["created"], utc=True)
     df["closed"] = pd.to_datetime(df["closed"], utc=True)
 
-    # order values chronologically by creation date
-    df = df.sort_values(by="created", axis=0, ascending=True)
+    # values come from the cache ordered chronologically by creation date
 
     # variable to slice on to handle weekly period edge case
     period_slice = None
@@ -174,10 +181,11 @@ def process_data(df: pd.DataFrame, interval):
         df_created["Date"] = df_created["Date"].dt.strftime("%Y-01-01")
         df_closed["Date"] = df_closed["Date"].dt.strftime("%Y-01-01")
 
-    # first and last elements of the dataframe are the
-    # earliest and latest events respectively
-    earliest = df["created"].min()
-    latest = max(df["created"].max(), df["closed"].max())
+    # earliest and latest events. the bounds of "created", which rows are
+    # sorted by, come from the cache's header; "closed" isn't sorted and
+    # isn't in the header, so its latest time still takes a scan.
+    earliest, latest = partitions.bounds(df, "created")
+    latest = max(latest, df["closed"].max())
 
     # beginning to the end of time by the specified interval
     dates = pd.date_range(start=earliest, end=latest, freq="D", inclusive="both")
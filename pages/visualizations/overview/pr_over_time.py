@@ -11,7 +11,8 @@ from pages.utils.graph_utils import get_graph_time_values, color_seq
 import io
 from pages.utils.job_utils import nodata_graph
 from queries.prs_query import prs_query as prq
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
+from cache_manager import partitions
 import time
 
 gc_pr_over_time = dbc.Card(
@@ -109,14 +110,21 @@ def toggle_popover_7(n, is_open):
 )
 def prs_over_time_graph(repolist, interval):
 
-    # wait for data to asynchronously download and become available.
+    # wait for data to asynchronously download and become available,
+    # figure is only computed if an identical one isn't cached.
     cache = cm()
-    df = cache.grabm(func=prq, repos=repolist)
-    while df is None:
-        time.sleep(1.0)
-        df = cache.grabm(func=prq, repos=repolist)
+    fig = cache.grab_figure(
+        viz_id="prs-over-time",
+        func=prq,
+        repos=repolist,
+        params=(interval,),
+        compute=lambda df: compute_figure(df, interval),
+    )
+
+    return fig
+
 
-    # data ready.
+def compute_figure(df, interval):
     start = time.perf_counter()
     logging.debug("PULL REQUESTS OVER TIME - START")
 
@@ -142,8 +150,7 @@ def process_data(df: pd.DataFrame, interval):
     df["merged"] = pd.to_datetime(df["merged"], utc=True)
     df["closed"] = pd.to_datetime(df["closed"], utc=True)
 
-    # order values chronologically by creation date
-    df = df.sort_values(by="created", axis=0, ascending=True)
+    # values come from the cache ordered chronologically by creation date
 
     # variable to slice on to handle weekly period edge case
     period_slice = None
@@ -185,10 +192,11 @@ def process_data(df: pd.DataFrame, interval):
 
     # ----- Open PR processinging starts here ----
 
-    # first and last elements of the dataframe are the
-    # earliest and latest events respectively
-    earliest = df["created"].min()
-    latest = max(df["created"].max(), df["closed"].max())
+    # earliest and latest events. the bounds of "created", which rows are
+    # sorted by, come from the cache's header; "closed" isn't sorted and
+    # isn't in the header, so its latest time still takes a scan.
+    earliest, latest = partitions.bounds(df, "created")
+    latest = max(latest, df["closed"].max())
 
     # beginning to the end of time by the specified interval
     dates = pd.date_range(start=earliest, end=latest, freq="D", inclusive="both")
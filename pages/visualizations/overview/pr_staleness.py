@@ -13,7 +13,8 @@ from pages.utils.job_utils import nodata_graph
 from queries.prs_query import prs_query as prq
 import time
 import io
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
+from cache_manager import partitions
 
 gc_pr_staleness = dbc.Card(
     [
@@ -167,20 +168,28 @@ def new_staling_prs_graph(repolist, interval, staling_interval, stale_interval):
     if staling_interval is None or stale_interval is None:
         return dash.no_update, dash.no_update
 
-    # wait for data to asynchronously download and become available.
+    # wait for data to asynchronously download and become available,
+    # figure is only computed if an identical one isn't cached.
     cache = cm()
-    df = cache.grabm(func=prq, repos=repolist)
-    while df is None:
-        time.sleep(1.0)
-        df = cache.grabm(func=prq, repos=repolist)
+    fig = cache.grab_figure(
+        viz_id="pr_staleness",
+        func=prq,
+        repos=repolist,
+        params=(interval, staling_interval, stale_interval),
+        compute=lambda df: compute_figure(df, interval, staling_interval, stale_interval),
+    )
+
+    return fig, False
 
+
+def compute_figure(df, interval, staling_interval, stale_interval):
     start = time.perf_counter()
     logging.debug("PULL REQUEST STALENESS - START")
 
     # test if there is data
     if df.empty:
         logging.debug("PULL REQUEST STALENESS  - NO DATA AVAILABLE")
-        return nodata_graph, False
+        return nodata_graph
 
     # function for all data pre processing
     df_status = process_data(df, interval, staling_interval, stale_interval)
@@ -188,7 +197,7 @@ def new_staling_prs_graph(repolist, interval, staling_interval, stale_interval):
     fig = create_figure(df_status, interval)
 
     logging.debug(f"PULL REQUEST STALENESS - END - {time.perf_counter() - start}")
-    return fig, False
+    return fig
 
 
 def process_data(df: pd.DataFrame, interval, staling_interval, stale_interval):
@@ -198,13 +207,13 @@ def process_data(df: pd.DataFrame, interval, staling_interval, stale_interval):
     df["merged"] = pd.to_datetime(df["merged"], utc=True)
     df["closed"] = pd.to_datetime(df["closed"], utc=True)
 
-    # order values chronologically by creation date
-    df = df.sort_values(by="created", axis=0, ascending=True)
+    # values come from the cache ordered chronologically by creation date
 
-    # first and last elements of the dataframe are the
-    # earliest and latest events respectively
-    earliest = df["created"].min()
-    latest = max(df["created"].max(), df["closed"].max())
+    # earliest and latest events. the bounds of "created", which rows are
+    # sorted by, come from the cache's header; "closed" isn't sorted and
+    # isn't in the header, so its latest time still takes a scan.
+    earliest, latest = partitions.bounds(df, "created")
+    latest = max(latest, df["closed"].max())
 
     # generating buckets beginning to the end of time by the specified interval
     dates = pd.date_range(start=earliest, end=latest, freq=interval, inclusive="both")
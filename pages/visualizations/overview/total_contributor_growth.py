@@ -9,7 +9,7 @@ import plotly.express as px
 from pages.utils.graph_utils import get_graph_time_values, color_seq
 from queries.contributors_query import contributors_query as ctq
 import io
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
 from pages.utils.job_utils import nodata_graph
 
 import time
@@ -120,13 +120,21 @@ def graph_title(view):
 )
 def total_contributor_growth_graph(repolist, interval):
 
-    # wait for data to asynchronously download and become available.
+    # wait for data to asynchronously download and become available,
+    # figure is only computed if an identical one isn't cached.
     cache = cm()
-    df = cache.grabm(func=ctq, repos=repolist)
-    while df is None:
-        time.sleep(1.0)
-        df = cache.grabm(func=ctq, repos=repolist)
+    fig = cache.grab_figure(
+        viz_id="total_contributor_growth",
+        func=ctq,
+        repos=repolist,
+        params=(interval,),
+        compute=lambda df: compute_figure(df, interval),
+    )
+
+    return fig
+
 
+def compute_figure(df, interval):
     logging.debug("TOTAL_CONTRIBUTOR_GROWTH_VIZ - START")
     start = time.perf_counter()
 
@@ -150,8 +158,7 @@ def process_data(df, interval):
     df["created_at"] = pd.to_datetime(df["created_at"], utc=True)
     df.rename(columns={"created_at": "created"}, inplace=True)
 
-    # order from beginning of time to most recent
-    df = df.sort_values("created", axis=0, ascending=True)
+    # rows come from the cache ordered from beginning of time to most recent
 
     """
         Assume that the cntrb_id values are unique to individual contributors.
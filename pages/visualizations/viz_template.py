@@ -10,7 +10,7 @@ import plotly.express as px
 from pages.utils.graph_utils import get_graph_time_values, color_seq
 from queries.QUERY_USED import QUERY_NAME as QUERY_INITIALS
 import io
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
 from pages.utils.job_utils import nodata_graph
 import time
 
@@ -190,12 +190,24 @@ def toggle_popover(n, is_open):
 )
 def NAME_OF_VISUALIZATION_graph(repolist, interval):
 
-    # wait for data to asynchronously download and become available.
+    # wait for data to asynchronously download and become available,
+    # figure is only computed if an identical one isn't cached.
     cache = cm()
-    df = cache.grabm(func=QUERY_INITIALS, repos=repolist)
-    while df is None:
-        time.sleep(1.0)
-        df = cache.grabm(func=QUERY_INITIALS, repos=repolist)
+    fig = cache.grab_figure(
+        viz_id=VIZ_ID,
+        func=QUERY_INITIALS,
+        repos=repolist,
+        # ALL INPUTS OTHER THAN repolist THAT THE FIGURE DEPENDS ON
+        params=(interval,),
+        compute=lambda df: compute_figure(df, interval),
+    )
+
+    return fig
+
+
+def compute_figure(df, interval):
+    """Builds the figure from the cached data. Only runs if an identical
+    figure isn't already cached, COULD HAVE ADDITIONAL INPUTS."""
 
     start = time.perf_counter()
     logging.debug(f"{VIZ_ID}- START")
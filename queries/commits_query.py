@@ -1,8 +1,14 @@
 import logging
+import time
 from db_manager.AugurInterface import AugurInterface
 from app_global import celery_app
-import pandas as pd
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
+from cache_manager import refresh
+
+# version of the data this query stores. bump it when a change to the SQL or
+# the processing below changes the rows or columns stored, so that data
+# cached by the previous version is no longer read.
+SCHEMA_VERSION = 1
 
 
 @celery_app.task(
@@ -12,7 +18,7 @@ from cache_manager.cache_manager import CacheManager as cm
     retry_kwargs={"max_retries": 5},
     retry_jitter=True,
 )
-def commits_query(self, dbmc, repos):
+def commits_query(self, dbmc, repos, since=None):
     """
     (Worker Query)
     Executes SQL query against Augur database for commit data.
@@ -23,6 +29,10 @@ def commits_query(self, dbmc, repos):
 
         repo_ids ([str]): repos that SQL query is executed on.
 
+        since ([str | None] | None): each repo's watermark (see CacheManager.watermarks).
+            If given, only rows changed since the watermark are queried and
+            upserted into the cached data rather than replacing it.
+
     Returns:
     --------
         dict: Results from SQL query, interpreted from pd.to_dict('records')
@@ -32,6 +42,11 @@ def commits_query(self, dbmc, repos):
     if len(repos) == 0:
         return None
 
+    # incremental refresh only selects rows changed since each repo's watermark
+    since_sql = ""
+    if since is not None:
+        since_sql = "AND " + refresh.since_clause(repos, since, "c.repo_id", ["c.cmt_author_date"])
+
     # commenting-outunused query components. only need the repo_id and the
     # authorship date for our current queries. remove the '--' to re-add
     # the now-removed values.
@@ -51,38 +66,38 @@ def commits_query(self, dbmc, repos):
                         ON r.repo_id = c.repo_id
                     WHERE
                         c.repo_id in ({str(repos)[1:-1]})
+                        {since_sql}
+                    ORDER BY
+                        r.repo_id
                     """
 
     # create database connection, load config, execute query above.
+    # its duration is recorded with the data for cost-aware eviction.
+    start = time.perf_counter()
     dbm = AugurInterface()
     dbm.load_pconfig(dbmc)
-    df_commits = dbm.run_query(query_string)
-
-    # break apart returned data per repo
-    # and temporarily store in List to be
-    # stored in Redis.
-    pic = []
-    for r in repos:
-        # convert series to a dataframe
-        # once we've stored the data by ID we no longer need the column.
-        c_df = pd.DataFrame(df_commits.loc[df_commits["id"] == r].drop(columns=["id"]))
 
-        # try to convert dates in date-columns to posix timestamps
-        try:
-            c_df["date"] = pd.Timestamp(c_df["date"]).timestamp()
-        except:
-            pass
+    cm_o = cm()
 
-        # add pickled dataframe to list of pickled objects
-        pic.append(c_df.to_csv(index=False))
+    # results are exported in bulk with COPY, streamed in repo order and
+    # stored as each batch of repos completes, so memory held doesn't
+    # grow with the selection.
+    # dates are parsed to datetime objects; the cache stores typed columns
+    # so visualizations don't have to re-parse date strings.
+    acks = []
+    for done, pic in dbm.run_query_by_repo(query_string, repos, parse_dates={"date": {"utc": True}}, copy=True):
+        cost = time.perf_counter() - start
 
-    del df_commits
+        # once we've stored the data by ID we no longer need the column.
+        pic = [c_df.drop(columns=["id"]) for c_df in pic]
 
-    # store results in Redis
-    cm_o = cm()
+        # 'ack' is a boolean of whether data was set correctly or not.
+        if since is None:
+            acks.append(cm_o.setm(func=commits_query, repos=done, datas=pic, cost=cost))
+        else:
+            acks.append(cm_o.upsert(func=commits_query, repos=done, datas=pic))
 
-    # 'ack' is a boolean of whether data was set correctly or not.
-    ack = cm_o.setm(func=commits_query, repos=repos, datas=pic)
+        start = time.perf_counter()
 
     logging.debug("COMMITS_DATA_QUERY - END")
-    return ack
+    return all(acks)
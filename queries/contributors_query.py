@@ -1,8 +1,14 @@
 import logging
-import pandas as pd
+import time
 from db_manager.AugurInterface import AugurInterface
 from app_global import celery_app
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
+from cache_manager import refresh
+
+# version of the data this query stores. bump it when a change to the SQL or
+# the processing below changes the rows or columns stored, so that data
+# cached by the previous version is no longer read.
+SCHEMA_VERSION = 1
 
 
 @celery_app.task(
@@ -12,7 +18,7 @@ from cache_manager.cache_manager import CacheManager as cm
     retry_kwargs={"max_retries": 5},
     retry_jitter=True,
 )
-def contributors_query(self, dbmc, repos):
+def contributors_query(self, dbmc, repos, since=None):
     """
     (Worker Query)
     Executes SQL query against Augur database for contributor data.
@@ -23,6 +29,10 @@ def contributors_query(self, dbmc, repos):
 
         repo_ids ([str]): repos that SQL query is executed on.
 
+        since ([str | None] | None): each repo's watermark (see CacheManager.watermarks).
+            If given, only rows changed since the watermark are queried and
+            upserted into the cached data rather than replacing it.
+
     Returns:
     --------
         dict: Results from SQL query, interpreted from pd.to_dict('records')
@@ -32,6 +42,11 @@ def contributors_query(self, dbmc, repos):
     if len(repos) == 0:
         return None
 
+    # incremental refresh only selects rows changed since each repo's watermark
+    since_sql = ""
+    if since is not None:
+        since_sql = "AND " + refresh.since_clause(repos, since, "repo_id", ["created_at"])
+
     query_string = f"""
                     SELECT
                         repo_id as id,
@@ -44,40 +59,45 @@ def contributors_query(self, dbmc, repos):
                         augur_data.explorer_contributor_actions
                     WHERE
                         repo_id in ({str(repos)[1:-1]})
+                        {since_sql}
+                    ORDER BY
+                        repo_id
                 """
 
     # create database connection, load config, execute query above.
+    # its duration is recorded with the data for cost-aware eviction.
+    start = time.perf_counter()
     dbm = AugurInterface()
     dbm.load_pconfig(dbmc)
-    df_cont = dbm.run_query(query_string)
-
-    # update column values
-    df_cont.loc[df_cont["action"] == "open_pull_request", "action"] = "Open PR"
-    df_cont.loc[df_cont["action"] == "pull_request_comment", "action"] = "PR Comment"
-    df_cont.loc[df_cont["action"] == "issue_opened", "action"] = "Issue Opened"
-    df_cont.loc[df_cont["action"] == "issue_closed", "action"] = "Issue Closed"
-    df_cont.loc[df_cont["action"] == "commit", "action"] = "Commit"
-    df_cont.rename(columns={"action": "Action"}, inplace=True)
-
-    df_cont = df_cont.reset_index()
-    df_cont.drop("index", axis=1, inplace=True)
 
-    pic = []
-
-    for i, r in enumerate(repos):
-        # convert series to a dataframe
-        c_df = pd.DataFrame(df_cont.loc[df_cont["id"] == r]).to_csv()
-
-        # add pickled dataframe to list of pickled objects
-        pic.append(c_df)
-
-    del df_cont
-
-    # store results in Redis
     cm_o = cm()
 
-    # 'ack' is a boolean of whether data was set correctly or not.
-    ack = cm_o.setm(func=contributors_query, repos=repos, datas=pic)
+    # results are exported in bulk with COPY, streamed in repo order and
+    # stored as each batch of repos completes, so memory held doesn't
+    # grow with the selection.
+    # typed columns survive the round trip through the cache
+    acks = []
+    for done, pic in dbm.run_query_by_repo(query_string, repos, parse_dates={"created_at": {"utc": True}}, copy=True):
+        cost = time.perf_counter() - start
+
+        for df_cont in pic:
+            # update column values
+            df_cont.loc[df_cont["action"] == "open_pull_request", "action"] = "Open PR"
+            df_cont.loc[df_cont["action"] == "pull_request_comment", "action"] = "PR Comment"
+            df_cont.loc[df_cont["action"] == "issue_opened", "action"] = "Issue Opened"
+            df_cont.loc[df_cont["action"] == "issue_closed", "action"] = "Issue Closed"
+            df_cont.loc[df_cont["action"] == "commit", "action"] = "Commit"
+            df_cont.rename(columns={"action": "Action"}, inplace=True)
+            df_cont["Action"] = df_cont["Action"].astype("category")
+
+        # 'ack' is a boolean of whether data was set correctly or not.
+        if since is None:
+            acks.append(cm_o.setm(func=contributors_query, repos=done, datas=pic, cost=cost))
+        else:
+            acks.append(cm_o.upsert(func=contributors_query, repos=done, datas=pic))
+
+        start = time.perf_counter()
+
     logging.debug("CONTRIBUTIONS_DATA_QUERY - END")
 
-    return ack
+    return all(acks)
@@ -1,8 +1,14 @@
 import logging
+import time
 from db_manager.AugurInterface import AugurInterface
 from app_global import celery_app
-from cache_manager.cache_manager import CacheManager as cm
-import pandas as pd
+from cache_manager.backend import get_cache as cm
+from cache_manager import refresh
+
+# version of the data this query stores. bump it when a change to the SQL or
+# the processing below changes the rows or columns stored, so that data
+# cached by the previous version is no longer read.
+SCHEMA_VERSION = 1
 
 
 @celery_app.task(
@@ -12,7 +18,7 @@ import pandas as pd
     retry_kwargs={"max_retries": 5},
     retry_jitter=True,
 )
-def issues_query(self, dbmc, repos):
+def issues_query(self, dbmc, repos, since=None):
     """
     (Worker Query)
     Executes SQL query against Augur database for issue data.
@@ -23,6 +29,10 @@ def issues_query(self, dbmc, repos):
 
         repo_ids ([str]): repos that SQL query is executed on.
 
+        since ([str | None] | None): each repo's watermark (see CacheManager.watermarks).
+            If given, only rows changed since the watermark are queried and
+            upserted into the cached data rather than replacing it.
+
     Returns:
     --------
         dict: Results from SQL query, interpreted from pd.to_dict('records')
@@ -33,6 +43,11 @@ def issues_query(self, dbmc, repos):
     if len(repos) == 0:
         return None
 
+    # incremental refresh only selects rows changed since each repo's watermark
+    since_sql = ""
+    if since is not None:
+        since_sql = "AND " + refresh.since_clause(repos, since, "r.repo_id", ["i.created_at", "i.closed_at"])
+
     query_string = f"""
                     SELECT
                         r.repo_id as id,
@@ -49,41 +64,42 @@ def issues_query(self, dbmc, repos):
                     WHERE
                         r.repo_id = i.repo_id AND
                         r.repo_id in ({str(repos)[1:-1]})
+                        {since_sql}
+                    ORDER BY
+                        r.repo_id
                     """
 
     # logging.debug(query_string)
 
     # create database connection, load config, execute query above.
+    # its duration is recorded with the data for cost-aware eviction.
+    start = time.perf_counter()
     dbm = AugurInterface()
     dbm.load_pconfig(dbmc)
 
-    df_issues = dbm.run_query(query_string)
-
-    df_issues = df_issues[df_issues["pull_request_id"].isnull()]
-    df_issues = df_issues.drop(columns="pull_request_id")
-    df_issues = df_issues.sort_values(by="created")
-
-    df_issues = df_issues.reset_index()
-    df_issues.drop("index", axis=1, inplace=True)
-
-    # break apart returned data per repo
-    # and temporarily store in List to be
-    # stored in Redis.
-    pic = []
-    for i, r in enumerate(repos):
-        # convert series to a dataframe
-        c_df = pd.DataFrame(df_issues.loc[df_issues["id"] == r]).to_csv()
+    cm_o = cm()
 
-        # add pickled dataframe to list of pickled objects
-        pic.append(c_df)
+    # results are exported in bulk with COPY, streamed in repo order and
+    # stored as each batch of repos completes, so memory held doesn't
+    # grow with the selection.
+    # dates are converted to datetime objects; the cache keeps each
+    # repo's rows sorted by creation date.
+    dates = {"created": {"utc": True}, "closed": {"utc": True}}
+    acks = []
+    for done, pic in dbm.run_query_by_repo(query_string, repos, parse_dates=dates, copy=True):
+        cost = time.perf_counter() - start
 
-    del df_issues
+        # pull requests are also issues, keep only the issues proper
+        pic = [c_df[c_df["pull_request_id"].isnull()].drop(columns="pull_request_id") for c_df in pic]
+        pic = [c_df.reset_index(drop=True) for c_df in pic]
 
-    # store results in Redis
-    cm_o = cm()
+        # 'ack' is a boolean of whether data was set correctly or not.
+        if since is None:
+            acks.append(cm_o.setm(func=issues_query, repos=done, datas=pic, cost=cost))
+        else:
+            acks.append(cm_o.upsert(func=issues_query, repos=done, datas=pic))
 
-    # 'ack' is a boolean of whether data was set correctly or not.
-    ack = cm_o.setm(func=issues_query, repos=repos, datas=pic)
+        start = time.perf_counter()
 
     logging.debug("ISSUES_DATA_QUERY - END")
-    return ack
+    return all(acks)
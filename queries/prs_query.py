@@ -1,8 +1,14 @@
 import logging
-import pandas as pd
+import time
 from db_manager.AugurInterface import AugurInterface
 from app_global import celery_app
-from cache_manager.cache_manager import CacheManager as cm
+from cache_manager.backend import get_cache as cm
+from cache_manager import refresh
+
+# version of the data this query stores. bump it when a change to the SQL or
+# the processing below changes the rows or columns stored, so that data
+# cached by the previous version is no longer read.
+SCHEMA_VERSION = 1
 
 
 @celery_app.task(
@@ -12,7 +18,7 @@ from cache_manager.cache_manager import CacheManager as cm
     retry_kwargs={"max_retries": 5},
     retry_jitter=True,
 )
-def prs_query(self, dbmc, repos):
+def prs_query(self, dbmc, repos, since=None):
     """
     (Worker Query)
     Executes SQL query against Augur database for pull request data.
@@ -23,6 +29,10 @@ def prs_query(self, dbmc, repos):
 
         repo_ids ([str]): repos that SQL query is executed on.
 
+        since ([str | None] | None): each repo's watermark (see CacheManager.watermarks).
+            If given, only rows changed since the watermark are queried and
+            upserted into the cached data rather than replacing it.
+
     Returns:
     --------
         dict: Results from SQL query, interpreted from pd.to_dict('records')
@@ -32,6 +42,13 @@ def prs_query(self, dbmc, repos):
     if len(repos) == 0:
         return None
 
+    # incremental refresh only selects rows changed since each repo's watermark
+    since_sql = ""
+    if since is not None:
+        since_sql = "AND " + refresh.since_clause(
+            repos, since, "r.repo_id", ["pr.pr_created_at", "pr.pr_closed_at", "pr.pr_merged_at"]
+        )
+
     query_string = f"""
                     SELECT
                         r.repo_id as id,
@@ -47,41 +64,36 @@ def prs_query(self, dbmc, repos):
                     WHERE
                         r.repo_id = pr.repo_id AND
                         r.repo_id in ({str(repos)[1:-1]})
+                        {since_sql}
+                    ORDER BY
+                        r.repo_id
                     """
 
     # create database connection, load config, execute query above.
+    # its duration is recorded with the data for cost-aware eviction.
+    start = time.perf_counter()
     dbm = AugurInterface()
     dbm.load_pconfig(dbmc)
-    df_pr = dbm.run_query(query_string)
-
-    # sort by the date created
-    df_pr = df_pr.sort_values(by="created")
 
-    # convert to datetime objects
-    df_pr["created"] = pd.to_datetime(df_pr["created"], utc=True)
-    df_pr["merged"] = pd.to_datetime(df_pr["merged"], utc=True)
-    df_pr["closed"] = pd.to_datetime(df_pr["closed"], utc=True)
-    df_pr = df_pr.reset_index()
-    df_pr.drop("index", axis=1, inplace=True)
-
-    # break apart returned data per repo
-    # and temporarily store in List to be
-    # stored in Redis.
-    pic = []
-    for i, r in enumerate(repos):
-        # convert series to a dataframe
-        c_df = pd.DataFrame(df_pr.loc[df_pr["id"] == r]).to_csv()
-
-        # add pickled dataframe to list of pickled objects
-        pic.append(c_df)
+    cm_o = cm()
 
-    del df_pr
+    # results are exported in bulk with COPY, streamed in repo order and
+    # stored as each batch of repos completes, so memory held doesn't
+    # grow with the selection.
+    # dates are converted to datetime objects; the cache keeps each
+    # repo's rows sorted by creation date.
+    dates = {"created": {"utc": True}, "merged": {"utc": True}, "closed": {"utc": True}}
+    acks = []
+    for done, pic in dbm.run_query_by_repo(query_string, repos, parse_dates=dates, copy=True):
+        cost = time.perf_counter() - start
 
-    # store results in Redis
-    cm_o = cm()
+        # 'ack' is a boolean of whether data was set correctly or not.
+        if since is None:
+            acks.append(cm_o.setm(func=prs_query, repos=done, datas=pic, cost=cost))
+        else:
+            acks.append(cm_o.upsert(func=prs_query, repos=done, datas=pic))
 
-    # 'ack' is a boolean of whether data was set correctly or not.
-    ack = cm_o.setm(func=prs_query, repos=repos, datas=pic)
+        start = time.perf_counter()
 
     logging.debug("PR_DATA_QUERY - END")
-    return ack
+    return all(acks)
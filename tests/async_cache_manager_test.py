@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import fakeredis
+import pandas as pd
+import pytest
+from cache_manager import async_cache_manager as acm
+import cache_manager.cache_manager as cm
+
+
+def q():
+    # a dataset type stored whole
+    pass
+
+
+@pytest.fixture
+def acache(cache, monkeypatch, redis_server):
+    """AsyncCacheManager on the fakeredis server of 'cache'."""
+
+    async def get_client():
+        client = fakeredis.FakeAsyncRedis(server=redis_server)
+        await acm._load_scripts(client)
+        return client
+
+    monkeypatch.setattr(acm, "_get_client", get_client)
+    return acm.AsyncCacheManager()
+
+
+def test_reads_match_sync_manager(cache, acache):
+    cache.setm(q, [1, 2], [pd.DataFrame({"a": [1]}), pd.DataFrame({"a": [2, 3]})])
+    cm._local_cache.clear()
+
+    async def read():
+        return await asyncio.gather(
+            acache.grabm(q, [1, 2]),
+            acache.grabm(q, [1, 4]),
+            acache.grabm_partial(q, [4, 2]),
+            acache.existsm(q, [1, 2, 4]),
+            acache.getm(q, [2, 4]),
+        )
+
+    df, none, (partial, missing), n, values = asyncio.run(read())
+
+    assert df["a"].tolist() == [1, 2, 3]
+    assert none is None
+    assert partial["a"].tolist() == [2, 3] and missing == [4]
+    assert n == 2
+    assert cm.deserialize_df(values[0])["a"].tolist() == [2, 3] and values[1] is None
+
+
+def test_chunked_values_are_reassembled(cache, acache, monkeypatch):
+    monkeypatch.setattr(cm, "CHUNK_BYTES", 256)
+    monkeypatch.setattr(cache, "_compression_threshold", 0)
+    df = pd.DataFrame({"a": range(1000)})
+    cache.setm(q, [1], [df])
+    cm._local_cache.clear()
+
+    pd.testing.assert_frame_equal(asyncio.run(acache.grabm(q, [1])), df, check_dtype=False)
+
+
+def test_wait_for_is_woken_by_setm(cache, acache):
+    timer = threading.Timer(0.2, cache.setm, (q, [1], [pd.DataFrame({"a": [1]})]))
+    timer.start()
+
+    df = asyncio.run(acache.wait_for(q, [1], timeout=5, recheck=60))
+    timer.join()
+
+    assert df["a"].tolist() == [1]
+    assert asyncio.run(acache.wait_for(q, [2], timeout=0.2, recheck=60)) is None
@@ -0,0 +1,144 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+import db_manager.AugurInterface as ai  # noqa: E402
+from db_manager.AugurInterface import AugurInterface  # noqa: E402
+
+
+def _stream(chunks):
+    # stands in for run_query_stream, yielding pre-made chunks of the result
+    def run_query_stream(query_string, chunksize=None, parse_dates=None, dtype=None):
+        yield from chunks
+
+    return run_query_stream
+
+
+def _rows(ids):
+    return pd.DataFrame({"id": ids, "n": range(len(ids))})
+
+
+def test_repo_split_across_chunks_is_yielded_whole():
+    aug = AugurInterface()
+    aug.run_query_stream = _stream([_rows([1, 1, 2]), _rows([2, 2, 3]), _rows([3])])
+
+    batches = list(aug.run_query_by_repo("SELECT ...", [1, 2, 3], chunksize=3))
+
+    repos = [r for done, _ in batches for r in done]
+    sizes = {r: len(f) for done, frames in batches for r, f in zip(done, frames)}
+    assert repos == [1, 2, 3]
+    assert sizes == {1: 2, 2: 3, 3: 2}
+    # a repo is only yielded once its next repo's rows have arrived, or the result ended
+    assert batches[0][0] == [1, 2]
+
+
+def test_repos_without_rows_come_last_with_empty_frames():
+    aug = AugurInterface()
+    aug.run_query_stream = _stream([_rows([4, 4])])
+
+    batches = list(aug.run_query_by_repo("SELECT ...", [2, 4, 9], chunksize=10))
+
+    done, frames = batches[-1]
+    assert done == [4, 2, 9]
+    assert [len(f) for f in frames] == [2, 0, 0]
+    assert list(frames[1].columns) == ["id", "n"]
+
+
+def test_batches_hold_about_a_chunk_of_rows():
+    aug = AugurInterface()
+    ids = [r for r in range(10) for _ in range(5)]
+    aug.run_query_stream = _stream([_rows(ids[i : i + 10]) for i in range(0, len(ids), 10)])
+
+    batches = list(aug.run_query_by_repo("SELECT ...", list(range(10)), chunksize=10))
+
+    assert [r for done, _ in batches for r in done] == list(range(10))
+    assert all(sum(len(f) for f in frames) <= 15 for _, frames in batches)
+
+
+class _Cursor:
+    # columns of the result, as psycopg2 describes them: (name, type oid)
+    description = [("id", 23), ("login", 25), ("created", 1184), ("merged", 16), ("n", 20)]
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query):
+        self.conn.executed.append(query)
+
+    def copy_expert(self, query, f):
+        f.write(self.conn.csv)
+        if self.conn.fail:
+            raise RuntimeError("export failed")
+
+
+class _Connection:
+    def __init__(self, csv, fail):
+        self.csv, self.fail = csv, fail
+        self.executed = []
+        self.closed = self.invalidated = False
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def close(self):
+        self.closed = True
+
+    def invalidate(self):
+        self.invalidated = True
+
+
+class _Engine:
+    def __init__(self, csv=b"", fail=False):
+        self.conn = _Connection(csv, fail)
+
+    def raw_connection(self):
+        return self.conn
+
+
+def _augur(csv=b"", fail=False):
+    aug = AugurInterface()
+    aug.engine = _Engine(csv, fail)
+    return aug
+
+
+def test_copy_output_is_typed_by_result_description():
+    aug = _augur(b'1,alice,2021-01-01 10:00:00+02,t,5\n1,"",2021-01-02 00:00:00+00,f,\n2,,,,7\n')
+
+    (df,) = aug.run_query_copy("SELECT ...")
+
+    assert df["id"].tolist() == [1, 1, 2]
+    # COPY writes NULL unquoted and empty strings quoted
+    assert df["login"].tolist()[:2] == ["alice", ""] and pd.isna(df["login"].iloc[2])
+    assert str(df["created"].dt.tz) == "UTC"
+    assert df["created"].iloc[0] == pd.Timestamp("2021-01-01 08:00", tz="UTC")
+    assert df["merged"].tolist()[:2] == [True, False]
+    assert pd.isna(df["n"].iloc[1]) and df["n"].iloc[2] == 7
+    assert aug.engine.conn.closed
+
+
+def test_copy_output_is_yielded_in_chunks(monkeypatch):
+    monkeypatch.setattr(ai, "COPY_BLOCK_BYTES", 4096)
+    rows = b"".join(f"{i // 1000},u{i},2021-01-01 00:00:00+00,t,{i}\n".encode("utf-8") for i in range(5000))
+
+    frames = list(_augur(rows).run_query_copy("SELECT ...", chunksize=1500))
+
+    assert len(frames) > 1
+    assert sum(len(f) for f in frames) == 5000
+    assert pd.concat(frames)["n"].tolist() == list(range(5000))
+
+
+def test_query_without_results_yields_empty_frame():
+    (df,) = _augur().run_query_copy("SELECT ...", parse_dates={"created": {"utc": True}})
+
+    assert df.empty
+    assert list(df.columns) == ["id", "login", "created", "merged", "n"]
+
+
+def test_failed_export_raises_and_discards_connection():
+    aug = _augur(b"1,alice,2021-01-01 00:00:00+00,t,5\n", fail=True)
+
+    with pytest.raises(Exception, match="DB Read Failure"):
+        list(aug.run_query_copy("SELECT ..."))
+
+    assert aug.engine.conn.invalidated and not aug.engine.conn.closed
@@ -0,0 +1,21 @@
+import sys
+import types
+from cache_manager import backend
+from cache_manager.cache_manager import CacheManager
+
+
+def test_fingerprint_follows_schema_version(monkeypatch):
+    cache = CacheManager.__new__(CacheManager)
+
+    def fingerprint(version, body="pass"):
+        # a query function in a module with the given SCHEMA_VERSION
+        module = types.ModuleType("fake_query")
+        module.SCHEMA_VERSION = version
+        exec(f"def fake_query():\n    {body}\n", module.__dict__)
+        monkeypatch.setitem(sys.modules, "fake_query", module)
+        monkeypatch.setattr(backend, "_fingerprints", {})
+        return cache._fingerprint(module.fake_query)
+
+    # edits that don't bump the version keep the cache
+    assert fingerprint(1) == fingerprint(1, "# a comment\n    return None")
+    assert fingerprint(1) != fingerprint(2)
@@ -0,0 +1,466 @@
+import time
+import threading
+import pandas as pd
+import cache_manager.cache_manager as cm
+from cache_manager import partitions
+from cache_manager import refresh
+from cache_manager import retention
+
+
+def issues_query():
+    # a dataset type that's time-partitioned by "created" and upserted by "issue"
+    pass
+
+
+def q():
+    # a dataset type stored whole
+    pass
+
+
+def _issues(ids, created, closed=None):
+    return pd.DataFrame(
+        {
+            "issue": ids,
+            "created": pd.to_datetime(created, utc=True),
+            "closed": pd.to_datetime(closed or [None] * len(ids), utc=True),
+        }
+    )
+
+
+def test_setm_grabm_round_trip(cache):
+    a = pd.DataFrame({"id": [1], "created": pd.to_datetime(["2021-01-01"], utc=True)})
+    b = pd.DataFrame({"id": [2, 3], "created": pd.to_datetime(["2022-01-01", None], utc=True)})
+    cache.setm(q, [1, 2], [a, b])
+
+    cm._local_cache.clear()
+    df = cache.grabm(q, [1, 2])
+
+    assert df["id"].tolist() == [1, 2, 3]
+    assert df["created"].dtype == a["created"].dtype
+    assert cache.grabm(q, [1, 4]) is None
+
+
+def test_wait_for_is_woken_by_setm(cache):
+    cache.setm(q, [1], [pd.DataFrame({"a": [1]})])
+    writer = cm.CacheManager()
+    timer = threading.Timer(0.2, writer.setm, (q, [2], [pd.DataFrame({"a": [2]})]))
+    timer.start()
+
+    # long recheck, so only the notification can wake it in time
+    start = time.monotonic()
+    df = cache.wait_for(q, [1, 2], timeout=5, recheck=60)
+    timer.join()
+
+    assert df["a"].tolist() == [1, 2]
+    assert time.monotonic() - start < 2
+
+
+def test_wait_for_times_out(cache):
+    assert cache.wait_for(q, [1], timeout=0.2, recheck=60) is None
+
+
+def test_eviction_spares_keys_just_written(cache):
+    df = pd.DataFrame({"a": range(100)})
+    cache.setm(q, [1], [df])
+    size = int(cache._redis.hget(cache._index_key(q, "size"), cache._get_hash(q, 1)))
+
+    # room for two values
+    retention.RETENTION_POLICIES["q"] = retention.RetentionPolicy(
+        ttl=3600, sliding=True, max_bytes=2 * size, eviction="lru"
+    )
+    cache.setm(q, [2], [df])
+    cache.setm(q, [3, 4], [df, df])
+
+    assert cache.missing(q, [1, 2, 3, 4]) == [1, 2]
+
+    sizes = cache._redis.hvals(cache._index_key(q, "size"))
+    assert int(cache._redis.get(cache._index_key(q, "bytes"))) == sum(int(s) for s in sizes)
+
+
+def test_ttl_of_policy_is_set(cache):
+    retention.RETENTION_POLICIES["q"] = retention.RetentionPolicy(ttl=600, sliding=False, max_bytes=None)
+    cache.setm(q, [1], [pd.DataFrame({"a": [1]})])
+
+    assert 0 < cache._redis.ttl(cache._get_hash(q, 1)) <= 600
+
+
+def test_figure_is_computed_once_for_concurrent_requests(cache):
+    cache.setm(q, [1, 2], [pd.DataFrame({"a": [1]}), pd.DataFrame({"a": [2]})])
+    calls = []
+
+    def compute(df):
+        calls.append(1)
+        time.sleep(0.3)
+        return {"total": int(df["a"].sum())}
+
+    figs = []
+    threads = [
+        threading.Thread(target=lambda: figs.append(cm.CacheManager().grab_figure("v", q, r, (), compute, 5)))
+        for r in ([1, 2], [2, 1])
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert figs == [{"total": 3}, {"total": 3}]
+    assert len(calls) == 1
+    # later requests are served from the cache
+    assert cache.grab_figure("v", q, [1, 2], (), compute, 5) == {"total": 3}
+    assert len(calls) == 1
+
+
+def test_figure_key_changes_with_params_and_data(cache):
+    cache.setm(q, [1], [pd.DataFrame({"a": [1]})])
+
+    def compute(df):
+        return {"total": int(df["a"].sum())}
+
+    assert cache.grab_figure("v", q, [1], ("x",), compute, 5) == {"total": 1}
+    assert cache.grab_figure("v", q, [1], ("y",), lambda df: {"other": 1}, 5) == {"other": 1}
+
+    cache.setm(q, [1], [pd.DataFrame({"a": [5]})])
+    assert cache.grab_figure("v", q, [1], ("x",), compute, 5) == {"total": 5}
+
+
+def test_figure_waiters_take_over_when_compute_raises(cache):
+    cache.setm(q, [1], [pd.DataFrame({"a": [1]})])
+    started = threading.Event()
+
+    def fail(df):
+        started.set()
+        time.sleep(0.3)
+        raise ValueError("bad figure")
+
+    errors = []
+
+    def first():
+        try:
+            cm.CacheManager().grab_figure("v", q, [1], (), fail, 5)
+        except ValueError as e:
+            errors.append(e)
+
+    t = threading.Thread(target=first)
+    t.start()
+    started.wait(5)
+
+    start = time.monotonic()
+    fig = cache.grab_figure("v", q, [1], (), lambda df: {"total": int(df["a"].sum())}, 5)
+    t.join()
+
+    assert fig == {"total": 1}
+    assert len(errors) == 1
+    # woken by the release, not the lock lapsing
+    assert time.monotonic() - start < 2
+    assert not cache._redis.keys("*:lock")
+
+
+def test_claim_reports_jobs_in_flight(cache):
+    claimed, pending = cache.claim(q, [1, 2], "a")
+    assert claimed == [1, 2] and pending == {}
+
+    claimed, pending = cache.claim(q, [2, 3], "b")
+    assert claimed == [3]
+    assert pending == {2: "a"}
+
+    # written data removes its marker
+    cache.setm(q, [2], [pd.DataFrame({"a": [1]})])
+    assert cache.claim(q, [2], "c")[0] == [2]
+
+
+def test_release_only_removes_markers_of_job(cache):
+    cache.claim(q, [1], "a")
+    cache.claim(q, [2], "b")
+
+    assert cache.release(q, [1, 2], "a") == 1
+    claimed, _ = cache.claim(q, [1, 2], "c")
+    assert claimed == [1]
+
+
+def test_chunked_value_round_trip(cache, monkeypatch):
+    monkeypatch.setattr(cm, "CHUNK_BYTES", 256)
+    monkeypatch.setattr(cache, "_compression_threshold", 0)
+    df = pd.DataFrame({"a": range(1000)})
+    cache.setm(q, [1], [df])
+
+    h = cache._get_hash(q, 1)
+    assert cache._redis.get(h).startswith(cm._MANIFEST_MAGIC)
+    assert cache._redis.hlen(cache._chunks_key(h)) > 1
+
+    # compressed chunks are decompressed as they're read
+    value = cache._resolve(h, cache._redis.get(h))
+    assert not value.startswith(cm.compression._MAGIC)
+
+    cm._local_cache.clear()
+    pd.testing.assert_frame_equal(cache.grabm(q, [1]), df, check_dtype=False)
+
+
+def test_chunked_read_during_overwrite(cache, monkeypatch):
+    monkeypatch.setattr(cm, "CHUNK_BYTES", 256)
+    df = pd.DataFrame({"a": range(1000)})
+    h = cache._get_hash(q, 1)
+
+    cache.setm(q, [1], [df])
+    before = cache._redis.get(h)
+    assert before.startswith(cm._MANIFEST_MAGIC)
+
+    # a reader holding the previous manifest can still reassemble it
+    cache.setm(q, [1], [df + 1])
+    old = cm.deserialize_df(cm.compression.decompress(cache._resolve(h, before)))
+    pd.testing.assert_frame_equal(old, df, check_dtype=False)
+
+    # until the write after
+    cache.setm(q, [1], [df + 2])
+    assert cache._resolve(h, before) is None
+    cm._local_cache.clear()
+    assert cache.grabm(q, [1])["a"].iloc[0] == 2
+
+
+def test_value_no_longer_chunked_leaves_chunks_to_expire(cache, monkeypatch):
+    monkeypatch.setattr(cm, "CHUNK_BYTES", 256)
+    cache.setm(q, [1], [pd.DataFrame({"a": range(1000)})])
+
+    monkeypatch.setattr(cm, "CHUNK_BYTES", 10**6)
+    cache.setm(q, [1], [pd.DataFrame({"a": [1]})])
+
+    ttl = cache._redis.ttl(cache._chunks_key(cache._get_hash(q, 1)))
+    assert 0 < ttl <= cm.CHUNK_GRACE
+
+
+def test_chunked_value_snapshot_is_compressed_again(cache, monkeypatch, tmp_path):
+    monkeypatch.setattr(cm, "CHUNK_BYTES", 256)
+    monkeypatch.setattr(cache, "_compression_threshold", 0)
+    df = pd.DataFrame({"a": range(1000)})
+    cache.setm(q, [1], [df])
+
+    cache._redis.set(cm.SNAPSHOT_SENTINEL, 1)
+    assert cache.snapshot(str(tmp_path)) == 1
+    cache._redis.flushall()
+    cm._local_cache.clear()
+    assert cache.restore(str(tmp_path)) == 1
+
+    h = cache._get_hash(q, 1)
+    assert cache._redis.hvals(cache._chunks_key(h))[0].startswith(cm.compression._MAGIC)
+    pd.testing.assert_frame_equal(cache.grabm(q, [1]), df, check_dtype=False)
+
+
+def test_missing_keeps_order(cache):
+    cache.setm(q, [2], [pd.DataFrame({"a": [1]})])
+    assert cache.missing(q, [4, 2, 3]) == [4, 3]
+
+
+def test_getm_and_existsm(cache):
+    cache.setm(q, [1, 2], [pd.DataFrame({"a": [1]}), "text"])
+
+    values = cache.getm(q, [2, 3, 1])
+
+    assert values[0] == b"text" and values[1] is None
+    assert cm.deserialize_df(values[2])["a"].tolist() == [1]
+    assert cache.existsm(q, [1, 2, 3]) == 2
+
+
+def test_upsert_merges_changed_rows(cache):
+    cache.setm(issues_query, [1], [_issues([1, 2], ["2021-01-01", "2022-02-01"])])
+
+    delta = _issues([2, 3], ["2022-02-01", "2022-04-01"], ["2022-05-01", None])
+    cache.upsert(issues_query, [1], [delta])
+
+    df = cache.grabm(issues_query, [1])
+    assert df["issue"].tolist() == [1, 2, 3]
+    assert df["closed"].notna().tolist() == [False, True, False]
+    assert cache.watermarks(issues_query, [1])[1] == "2022-05-01T00:00:00+00:00"
+
+
+def test_rows_on_the_watermark_are_selected_again_and_upserted(cache):
+    cache.setm(issues_query, [1], [_issues([1, 2], ["2022-01-01 00:00", "2022-05-01 12:00"])])
+    mark = cache.watermarks(issues_query, [1])[1]
+
+    # the refresh selects rows at or after the mark, as timestamps
+    clause = refresh.since_clause([1], [mark], "r.repo_id", ["i.created_at"])
+    assert f"i.created_at::timestamptz >= '{mark}'::timestamptz" in clause
+
+    # so rows on the mark come again, with changes and alongside new rows
+    delta = _issues([2, 3], ["2022-05-01 12:00", "2022-05-01 12:00"], ["2022-05-02 00:00", None])
+    assert (delta["created"] >= pd.Timestamp(mark)).all()
+    cache.upsert(issues_query, [1], [delta])
+
+    df = cache.grabm(issues_query, [1])
+    assert df["issue"].tolist() == [1, 2, 3]
+    assert df["closed"].notna().tolist() == [False, True, False]
+    assert cache.watermarks(issues_query, [1])[1] == "2022-05-02T00:00:00+00:00"
+
+
+def test_upsert_drops_repos_whose_frame_is_gone(cache):
+    cache.setm(issues_query, [1, 2], [_issues([1], ["2022-01-01"]), _issues([5], ["2022-01-01"])])
+    cache.claim(issues_query, [1, 2], "job")
+
+    # expired between the refresh being enqueued and its rows arriving
+    h = cache._get_hash(issues_query, 2)
+    cache._redis.delete(h, cache._parts_key(h))
+
+    delta = _issues([6], ["2022-03-01"])
+    cache.upsert(issues_query, [1, 2], [_issues([2], ["2022-03-01"]), delta])
+
+    assert cache.missing(issues_query, [1, 2]) == [2]
+    assert cache.watermarks(issues_query, [2]) == {2: None}
+    assert not cache._redis.keys("pending:*")
+    assert cache.cached_repos(issues_query) == [1]
+    assert cache.grabm(issues_query, [1])["issue"].tolist() == [1, 2]
+
+
+def test_upsert_drops_whole_values_that_are_gone(cache, monkeypatch):
+    monkeypatch.setattr(partitions, "PARTITION_COLUMNS", {})
+    cache.setm(issues_query, [1, 2], [_issues([1], ["2022-01-01"]), _issues([5], ["2022-01-01"])])
+    cache._redis.delete(cache._get_hash(issues_query, 2))
+
+    cache.upsert(issues_query, [1, 2], [_issues([2], ["2022-03-01"]), _issues([6], ["2022-03-01"])])
+
+    assert cache.missing(issues_query, [1, 2]) == [2]
+    assert cache.watermarks(issues_query, [2]) == {2: None}
+    assert cache.grabm(issues_query, [1])["issue"].tolist() == [1, 2]
+
+
+def test_cached_repos_skips_expired_keys(cache):
+    cache.setm(q, [1, 2], [pd.DataFrame({"a": [1]}), pd.DataFrame({"a": [2]})])
+    cache._redis.delete(cache._get_hash(q, 2))
+
+    assert cache.cached_repos(q) == [1]
+    # and the stale index entries are gone
+    assert cache._redis.zcard(cache._index_key(q, "atime")) == 1
+
+
+def test_evicted_keys_are_spilled_and_promoted(cache, monkeypatch, tmp_path):
+    monkeypatch.setattr(cm, "_disk_tier", cm.DiskTier(str(tmp_path), 10**9))
+    df = pd.DataFrame({"a": range(100)})
+    cache.setm(q, [1], [df])
+    size = int(cache._redis.hget(cache._index_key(q, "size"), cache._get_hash(q, 1)))
+
+    retention.RETENTION_POLICIES["q"] = retention.RetentionPolicy(
+        ttl=3600, sliding=True, max_bytes=size, eviction="lru"
+    )
+    cache.setm(q, [2], [df + 1])
+
+    assert cache.missing(q, [1, 2]) == [1]
+    assert cm._disk_tier.has(cache._get_hash(q, 1))
+
+    # a read that misses finds it on disk and writes it back
+    cm._local_cache.clear()
+    assert cache.grabm(q, [1], promote=False) is None
+    pd.testing.assert_frame_equal(cache.grabm(q, [1]), df, check_dtype=False)
+    assert cache.missing(q, [1]) == []
+
+
+def test_spill_expiring_copies_keys_near_their_ttl(cache, monkeypatch, tmp_path):
+    monkeypatch.setattr(cm, "_disk_tier", cm.DiskTier(str(tmp_path), 10**9))
+    retention.RETENTION_POLICIES["q"] = retention.RetentionPolicy(ttl=60, sliding=True)
+    monkeypatch.setattr(cm, "DISK_SPILL_MARGIN", 120)
+    cache.setm(q, [1], [pd.DataFrame({"a": [1]})])
+
+    assert cache.spill_expiring() == 1
+    assert cm._disk_tier.get(cache._get_hash(q, 1))["a"].tolist() == [1]
+    # already spilled
+    assert cache.spill_expiring() == 0
+
+
+def test_cluster_batches_keys_by_slot(cache, monkeypatch):
+    monkeypatch.setattr(cm, "SLOT_BUCKETS", 16)
+    hs = [cache._get_hash(q, r) for r in range(50)]
+    assert cache._slot_groups(hs) == [list(range(50))]
+
+    monkeypatch.setattr(cm, "REDIS_CLUSTER", True)
+    groups = cache._slot_groups(hs)
+
+    assert sorted(i for g in groups for i in g) == list(range(50))
+    assert all(len({cm.key_slot(hs[i].encode("utf-8")) for i in g}) == 1 for g in groups)
+    assert 1 < len(groups) <= 16
+
+    # a repo's value, partitions and chunks are co-located
+    h = hs[0]
+    slots = {cm.key_slot(k.encode("utf-8")) for k in (h, cache._parts_key(h), cache._chunks_key(h))}
+    assert len(slots) == 1
+
+
+def test_cluster_round_trip(cache, monkeypatch):
+    monkeypatch.setattr(cm, "REDIS_CLUSTER", True)
+    monkeypatch.setattr(cm, "SLOT_BUCKETS", 16)
+    frames = [pd.DataFrame({"a": [r]}) for r in range(20)]
+    cache.setm(q, list(range(20)), frames)
+
+    cm._local_cache.clear()
+    assert cache.grabm(q, list(range(20)))["a"].tolist() == list(range(20))
+    assert cache.missing(q, [3, 40]) == [40]
+
+
+def test_restore_keeps_newer_keys_and_runs_once(cache, tmp_path):
+    cache.setm(q, [1, 2], [pd.DataFrame({"a": [1]}), pd.DataFrame({"a": [2]})])
+    cache._redis.set(cm.SNAPSHOT_SENTINEL, 1)
+    cache.snapshot(str(tmp_path))
+
+    cache._redis.flushall()
+    cm._local_cache.clear()
+    cache.setm(q, [1], [pd.DataFrame({"a": [10]})])
+
+    # someone else is restoring
+    cache._redis.set(cm.SNAPSHOT_LOCK, "other")
+    assert cache.restore(str(tmp_path)) == 0
+    assert not cache._redis.exists(cm.SNAPSHOT_SENTINEL)
+    cache._redis.delete(cm.SNAPSHOT_LOCK)
+
+    assert cache.restore(str(tmp_path)) == 1
+    assert cache.grabm(q, [1, 2])["a"].tolist() == [10, 2]
+    assert cache._redis.exists(cm.SNAPSHOT_SENTINEL)
+    assert not cache._redis.exists(cm.SNAPSHOT_LOCK)
+    assert cache.restore(str(tmp_path)) == 0
+
+
+def test_grabm_partial_returns_repos_available(cache):
+    cache.setm(q, [1, 3], [pd.DataFrame({"a": [1]}), pd.DataFrame({"a": [3]})])
+
+    df, missing = cache.grabm_partial(q, [1, 2, 3, 4])
+    assert df["a"].tolist() == [1, 3]
+    assert missing == [2, 4]
+
+    df, missing = cache.grabm_partial(q, [5])
+    assert df.empty and missing == [5]
+
+    df, missing = cache.grabm_partial(q, [3, 1])
+    assert df["a"].tolist() == [3, 1] and missing == []
+
+
+def test_restore_keeps_partitions(cache, tmp_path):
+    df = _issues([1, 2, 3], ["2020-06-01", "2021-06-01", "2022-06-01"])
+    cache.setm(issues_query, [1], [df])
+    h = cache._get_hash(issues_query, 1)
+    labels = sorted(cache._redis.hkeys(cache._parts_key(h)))
+    version = cache._versions("issues_query", [h])
+
+    cache._redis.set(cm.SNAPSHOT_SENTINEL, 1)
+    assert cache.snapshot(str(tmp_path)) == 1
+
+    cache._redis.flushall()
+    cm._local_cache.clear()
+    assert cache.restore(str(tmp_path)) == 1
+
+    assert partitions.parse(cache._redis.get(h)) is not None
+    assert sorted(cache._redis.hkeys(cache._parts_key(h))) == labels
+    assert cache._versions("issues_query", [h]) == version
+    pd.testing.assert_frame_equal(cache.grabm(issues_query, [1]), df)
+    df, missing = cache.grabm_partial(issues_query, [1], start="2022-01-01")
+    assert df["issue"].tolist() == [3] and missing == []
+
+
+def test_gds_eviction_keeps_expensive_keys(cache):
+    df = pd.DataFrame({"a": range(100)})
+    retention.RETENTION_POLICIES["q"] = retention.RetentionPolicy(
+        ttl=3600, sliding=True, max_bytes=10**9, eviction="gds"
+    )
+    cache.setm(q, [1], [df], cost=600)
+    cache.setm(q, [2], [df], cost=1)
+    size = int(cache._redis.hget(cache._index_key(q, "size"), cache._get_hash(q, 1)))
+
+    retention.RETENTION_POLICIES["q"] = retention.RetentionPolicy(
+        ttl=3600, sliding=True, max_bytes=2 * size, eviction="gds"
+    )
+    cache.setm(q, [3], [df], cost=10)
+
+    assert cache.missing(q, [1, 2, 3]) == [2]
@@ -0,0 +1,53 @@
+import pytest
+from cache_manager import compression
+
+# compressible: repeats
+DATA = b"\xff\xff\xff\xff" + b"repo_id,created\n" * 2000
+
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd", "lz4"])
+def test_round_trip(codec):
+    if codec not in compression._CODECS:
+        pytest.skip(f"{codec} not installed")
+    value = compression.compress(DATA, codec)
+
+    assert value.startswith(compression._MAGIC)
+    assert value[len(compression._MAGIC)] == compression._CODECS[codec][0]
+    assert len(value) < len(DATA)
+    assert compression.decompress(value) == DATA
+    # as read back in chunks
+    assert compression.decompress(bytearray(value)) == DATA
+
+
+def test_small_and_incompressible_values_are_stored_as_is():
+    assert compression.compress(DATA, "zlib", threshold=len(DATA) + 1) is DATA
+    assert compression.compress(b"\x01\x02", "zlib") == b"\x01\x02"
+    assert compression.compress(DATA, None) is DATA
+
+
+def test_values_without_header_are_returned_unchanged():
+    assert compression.decompress(DATA) is DATA
+    assert compression.decompress(None) is None
+
+
+def test_unknown_codec_id_is_an_error():
+    with pytest.raises(ValueError):
+        compression.decompress(compression._MAGIC + bytes([250]) + b"x")
+
+
+def test_codec_ids_cant_be_reused():
+    with pytest.raises(ValueError):
+        compression.register_codec("other", 1, bytes, bytes)
+
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd", "lz4"])
+def test_decompress_in_pieces(codec):
+    if codec not in compression._CODECS:
+        pytest.skip(f"{codec} not installed")
+    value = compression.compress(DATA, codec)
+
+    pieces = [value[i : i + 100] for i in range(0, len(value), 100)]
+    feed = compression.decompressor(pieces[0])
+
+    assert b"".join(feed(p) for p in pieces) == DATA
+    assert compression.decompressor(DATA[:100]) is None
@@ -0,0 +1,33 @@
+"""
+    Fixtures shared by the tests.
+
+    The cache tests run against fakeredis, with Lua scripting from lupa,
+    rather than a Redis server.
+"""
+import fakeredis
+import pytest
+import cache_manager.cache_manager as cm
+from cache_manager import retention
+
+
+@pytest.fixture
+def redis_server():
+    """Empty fakeredis server."""
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def cache(monkeypatch, redis_server):
+    """
+    CacheManager on an empty fakeredis server, with the disk tier off
+    and no in-process copies left from other tests. Tests may change
+    retention.RETENTION_POLICIES; it's restored afterwards.
+    """
+    monkeypatch.setattr(cm, "_get_client", lambda: fakeredis.FakeStrictRedis(server=redis_server))
+    monkeypatch.setattr(cm, "_disk_tier", cm.DiskTier(None, 0))
+    monkeypatch.setattr(retention, "RETENTION_POLICIES", dict(retention.RETENTION_POLICIES))
+    cm._local_cache.clear()
+
+    yield cm.CacheManager()
+
+    cm._local_cache.clear()
@@ -0,0 +1,42 @@
+import pandas as pd
+from cache_manager.disk_tier import DiskTier
+
+
+def _key(repo):
+    return f"data:issues_query:fp:{repo}:{{3}}"
+
+
+def test_put_get_round_trip(tmp_path):
+    tier = DiskTier(str(tmp_path), 10**9)
+    df = pd.DataFrame({"id": [1, 2], "created": pd.to_datetime(["2021-01-01", None], utc=True)})
+
+    assert tier.put(_key(1), df)
+
+    assert tier.has(_key(1))
+    pd.testing.assert_frame_equal(tier.get(_key(1)), df)
+    assert tier.get(_key(2)) is None
+    assert not DiskTier(None, 0).put(_key(1), df)
+
+
+def test_oldest_files_are_removed_over_budget(tmp_path):
+    df = pd.DataFrame({"n": range(1000)})
+    tier = DiskTier(str(tmp_path), 10**9)
+    tier.put(_key(1), df)
+    size = tier.stat(_key(1)).st_size
+
+    tier.max_bytes = 2 * size
+    tier.put(_key(2), df)
+    tier.put(_key(3), df)
+
+    assert [tier.has(_key(r)) for r in (1, 2, 3)] == [False, True, True]
+
+
+def test_invalidate_by_fingerprint(tmp_path):
+    tier = DiskTier(str(tmp_path), 10**9)
+    df = pd.DataFrame({"n": [1]})
+    tier.put(_key(1), df)
+    tier.put("data:issues_query:old:1", df)
+
+    assert sorted(tier.fingerprints("issues_query")) == ["fp", "old"]
+    assert tier.invalidate(name="issues_query", fingerprint="old") == 1
+    assert tier.fingerprints("issues_query") == ["fp"]
@@ -0,0 +1,71 @@
+import os
+import time
+import threading
+import pandas as pd
+from cache_manager.embedded import EmbeddedCacheManager
+
+
+def q():
+    # a dataset type stored whole
+    pass
+
+
+def test_setm_grabm_round_trip(tmp_path):
+    cache = EmbeddedCacheManager(root=str(tmp_path))
+    cache.setm(q, [1, 2], [pd.DataFrame({"a": [1]}), pd.DataFrame({"a": [2, 3]})])
+
+    assert cache.grabm(q, [2, 1])["a"].tolist() == [2, 3, 1]
+    assert cache.grabm(q, [1, 3]) is None
+    assert cache.missing(q, [1, 3]) == [3]
+
+
+def test_claim_and_release(tmp_path):
+    cache = EmbeddedCacheManager(root=str(tmp_path))
+
+    assert cache.claim(q, [1, 2], "a") == ([1, 2], {})
+    assert cache.claim(q, [2, 3], "b") == ([3], {2: "a"})
+    # claiming again is idempotent
+    assert cache.claim(q, [1], "a") == ([1], {})
+
+    # only the job's own markers are released
+    assert cache.release(q, [1, 2, 3], job_id="a") == 2
+    assert cache.claim(q, [1, 2, 3], "c") == ([1, 2], {3: "b"})
+
+    # written data releases its marker
+    cache.setm(q, [3], [pd.DataFrame({"a": [1]})])
+    assert cache.claim(q, [3], "c") == ([3], {})
+    # and no temporary files are left behind
+    assert all(not n.endswith(".tmp") for n in os.listdir(tmp_path / "pending"))
+
+
+def test_lapsed_markers_are_taken_over(tmp_path):
+    cache = EmbeddedCacheManager(root=str(tmp_path))
+    cache.claim(q, [1], "a")
+    path = cache._pending_path(cache._get_hash(q, 1))
+    os.utime(path, (time.time() - 100, time.time() - 100))
+
+    assert cache.claim(q, [1], "b", lease=10) == ([1], {})
+
+
+def test_concurrent_claims_see_the_owner(tmp_path):
+    results = []
+
+    def claim(job_id):
+        cache = EmbeddedCacheManager(root=str(tmp_path))
+        results.append((job_id, cache.claim(q, list(range(200)), job_id)))
+
+    threads = [threading.Thread(target=claim, args=(j,)) for j in ("a", "b", "c")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # each repo is claimed by exactly one job, and the others name it
+    owners = {}
+    for job_id, (claimed, _) in results:
+        for r in claimed:
+            assert r not in owners
+            owners[r] = job_id
+    assert sorted(owners) == list(range(200))
+    for job_id, (_, pending) in results:
+        assert all(owners[r] == o for r, o in pending.items())
@@ -0,0 +1,65 @@
+import pandas as pd
+from cache_manager.local_cache import LocalCache
+
+
+def _frame(n):
+    return pd.DataFrame({"a": range(n)})
+
+
+def _size(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def test_evicts_least_recently_used_within_budget():
+    df = _frame(100)
+    cache = LocalCache(max_bytes=2 * _size(df))
+
+    cache.put("a", b"1", df)
+    cache.put("b", b"1", df)
+    assert cache.get("a", b"1") is not None
+    cache.put("c", b"1", df)
+
+    assert cache.get("b", b"1") is None
+    assert cache.get("a", b"1") is not None and cache.get("c", b"1") is not None
+    assert cache._bytes == 2 * _size(df) <= cache.max_bytes
+
+
+def test_frame_over_budget_isnt_cached():
+    df = _frame(100)
+    cache = LocalCache(max_bytes=_size(df))
+    cache.put("a", b"1", df)
+
+    cache.put("b", b"1", _frame(1000))
+
+    assert cache.get("b", b"1") is None
+    assert cache.get("a", b"1") is not None
+    assert cache._bytes == _size(df)
+
+
+def test_stale_version_is_dropped():
+    cache = LocalCache(max_bytes=10**6)
+    cache.put("a", b"1", _frame(10))
+
+    assert cache.get("a", b"2") is None
+    assert cache.version("a") is None
+    assert cache._bytes == 0
+
+
+def test_get_returns_shallow_copy():
+    cache = LocalCache(max_bytes=10**6)
+    cache.put("a", b"1", _frame(10))
+
+    df = cache.get("a", b"1")
+    df["b"] = 1
+
+    assert list(cache.get("a", b"1").columns) == ["a"]
+
+
+def test_disabled_or_unversioned_frames_arent_cached():
+    cache = LocalCache(max_bytes=0)
+    cache.put("a", b"1", _frame(10))
+    assert cache.get("a", b"1") is None
+
+    cache = LocalCache(max_bytes=10**6)
+    cache.put("a", None, _frame(10))
+    assert cache.version("a") is None
@@ -0,0 +1,88 @@
+import pandas as pd
+from cache_manager import partitions
+
+
+def _frame(created):
+    return pd.DataFrame({"n": range(len(created)), "created": pd.to_datetime(created, utc=True)})
+
+
+def test_split_by_year_with_undated_last():
+    df = _frame(["2021-03-01", None, "2020-12-31", "2021-01-01"])
+    parts = partitions.split("created", df)
+
+    assert list(parts) == ["2020", "2021", partitions.UNDATED]
+    assert parts["2020"]["n"].tolist() == [2]
+    assert parts["2021"]["n"].tolist() == [0, 3]
+    assert parts[partitions.UNDATED]["n"].tolist() == [1]
+
+
+def test_split_keeps_columns_of_empty_frame():
+    df = _frame([]).astype({"n": "int64"})
+    parts = partitions.split("created", df)
+
+    assert list(parts) == [partitions.UNDATED]
+    assert list(parts[partitions.UNDATED].columns) == ["n", "created"]
+
+
+def test_labels_of_range():
+    manifest = {"parts": {"2022": ["v", 1], partitions.UNDATED: ["v", 1], "2020": ["v", 1], "2021": ["v", 1]}}
+
+    assert partitions.labels(manifest) == ["2020", "2021", "2022", partitions.UNDATED]
+    assert partitions.labels(manifest, start="2021-06-01") == ["2021", "2022"]
+    assert partitions.labels(manifest, end="2021-01-01") == ["2020", "2021"]
+
+
+def test_select_half_open_range():
+    df = _frame(["2021-01-01", "2021-06-01", None, "2022-01-01"])
+
+    assert partitions.select("created", df, start="2021-01-01", end="2022-01-01")["n"].tolist() == [0, 1]
+    assert partitions.select("created", df, start="2021-06-01")["n"].tolist() == [1, 3]
+    assert partitions.select("created", df) is df
+
+
+def test_merge_sorted_runs():
+    a = partitions.sort("created", _frame(["2021-03-01", "2020-01-01"]))
+    a.attrs["header"] = partitions.header("created", a, "fp")
+    b = _frame(["2020-06-01", None, "2022-01-01"])
+    b.attrs["header"] = partitions.header(None, b, "fp")
+
+    df = partitions.merge("created", [a, b])
+
+    assert df["created"].dt.year.tolist()[:4] == [2020, 2020, 2021, 2022]
+    assert df["created"].isna().tolist()[-1]
+    assert df.attrs["header"] == {
+        "sort": "created",
+        "rows": 5,
+        "min": "2020-01-01T00:00:00+00:00",
+        "max": "2022-01-01T00:00:00+00:00",
+        "schema": "fp",
+    }
+
+
+def test_manifest_round_trip():
+    parts = {"2021": ("v1", 10), "2022": ("v2", 20)}
+    headers = {"2021": {"sort": "created", "rows": 1, "min": None, "max": None, "schema": None}}
+    value = partitions.manifest(parts, headers)
+
+    assert value.startswith(partitions.MAGIC)
+    parsed = partitions.parse(value)
+    assert parsed["parts"] == {"2021": ["v1", 10], "2022": ["v2", 20]}
+    assert parsed["headers"] == headers
+    assert partitions.parse(b"not a manifest") is None
+    assert partitions.parse(None) is None
+
+
+def test_bounds_from_header_or_scan():
+    df = partitions.sort("created", _frame(["2021-03-01", None, "2020-01-01"]))
+    df.attrs["header"] = partitions.header("created", df)
+    # a header that disagrees with the rows shows it was read, not the rows
+    df.attrs["header"]["max"] = "2030-01-01T00:00:00+00:00"
+
+    lo, hi = partitions.bounds(df, "created")
+    assert lo == pd.Timestamp("2020-01-01", tz="UTC")
+    assert hi == pd.Timestamp("2030-01-01", tz="UTC")
+
+    # rows filtered since, or a column it isn't sorted by, are scanned
+    assert partitions.bounds(df.iloc[:1], "created")[1] == pd.Timestamp("2020-01-01", tz="UTC")
+    assert partitions.bounds(df.assign(closed=df["created"]), "closed")[1] == pd.Timestamp("2021-03-01", tz="UTC")
+    assert partitions.bounds(_frame([None]), "created") == (None, None)
@@ -0,0 +1,22 @@
+import pandas as pd
+from cache_manager import refresh
+
+
+def test_since_clause_compares_as_timestamps():
+    clause = refresh.since_clause([1, 2], ["2022-05-01T00:00:00+00:00", None], "c.repo_id", ["c.cmt_author_date"])
+
+    assert clause == (
+        "((c.repo_id = 1 AND (c.cmt_author_date::timestamptz >= '2022-05-01T00:00:00+00:00'::timestamptz))"
+        " OR c.repo_id = 2)"
+    )
+
+
+def test_merge_replaces_rows_by_key_in_order():
+    spec = refresh.REFRESH_SPECS["issues_query"]
+    cached = pd.DataFrame({"issue": [1, 2], "created": [1, 3], "closed": [None, None]})
+    delta = pd.DataFrame({"issue": [2, 3], "created": [3, 2], "closed": [4, None]})
+
+    merged = refresh.merge(spec, cached, delta)
+
+    assert merged["issue"].tolist() == [1, 3, 2]
+    assert merged["closed"].tolist()[2] == 4
@@ -0,0 +1,57 @@
+import pandas as pd
+from cache_manager.serialization import concat_frames, serialize_df, deserialize_df
+
+
+def test_round_trip_keeps_column_types():
+    df = pd.DataFrame(
+        {
+            "id": [1, 2],
+            "login": ["a", None],
+            "created": pd.to_datetime(["2021-01-01", None], utc=True),
+            "merged": [True, False],
+        }
+    )
+
+    data = serialize_df(df)
+
+    assert data.startswith(b"\xff\xff\xff\xff")
+    pd.testing.assert_frame_equal(deserialize_df(data), df)
+
+
+def test_legacy_csv_values_are_still_read():
+    df = deserialize_df(b"id,login\n1,a\n2,b\n")
+
+    assert df["id"].tolist() == [1, 2]
+    assert df["login"].tolist() == ["a", "b"]
+
+
+def test_concat_keeps_type_of_column_missing_in_a_repo():
+    typed = pd.DataFrame({"id": [1], "closed": pd.to_datetime(["2022-01-01"], utc=True)})
+    # a column that's entirely missing decodes as object
+    untyped = deserialize_df(serialize_df(pd.DataFrame({"id": [2], "closed": [None]})))
+    assert untyped["closed"].dtype == object
+
+    df = concat_frames([typed, untyped])
+
+    assert df["closed"].dtype == typed["closed"].dtype
+    assert df["closed"].isna().tolist() == [False, True]
+    assert df.index.tolist() == [0, 1]
+
+
+def test_concat_unions_categories():
+    a = pd.DataFrame({"action": pd.Categorical(["open"])})
+    b = pd.DataFrame({"action": pd.Categorical(["close", "comment"])})
+
+    df = concat_frames([a, b])
+
+    assert isinstance(df["action"].dtype, pd.CategoricalDtype)
+    assert set(df["action"].cat.categories) == {"open", "close", "comment"}
+    assert df["action"].tolist() == ["open", "close", "comment"]
+
+
+def test_concat_leaves_out_empty_frames():
+    a = pd.DataFrame({"n": pd.Series([], dtype=object)})
+    b = pd.DataFrame({"n": [1, 2]})
+
+    assert concat_frames([a, b])["n"].dtype == "int64"
+    assert concat_frames([]).empty